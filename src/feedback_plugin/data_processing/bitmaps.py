@@ -0,0 +1,138 @@
+from typing import Iterable, Iterator
+import struct
+
+
+class RoaringBitmap:
+    '''
+        A compressed set of non-negative 32 bit integers, such as server ids,
+        following the layout of Roaring bitmaps: ids are split in containers
+        by their 16 high bits, and each container holds the 16 low bits of
+        its ids.
+
+        In memory, containers are Python ints used as bitsets of 2 ** 16 bits,
+        so that unions, intersections and counts run over whole machine words.
+        When serialized, containers holding few ids are stored as sorted
+        arrays of their low bits and the others as plain bitsets, which keeps
+        each container at most 8 KiB and sparse ones much smaller.
+    '''
+    CONTAINER_BITS = 16
+    CONTAINER_SIZE = 1 << CONTAINER_BITS
+    ARRAY_MAX_SIZE = 4096
+    '''Containers with at most this many ids are serialized as arrays.'''
+
+    _ARRAY = 0
+    _BITSET = 1
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self.containers: dict[int, int] = {}
+        self.update(ids)
+
+    def update(self, ids: Iterable[int]):
+        chunks: dict[int, bytearray] = {}
+        for value in ids:
+            if not 0 <= value < 1 << 32:
+                raise ValueError(f'{value} can not be stored in a bitmap')
+            key = value >> self.CONTAINER_BITS
+            low = value & (self.CONTAINER_SIZE - 1)
+            if key not in chunks:
+                chunks[key] = bytearray(self.CONTAINER_SIZE // 8)
+            chunks[key][low >> 3] |= 1 << (low & 7)
+        for (key, chunk) in chunks.items():
+            self.containers[key] = (self.containers.get(key, 0)
+                                    | int.from_bytes(chunk, 'little'))
+
+    def __len__(self) -> int:
+        return sum(container.bit_count()
+                   for container in self.containers.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.containers)
+
+    def __iter__(self) -> Iterator[int]:
+        for key in sorted(self.containers):
+            base = key << self.CONTAINER_BITS
+            chunk = self.containers[key].to_bytes(self.CONTAINER_SIZE // 8,
+                                                  'little')
+            for (index, byte) in enumerate(chunk):
+                while byte:
+                    low_bit = byte & -byte
+                    yield base + (index << 3) + low_bit.bit_length() - 1
+                    byte ^= low_bit
+
+    def __contains__(self, value: int) -> bool:
+        container = self.containers.get(value >> self.CONTAINER_BITS, 0)
+        return bool(container >> (value & (self.CONTAINER_SIZE - 1)) & 1)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, RoaringBitmap):
+            return NotImplemented
+        return self.containers == other.containers
+
+    def __or__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        result = RoaringBitmap()
+        result.containers = dict(self.containers)
+        for (key, container) in other.containers.items():
+            result.containers[key] = result.containers.get(key, 0) | container
+        return result
+
+    def __and__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        result = RoaringBitmap()
+        for (key, container) in self.containers.items():
+            if key in other.containers:
+                intersection = container & other.containers[key]
+                if intersection:
+                    result.containers[key] = intersection
+        return result
+
+    def __repr__(self) -> str:
+        return f'RoaringBitmap({len(self)} ids)'
+
+    def to_bytes(self) -> bytes:
+        '''
+            Serializes the bitmap as the number of containers followed by the
+            containers in key order. Each container starts with its key, its
+            kind and its number of ids minus one.
+        '''
+        parts = [struct.pack('<I', len(self.containers))]
+        for key in sorted(self.containers):
+            container = self.containers[key]
+            count = container.bit_count()
+            if count <= self.ARRAY_MAX_SIZE:
+                lows = RoaringBitmap()
+                lows.containers[0] = container
+                parts.append(struct.pack('<HBH', key, self._ARRAY, count - 1))
+                parts.append(struct.pack(f'<{count}H', *lows))
+            else:
+                parts.append(struct.pack('<HBH', key, self._BITSET, count - 1))
+                parts.append(container.to_bytes(self.CONTAINER_SIZE // 8,
+                                                'little'))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'RoaringBitmap':
+        result = cls()
+        (container_count,) = struct.unpack_from('<I', data)
+        offset = 4
+        for _ in range(container_count):
+            (key, kind, count) = struct.unpack_from('<HBH', data, offset)
+            count += 1
+            offset += 5
+            if kind == cls._ARRAY:
+                chunk = bytearray(cls.CONTAINER_SIZE // 8)
+                for low in struct.unpack_from(f'<{count}H', data, offset):
+                    chunk[low >> 3] |= 1 << (low & 7)
+                container = int.from_bytes(chunk, 'little')
+                offset += 2 * count
+            else:
+                end = offset + cls.CONTAINER_SIZE // 8
+                container = int.from_bytes(data[offset:end], 'little')
+                offset = end
+            result.containers[key] = container
+        return result
+
+
+def union(bitmaps: Iterable[RoaringBitmap]) -> RoaringBitmap:
+    result = RoaringBitmap()
+    for bitmap in bitmaps:
+        result = result | bitmap
+    return result
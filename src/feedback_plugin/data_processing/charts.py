@@ -1,143 +1,287 @@
-from datetime import datetime
+from datetime import date, datetime, timezone
 from collections import defaultdict
+from typing import Callable, Iterable
+import gzip
+import json
 
-from django.db.models.functions import ExtractYear, ExtractMonth
-from django.db.models import Count
-from django.db.models.expressions import RawSQL
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Exists, OuterRef, Q
 from django.db import connection
 
-from feedback_plugin.models import Upload
-from .extractors import COLLECTED_FEATURES
+from feedback_plugin.models import (ChartMetadata, ChartPayload, ChartPoint,
+                                    ChartState, Feature, ServerBitmap,
+                                    ServerMonth, Upload, UploadSummary)
+from .bitmaps import RoaringBitmap, union
+from .distinct import DistinctCounter, load_counter
+from .etl import (ALL_SERVERS, FEATURE_BITMAP_KEY, SERVER_BITMAP_FACTS,
+                  SERVER_MONTH_FACTS, get_month, get_upsert_unique_fields)
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-def get_uploads(start_date: datetime, end_date: datetime, start_closed_interval: bool):
+
+ServersByMonth = dict[str, dict[date, list[int]]]
+'''The ids of the servers counted in each series of a chart, by month.'''
+
+
+# Charts count servers by month, from the ServerMonth rollup, with one entry
+# per server and month, or from UploadSummary, with the facts of each upload as
+# columns. The compute_* functions only count the uploads within the interval
+# they are given, (start_date, end_date], or [start_date, end_date] with
+# start_closed_interval: the months between its first and last months are
+# counted from the rollups, the first and last months from their uploads, see
+# get_boundary_uploads. The servers merged into ChartState are those of whole
+# months instead, or of the server-months with uploads after a given time, see
+# get_servers_by_month.
+def get_months(start_date: datetime, end_date: datetime) -> tuple[date, date]:
     '''
-        Return the uploads in the provided time interval, grouped by year and
-        month.
+        Returns the first and the last month of the interval, as the first
+        day of the month.
     '''
+    return (get_month(start_date), get_month(end_date))
 
-    uploads = Upload.objects.annotate(
-        year=ExtractYear('upload_time'),
-        month=ExtractMonth('upload_time'),
-    ).values(
-        'year',
-        'month',
+
+def add_months(month: date, count: int) -> date:
+    months = month.year * 12 + month.month - 1 + count
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def get_month_shards(start_date: datetime,
+                     end_date: datetime,
+                     shard_months: int) -> list[tuple[datetime, datetime]]:
+    '''
+        Splits the months of the interval in shards of at most shard_months
+        consecutive months. Each shard is returned as an interval whose first
+        and last months are the ones of the shard, so that the shards of a
+        chart can be queried independently and their months do not overlap.
+    '''
+    (first_month, last_month) = get_months(start_date, end_date)
+    shards = []
+    month = first_month
+    while month <= last_month:
+        end = min(add_months(month, shard_months - 1), last_month)
+        shards.append((datetime(month.year, month.month, 1,
+                                tzinfo=timezone.utc),
+                       datetime(end.year, end.month, 1, tzinfo=timezone.utc)))
+        month = add_months(end, 1)
+    return shards
+
+
+def get_server_months(start_date: datetime, end_date: datetime,
+                      since: datetime | None = None):
+    '''
+        Return the server-months in the provided time interval. With since,
+        only the server-months with uploads after since are returned.
+    '''
+    (first_month, last_month) = get_months(start_date, end_date)
+    server_months = ServerMonth.objects.filter(
+        month__gte=first_month,
+        month__lte=last_month,
     )
+    if since is None:
+        return server_months
+    return server_months.filter(Exists(Upload.objects.filter(
+        server_id=OuterRef('server_id'),
+        month=OuterRef('month'),
+        upload_time__gt=since,
+    )))
 
-    if start_closed_interval:
-        uploads = uploads.filter(upload_time__gte=start_date)
-    else:
-        uploads = uploads.filter(upload_time__gt=start_date)
 
-    return uploads.filter(
+def get_boundary_uploads(start_date: datetime,
+                         end_date: datetime,
+                         start_closed_interval: bool):
+    '''
+        Return the uploads of the first and the last month of the provided
+        time interval that are within the interval.
+    '''
+    (first_month, last_month) = get_months(start_date, end_date)
+    uploads = Upload.objects.filter(
+        month__in=[first_month, last_month],
         upload_time__lte=end_date,
     )
+    if start_closed_interval:
+        return uploads.filter(upload_time__gte=start_date)
+    return uploads.filter(upload_time__gt=start_date)
+
+
+def get_upload_summary_condition(start_date: datetime,
+                                 end_date: datetime,
+                                 start_closed_interval: bool
+) -> tuple[str, list]:
+    '''
+        Returns an SQL condition on the upload summaries `us` that keeps the
+        summaries of the uploads within the time interval, along with its
+        parameters.
+    '''
+    (first_month, last_month) = get_months(start_date, end_date)
+    (uploads_sql, uploads_params) = get_boundary_uploads(
+        start_date, end_date, start_closed_interval
+    ).values('id').query.sql_with_params()
+    sql = f"""(
+        us.month > %s AND us.month < %s OR
+        us.upload_id IN ({uploads_sql}))"""
+    return (sql, [connection.ops.adapt_datefield_value(first_month),
+                  connection.ops.adapt_datefield_value(last_month),
+                  *uploads_params])
 
 
 def compute_server_count_by_month(start_date: datetime,
                                   end_date: datetime,
                                   start_closed_interval: bool
 ) -> dict[str, list[str]]:
-    uploads = get_uploads(start_date, end_date, start_closed_interval)
-    server_counts = uploads.annotate(
-        count=Count('server__id', distinct=True),
-    ).order_by(
-        'year',
+    (first_month, last_month) = get_months(start_date, end_date)
+    server_counts = dict(get_server_months(start_date, end_date).filter(
+        month__gt=first_month,
+        month__lt=last_month,
+    ).values(
         'month',
-    )
+    ).annotate(
+        count=Count('server_id'),
+    ).order_by().values_list('month', 'count'))
+
+    server_counts.update(get_boundary_uploads(
+        start_date, end_date, start_closed_interval
+    ).values(
+        'month',
+    ).annotate(
+        count=Count('server_id', distinct=True),
+    ).order_by().values_list('month', 'count'))
 
+    months = sorted(server_counts)
     return {
         'count': {
-            'x': [f"{value['year']}-{value['month']:0>2}" for value in server_counts],
-            'y': [int(f"{value['count']}") for value in server_counts]
+            'x': [f"{month:%Y-%m}" for month in months],
+            'y': [int(server_counts[month]) for month in months]
         }
     }
 
 
-def compute_feature_count_by_month(start_date: datetime,
-                                   end_date: datetime,
-                                   start_closed_interval: bool,
-                                   feature: str,
+def count_features_by_month(start_date: datetime,
+                            end_date: datetime,
+                            start_closed_interval: bool,
+                            features: list[str],
 ) -> dict[str, dict[str, list[str] | list[int]]]:
-    uploads = get_uploads(start_date, end_date, start_closed_interval)
+    '''
+        Counts the servers using each of the features, by month, in a single
+        scan over the feature masks of the server-months in the interval, and
+        of the uploads within the interval for its first and last months.
+        Features missing from the Feature catalog, or without a bit, have no
+        counts.
+    '''
+    feature_bits = dict(Feature.objects.filter(
+        name__in=features, bit__isnull=False).values_list('name', 'bit'))
+    result = {feature: {'x': [], 'y': []} for feature in features}
+    features = [feature for feature in features if feature in feature_bits]
+    if not features:
+        return result
+
+    counts = ',\n        '.join(
+        'COUNT(CASE WHEN sm.feature_mask & %s THEN 1 END)'
+        for _ in features)
+    boundary_counts = ',\n        '.join(
+        'COUNT(DISTINCT CASE WHEN us.feature_mask & %s THEN us.server_id END)'
+        for _ in features)
+    (uploads_sql, uploads_params) = get_boundary_uploads(
+        start_date, end_date, start_closed_interval
+    ).values('id').query.sql_with_params()
 
-    feature_query = """
+    query = f"""
     SELECT
-        cuf.upload_id
+        sm.month,
+        {counts}
     FROM
-        feedback_plugin_computeduploadfact cuf
+        feedback_plugin_servermonth sm
     WHERE
-        cuf.key = 'features'
-        AND JSON_VALUE(cuf.value, CONCAT('$.', %s))
-    """
-    server_counts = uploads.filter(
-        id__in=RawSQL(feature_query, (feature,))
-    ).annotate(
-        count=Count('server__id', distinct=True)
-    ).order_by(
-        'year',
-        'month',
-    )
+        sm.feature_mask <> 0 AND
+        sm.month > %s AND
+        sm.month < %s
+    GROUP BY sm.month
+    UNION ALL
+    SELECT
+        us.month,
+        {boundary_counts}
+    FROM
+        feedback_plugin_uploadsummary us
+    WHERE
+        us.feature_mask <> 0 AND
+        us.upload_id IN ({uploads_sql})
+    GROUP BY us.month"""
 
-    return {
-        feature: {
-            'x': [f"{value['year']}-{value['month']:0>2}" for value in server_counts],
-            'y': [int(f"{value['count']}") for value in server_counts]
-        }
-    }
+    (first_month, last_month) = get_months(start_date, end_date)
+    masks = [1 << feature_bits[feature] for feature in features]
+    params = (masks
+              + [connection.ops.adapt_datefield_value(first_month),
+                 connection.ops.adapt_datefield_value(last_month)]
+              + masks
+              + list(uploads_params))
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        rows = sorted(cursor.fetchall(), key=lambda row: row[0])
+
+    for (month, *feature_counts) in rows:
+        for feature, count in zip(features, feature_counts):
+            # Months without servers using the feature are left out.
+            if count == 0:
+                continue
+            result[feature]['x'].append(f"{month:%Y-%m}")
+            result[feature]['y'].append(int(count))
+    return result
+
+
+def compute_feature_count_by_month(start_date: datetime,
+                                   end_date: datetime,
+                                   start_closed_interval: bool,
+                                   feature: str,
+) -> dict[str, dict[str, list[str] | list[int]]]:
+    return count_features_by_month(start_date, end_date,
+                                   start_closed_interval, [feature])
 
 
 def compute_feature_counts_by_month(start_date: datetime,
                                     end_date: datetime,
                                     start_closed_interval: bool,
 ) -> dict[str, dict[str, list[str] | list[int]]]:
-    result = {}
-    for feature in COLLECTED_FEATURES:
-        result.update(
-            compute_feature_count_by_month(
-                start_date,
-                end_date,
-                start_closed_interval,
-                feature,
-            )
-        )
-    return result
+    features = Feature.objects.filter(bit__isnull=False).order_by(
+        'name').values_list('name', flat=True)
+    counts = count_features_by_month(start_date, end_date,
+                                     start_closed_interval, list(features))
+    # Only features used in the interval get a series.
+    return {feature: series for feature, series in counts.items()
+            if series['x']}
 
 
 def compute_version_breakdown_by_month(start_date: datetime,
                                        end_date: datetime,
                                        start_closed_interval: bool
 ) -> dict[str, list[str]]:
-    start_date_string = start_date.strftime('%Y-%m-%d %H:%M:%S.%f')
-    end_date_string = end_date.strftime('%Y-%m-%d %H:%M:%S.%f')
+    (interval_sql, interval_params) = get_upload_summary_condition(
+        start_date, end_date, start_closed_interval)
 
     query = f"""
     SELECT
-        count(distinct u.server_id) as cnt,
-        EXTRACT(YEAR FROM u.upload_time) year,
-        EXTRACT(MONTH FROM u.upload_time) month,
-        cuf1.value as major,
-        cuf2.value as minor
+        count(distinct us.server_id) as cnt,
+        us.month,
+        us.version_major,
+        us.version_minor
     FROM
-        feedback_plugin_computeduploadfact cuf1 JOIN
-        feedback_plugin_computeduploadfact cuf2
-            ON cuf1.upload_id = cuf2.upload_id JOIN
-        feedback_plugin_upload u ON u.id = cuf1.upload_id
+        feedback_plugin_uploadsummary us
     WHERE
-        cuf1.`key` = 'server_version_major' AND
-        cuf2.`key` = 'server_version_minor' AND
-        u.upload_time
-            {'>=' if start_closed_interval else '>'} '{start_date_string}' AND
-        u.upload_time <= '{end_date_string}'
-    GROUP BY year, month, major, minor"""
+        us.version_major IS NOT NULL AND
+        us.version_minor IS NOT NULL AND
+        {interval_sql}
+    GROUP BY us.month, us.version_major, us.version_minor
+    ORDER BY us.month, us.version_major, us.version_minor"""
 
     cursor = connection.cursor()
-    cursor.execute(query)
+    cursor.execute(query, interval_params)
 
     result = defaultdict(lambda: {'x': [], 'y': []})
     for row in cursor.fetchall():
-        (count, year, month, major, minor) = row
-        result[f'{major}.{minor}']['x'].append(f'{year}-{month}')
+        (count, month, major, minor) = row
+        result[f'{major}.{minor}']['x'].append(f'{month.year}-{month.month}')
         result[f'{major}.{minor}']['y'].append(int(count))
 
     return result
@@ -147,35 +291,347 @@ def compute_architecture_breakdown_by_month(start_date: datetime,
                                             end_date: datetime,
                                             start_closed_interval: bool
 ) -> dict[str, list[str]]:
-    start_date_string = start_date.strftime('%Y-%m-%d %H:%M:%S.%f')
-    end_date_string = end_date.strftime('%Y-%m-%d %H:%M:%S.%f')
+    (interval_sql, interval_params) = get_upload_summary_condition(
+        start_date, end_date, start_closed_interval)
 
     query = f"""
     SELECT
-        count(distinct u.server_id) as cnt,
-        EXTRACT(YEAR FROM u.upload_time) year,
-        EXTRACT(MONTH FROM u.upload_time) month,
-        csf1.value as architecture
+        count(distinct us.server_id) as cnt,
+        us.month,
+        us.hardware_architecture as architecture
     FROM
-        feedback_plugin_upload u JOIN
-        feedback_plugin_server s
-            ON u.server_id = s.id JOIN
-        feedback_plugin_computedserverfact csf1
-            ON csf1.server_id = s.id
+        feedback_plugin_uploadsummary us
     WHERE
-        csf1.`key` = 'hardware_architecture' AND
-        u.upload_time
-            {'>=' if start_closed_interval else '>'} '{start_date_string}' AND
-        u.upload_time <= '{end_date_string}'
-    GROUP BY year, month, architecture"""
+        us.hardware_architecture <> '' AND
+        {interval_sql}
+    GROUP BY us.month, architecture
+    ORDER BY us.month, architecture"""
 
     cursor = connection.cursor()
-    cursor.execute(query)
+    cursor.execute(query, interval_params)
 
     result = defaultdict(lambda: {'x': [], 'y': []})
     for row in cursor.fetchall():
-        (count, year, month, architecture) = row
-        result[f'{architecture}']['x'].append(f'{year}-{month}')
+        (count, month, architecture) = row
+        result[f'{architecture}']['x'].append(f'{month.year}-{month.month}')
         result[f'{architecture}']['y'].append(int(count))
 
     return result
+
+
+# The functions below return the servers counted by the charts above instead
+# of their counts, to be merged into the ChartState of a chart. With since,
+# only the servers of the months in which they uploaded data after since are
+# returned, the ones of earlier uploads are in the stored states already.
+def get_servers_by_month(start_date: datetime,
+                         end_date: datetime,
+                         since: datetime | None = None) -> ServersByMonth:
+    result = defaultdict(list)
+    server_months = get_server_months(start_date, end_date,
+                                      since).values_list('month', 'server_id')
+    for (month, server_id) in server_months.iterator():
+        result[month].append(server_id)
+    return {'count': result}
+
+
+def get_feature_servers_by_month(start_date: datetime,
+                                 end_date: datetime,
+                                 since: datetime | None = None
+) -> ServersByMonth:
+    feature_bits = dict(Feature.objects.filter(
+        bit__isnull=False).values_list('name', 'bit'))
+    result = defaultdict(lambda: defaultdict(list))
+    server_months = get_server_months(start_date, end_date, since).exclude(
+        feature_mask=0).values_list('month', 'server_id', 'feature_mask')
+    for (month, server_id, mask) in server_months.iterator():
+        for (feature, bit) in feature_bits.items():
+            if mask & (1 << bit):
+                result[feature][month].append(server_id)
+    return result
+
+
+def get_upload_summaries(start_date: datetime, end_date: datetime,
+                         since: datetime | None = None):
+    '''
+        Return the upload summaries of the months of the provided time
+        interval. With since, only the summaries of the uploads after since
+        are returned.
+    '''
+    (first_month, last_month) = get_months(start_date, end_date)
+    summaries = UploadSummary.objects.filter(
+        month__gte=first_month,
+        month__lte=last_month,
+    )
+    if since is None:
+        return summaries
+    return summaries.filter(upload__upload_time__gt=since)
+
+
+def get_version_servers_by_month(start_date: datetime,
+                                 end_date: datetime,
+                                 since: datetime | None = None
+) -> ServersByMonth:
+    result = defaultdict(lambda: defaultdict(list))
+    summaries = get_upload_summaries(start_date, end_date, since).filter(
+        version_major__isnull=False,
+        version_minor__isnull=False,
+    ).values_list('version_major', 'version_minor', 'month',
+                  'server_id').distinct()
+    for (major, minor, month, server_id) in summaries.iterator():
+        result[f'{major}.{minor}'][month].append(server_id)
+    return result
+
+
+def get_architecture_servers_by_month(start_date: datetime,
+                                      end_date: datetime,
+                                      since: datetime | None = None
+) -> ServersByMonth:
+    result = defaultdict(lambda: defaultdict(list))
+    summaries = get_upload_summaries(start_date, end_date, since).exclude(
+        hardware_architecture='',
+    ).values_list('hardware_architecture', 'month', 'server_id').distinct()
+    for (architecture, month, server_id) in summaries.iterator():
+        result[architecture][month].append(server_id)
+    return result
+
+
+def merge_servers_by_month(parts: Iterable[ServersByMonth]) -> ServersByMonth:
+    '''
+        Merges the servers returned for the shards of a chart. Shards do not
+        share months, but servers found twice would only be counted once by
+        the chart states anyway.
+    '''
+    result = defaultdict(lambda: defaultdict(list))
+    for part in parts:
+        for (series, months) in part.items():
+            for (month, server_ids) in months.items():
+                result[series][month].extend(server_ids)
+    return result
+
+
+def update_chart_states(chart_id: str,
+                        servers: ServersByMonth,
+                        create_counter: Callable[[], DistinctCounter]
+) -> dict[str, dict[date, int]]:
+    '''
+        Merges the servers into the stored states of the chart's series and
+        months and returns the resulting counts for these series and months.
+        Raises distinct.IncompatibleCounters if the stored states are of a
+        different kind than the ones returned by create_counter.
+    '''
+    months = {month for series in servers.values() for month in series}
+    stored = {}
+    if months:
+        states = ChartState.objects.filter(
+            chart_id=chart_id,
+            series__in=list(servers),
+            month__gte=min(months),
+            month__lte=max(months),
+        ).values_list('series', 'month', 'state')
+        for (series, month, state) in states.iterator():
+            stored[(series, month)] = load_counter(bytes(state))
+
+    counts = defaultdict(dict)
+    states = []
+    for (series, series_months) in servers.items():
+        for (month, server_ids) in series_months.items():
+            counter = create_counter()
+            counter.add(server_ids)
+            if (series, month) in stored:
+                counter.merge(stored[(series, month)])
+            counts[series][month] = counter.count()
+            states.append(ChartState(chart_id=chart_id, series=series,
+                                     month=month, state=counter.to_bytes()))
+
+    ChartState.objects.bulk_create(
+        states,
+        batch_size=1000,
+        update_conflicts=True,
+        update_fields=['state'],
+        unique_fields=get_upsert_unique_fields(['chart_id', 'series',
+                                                'month']))
+    return counts
+
+
+def update_chart_points(chart_id: str,
+                        counts: dict[str, dict[date, int]],
+                        format_month: Callable[[date], str],
+                        replace_from: date | None = None) -> int:
+    '''
+        Writes the counts as the points of the chart, skipping the points
+        whose value did not change. With replace_from, the points of the
+        months from replace_from on that are not part of counts are deleted.
+        Returns the number of points written.
+    '''
+    months = {month for series in counts.values() for month in series}
+    if replace_from is not None:
+        months.add(replace_from)
+    stored = {}
+    if months:
+        points = ChartPoint.objects.filter(
+            chart_id=chart_id,
+            month__gte=min(months),
+        ).values_list('id', 'series', 'month', 'y')
+        for (point_id, series, month, y) in points.iterator():
+            stored[(series, month)] = (point_id, y)
+
+    if replace_from is not None:
+        ChartPoint.objects.filter(id__in=[
+            point_id for ((series, month), (point_id, _)) in stored.items()
+            if month >= replace_from and month not in counts.get(series, {})
+        ]).delete()
+
+    points = [ChartPoint(chart_id=chart_id, series=series, month=month,
+                         x=format_month(month), y=count)
+              for (series, series_counts) in counts.items()
+              for (month, count) in series_counts.items()
+              if stored.get((series, month), (None, None))[1] != count]
+    ChartPoint.objects.bulk_create(
+        points,
+        batch_size=1000,
+        update_conflicts=True,
+        update_fields=['x', 'y'],
+        unique_fields=get_upsert_unique_fields(['chart_id', 'series',
+                                                'month']))
+    return len(points)
+
+
+def render_chart(metadata: ChartMetadata) -> bytes:
+    '''
+        Returns the JSON served by the REST API for the chart of metadata.
+    '''
+    chart = metadata.chart
+    return json.dumps({
+        'title': chart.title,
+        'values': chart.values,
+        'metadata': {
+            'computed_start_date': metadata.computed_start_date,
+            'computed_end_date': metadata.computed_end_date,
+        }
+    }, cls=DjangoJSONEncoder).encode()
+
+
+def compress_payloads(content: bytes) -> dict[str, bytes]:
+    '''
+        Returns the content in each content encoding the REST API serves,
+        brotli only when the brotli module is installed.
+    '''
+    payloads = {
+        'identity': content,
+        'gzip': gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        payloads['br'] = brotli.compress(content)
+    return payloads
+
+
+def update_chart_payloads(metadata: ChartMetadata) -> dict[str, bytes]:
+    '''
+        Renders the chart of metadata and stores its response body in every
+        content encoding as ChartPayload entries, replacing the previous ones.
+        Returns the payloads by encoding.
+    '''
+    payloads = compress_payloads(render_chart(metadata))
+    ChartPayload.objects.filter(chart_id=metadata.chart_id).exclude(
+        encoding__in=payloads).delete()
+    ChartPayload.objects.bulk_create(
+        [ChartPayload(chart_id=metadata.chart_id, encoding=encoding,
+                      content=content)
+         for (encoding, content) in payloads.items()],
+        update_conflicts=True,
+        update_fields=['content'],
+        unique_fields=get_upsert_unique_fields(['chart_id', 'encoding']))
+    return payloads
+
+
+CUBE_DIMENSIONS = frozenset(SERVER_BITMAP_FACTS | SERVER_MONTH_FACTS
+                            | {FEATURE_BITMAP_KEY})
+'''The fact keys that servers can be grouped and filtered by in the cube.'''
+
+
+def load_server_bitmaps(first_month: date | None,
+                        last_month: date | None,
+                        keys: Iterable[str],
+                        filters: dict[str, list[str]],
+) -> dict[date, dict[str, dict[str, RoaringBitmap]]]:
+    '''
+        Returns the ServerBitmap entries of the months in [first_month,
+        last_month], by month, key and value, for all values of the keys and
+        the given values of the filters. Months are not limited when None.
+    '''
+    query = Q(key=ALL_SERVERS[0], value=ALL_SERVERS[1])
+    for key in keys:
+        query |= Q(key=key)
+    for (key, values) in filters.items():
+        query |= Q(key=key, value__in=values)
+    entries = ServerBitmap.objects.filter(query)
+    if first_month is not None:
+        entries = entries.filter(month__gte=first_month)
+    if last_month is not None:
+        entries = entries.filter(month__lte=last_month)
+
+    result = defaultdict(lambda: defaultdict(dict))
+    for (month, key, value, bitmap) in entries.values_list(
+            'month', 'key', 'value', 'bitmap').iterator():
+        result[month][key][value] = RoaringBitmap.from_bytes(bytes(bitmap))
+    return result
+
+
+def query_server_cube(first_month: date | None,
+                      last_month: date | None,
+                      group_by: list[str],
+                      filters: dict[str, list[str]],
+) -> list[tuple[date, tuple[str, ...], int]]:
+    '''
+        Counts exactly the servers of each month that match all filters,
+        grouped by the values of the group_by keys, from the ServerBitmap
+        index. Each filter maps a fact key to the values accepted for it,
+        e.g. {'hardware_architecture': ['x86_64'], 'server_version': ['10.6',
+        '10.11']} only counts the x86_64 servers running either version.
+
+        Returns (month, group values, count) tuples, ordered by month and
+        values. Groups without servers are left out. A server is counted in
+        every group it belongs to, e.g. in the group of each feature it uses.
+    '''
+    bitmaps = load_server_bitmaps(first_month, last_month, group_by, filters)
+
+    result = []
+    for month in sorted(bitmaps):
+        month_bitmaps = bitmaps[month]
+        servers = union(month_bitmaps[ALL_SERVERS[0]].values())
+        # The servers matching a filter are the union of the servers of its
+        # values.
+        for (key, values) in filters.items():
+            servers = servers & union(month_bitmaps[key].get(value,
+                                                             RoaringBitmap())
+                                      for value in values)
+
+        def split(servers: RoaringBitmap, keys: list[str],
+                  values: tuple[str, ...]):
+            if not servers:
+                return
+            if not keys:
+                result.append((month, values, len(servers)))
+                return
+            for (value, bitmap) in sorted(month_bitmaps[keys[0]].items()):
+                if keys[0] in filters and value not in filters[keys[0]]:
+                    continue
+                split(servers & bitmap, keys[1:], values + (value,))
+
+        split(servers, group_by, ())
+    return result
+
+
+def count_servers_by_month(start_date: datetime,
+                           end_date: datetime,
+                           dimensions: dict[str, list[str]],
+) -> dict[date, int]:
+    '''
+        Counts exactly the servers matching all dimensions, by month, from the
+        ServerBitmap index. See query_server_cube for the dimensions.
+        Without dimensions, all servers are counted. Months without matching
+        servers are left out.
+    '''
+    (first_month, last_month) = get_months(start_date, end_date)
+    return {month: count for (month, _, count) in query_server_cube(
+        first_month, last_month, [], dimensions)}
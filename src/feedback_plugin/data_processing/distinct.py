@@ -0,0 +1,187 @@
+from abc import ABC, abstractmethod
+from array import array
+from hashlib import blake2b
+from typing import Iterable
+import math
+import zlib
+
+
+class IncompatibleCounters(ValueError):
+    pass
+
+
+class DistinctCounter(ABC):
+    '''
+        Counts the distinct server ids added to it. Counters can be merged,
+        the merged counter counts the ids added to either of them once, so
+        the counts of a month can be updated with the servers of new uploads
+        without going through the older ones again.
+    '''
+    KIND = b''
+
+    @abstractmethod
+    def add(self, server_ids: Iterable[int]):
+        pass
+
+    @abstractmethod
+    def merge(self, other: 'DistinctCounter'):
+        '''Adds the ids counted by other to this counter.'''
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abstractmethod
+    def _to_bytes(self) -> bytes:
+        pass
+
+    def to_bytes(self) -> bytes:
+        return self.KIND + zlib.compress(self._to_bytes())
+
+    def check_compatible(self, other: 'DistinctCounter'):
+        if type(other) is not type(self):
+            raise IncompatibleCounters(
+                f'Can not merge {type(other).__name__} into '
+                f'{type(self).__name__}')
+
+
+class ExactCounter(DistinctCounter):
+    '''Counts distinct ids exactly, by keeping all of them.'''
+    KIND = b'E'
+
+    def __init__(self, server_ids: Iterable[int] = ()):
+        self.server_ids = set(server_ids)
+
+    def add(self, server_ids: Iterable[int]):
+        self.server_ids.update(server_ids)
+
+    def merge(self, other: DistinctCounter):
+        self.check_compatible(other)
+        self.server_ids |= other.server_ids
+
+    def count(self) -> int:
+        return len(self.server_ids)
+
+    def _to_bytes(self) -> bytes:
+        # Sorted ids are stored as the differences between consecutive ids,
+        # which are small and compress well.
+        deltas = array('q')
+        previous = 0
+        for server_id in sorted(self.server_ids):
+            deltas.append(server_id - previous)
+            previous = server_id
+        return deltas.tobytes()
+
+    @classmethod
+    def _from_bytes(cls, data: bytes) -> 'ExactCounter':
+        deltas = array('q')
+        deltas.frombytes(data)
+        server_ids = []
+        previous = 0
+        for delta in deltas:
+            previous += delta
+            server_ids.append(previous)
+        return cls(server_ids)
+
+
+class HyperLogLog(DistinctCounter):
+    '''
+        Estimates the number of distinct ids in a fixed amount of memory. The
+        relative standard error of the estimate is about 1.04 / sqrt(m), for
+        m = 2 ** precision registers of one byte each.
+    '''
+    KIND = b'H'
+    MIN_PRECISION = 4
+    MAX_PRECISION = 18
+    HASH_BITS = 64
+
+    def __init__(self, precision: int):
+        if not self.MIN_PRECISION <= precision <= self.MAX_PRECISION:
+            raise ValueError(f'Invalid HyperLogLog precision {precision}')
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @classmethod
+    def with_error(cls, error: float) -> 'HyperLogLog':
+        '''Returns a sketch whose standard error is at most error.'''
+        precision = math.ceil(math.log2((1.04 / error) ** 2))
+        return cls(min(max(precision, cls.MIN_PRECISION), cls.MAX_PRECISION))
+
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    @staticmethod
+    def hash(server_id: int) -> int:
+        # A hash that is the same in every process, unlike hash().
+        return int.from_bytes(
+            blake2b(server_id.to_bytes(8, 'little', signed=True),
+                    digest_size=8).digest(),
+            'little')
+
+    def add(self, server_ids: Iterable[int]):
+        registers = self.registers
+        index_shift = self.HASH_BITS - self.precision
+        rest_mask = (1 << index_shift) - 1
+        for server_id in server_ids:
+            value = self.hash(server_id)
+            index = value >> index_shift
+            # The position of the first set bit in the remaining bits.
+            rank = index_shift - (value & rest_mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other: DistinctCounter):
+        self.check_compatible(other)
+        if other.precision != self.precision:
+            raise IncompatibleCounters(
+                f'Can not merge a HyperLogLog of precision {other.precision} '
+                f'into one of precision {self.precision}')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -register
+                                       for register in self.registers)
+        zeros = self.registers.count(0)
+        # Small cardinalities are estimated from the number of empty
+        # registers, which is more accurate. 64 bit hashes need no correction
+        # for large cardinalities.
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def _to_bytes(self) -> bytes:
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def _from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        sketch = cls(data[0])
+        sketch.registers = bytearray(data[1:])
+        return sketch
+
+
+COUNTERS = {'exact': ExactCounter, 'hll': HyperLogLog}
+'''The kinds of distinct counters, by name.'''
+
+
+def create_counter(kind: str, error: float = 0.01) -> DistinctCounter:
+    '''
+        Returns an empty counter of the given kind. The error only applies to
+        approximate counters.
+    '''
+    if kind == 'hll':
+        return HyperLogLog.with_error(error)
+    return COUNTERS[kind]()
+
+
+def load_counter(data: bytes) -> DistinctCounter:
+    '''Returns the counter serialized as data by DistinctCounter.to_bytes.'''
+    for counter_class in COUNTERS.values():
+        if data[:1] == counter_class.KIND:
+            return counter_class._from_bytes(zlib.decompress(data[1:]))
+    raise ValueError(f'Unknown distinct counter kind {data[:1]!r}')
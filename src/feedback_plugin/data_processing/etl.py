@@ -1,21 +1,45 @@
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from io import StringIO
 import csv
 import logging
-from typing import Sequence
+import math
+import time
+from typing import Any, Iterable, Sequence
 
-from django.db.models import Q
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max, Min, Q, QuerySet
+from django.db.models.functions import Mod
+from django.db.models.lookups import Exact
 
 from feedback_plugin.models import (ComputedServerFact, ComputedUploadFact,
-                                    Data, RawData, Server, Upload)
-from .extractors import (DataExtractor, ServerFactExtractor, UploadFactExtractor,
-                         combine_server_facts, combine_upload_facts)
+                                    Data, FactExtractionRun, FactExtractorState,
+                                    Feature, LatestServerUpload, RawData,
+                                    Server, ServerBitmap, ServerMonth,
+                                    ServerMonthFact, StaleServerBitmapMonth,
+                                    Upload,
+                                    UploadFeatureMask, UploadSummary)
+from .bitmaps import RoaringBitmap
+from .extractors import (DataColumns, DataExtractor,
+                         ExtractorGraph, FactColumns, ServerFactExtractor,
+                         ServerFeatureExtractor, UploadFactExtractor,
+                         get_classification_cache_info,
+                         get_individual_extractors)
+from .pipeline import format_timings, run_pipeline
 
 
 logger = logging.getLogger('etl')
 
 
+# The unique_fields to pass to bulk_create(update_conflicts=True). MySQL and
+# MariaDB upsert on any unique key with ON DUPLICATE KEY UPDATE and do not
+# accept them, other backends need them as the conflict target.
+def get_upsert_unique_fields(unique_fields: list[str]) -> list[str] | None:
+    if connection.features.supports_update_conflicts_with_target:
+        return unique_fields
+    return None
+
+
 # Go through all RawData uploads between start_date and end_date and
 # create corresponding Server, Upload, Data entries.
 #
@@ -121,6 +145,8 @@ def process_from_date(start_date: datetime, end_date: datetime):
 
         raw_upload.delete()
 
+    update_latest_server_uploads(start_date, end_date)
+
 
 # Base function to go through all the raw uploaded data in batches.
 def process_raw_data():
@@ -147,9 +173,447 @@ def process_raw_data():
         process_from_date(local_start_date, local_end_date)
         start_date = local_end_date
 
+    update_server_months()
     logger.info('Finished processing data')
 
 
+# Builds a filter for `field` based on [start_date, end_date) date interval.
+# If end_inclusive is set to true makes the filter a closed interval on both
+# ends instead of just the start_date.
+def date_filter(field: str,
+                start_date: datetime,
+                end_date: datetime,
+                end_inclusive: bool) -> Q:
+    result = Q(**{f'{field}__gte': start_date})
+    if end_inclusive:
+        result &= Q(**{f'{field}__lte': end_date})
+    else:
+        result &= Q(**{f'{field}__lt': end_date})
+    return result
+
+
+# Splits the uploads matching upload_filter into consecutive ranges of field
+# values that hold about the same number of uploads, so that jobs processing
+# one range each take a similar amount of time. Ranges hold at most
+# max_partition_size uploads, but are made smaller if that is needed to have
+# at least min_partitions of them.
+#
+# Returns the value of field for the first upload of every range except the
+# first one. Uploads with the same value are always part of the same range.
+def get_partition_boundaries(upload_filter: Q,
+                             field: str,
+                             max_partition_size: int,
+                             min_partitions: int = 1) -> list:
+    uploads = Upload.objects.filter(upload_filter)
+    partition_size = max(1, min(max_partition_size,
+                                math.ceil(uploads.count() / min_partitions)))
+
+    boundaries = []
+    count = 0
+    last_value = None
+    for value in uploads.order_by(field).values_list(field, flat=True).iterator():
+        if count >= partition_size and value != last_value:
+            boundaries.append(value)
+            count = 0
+        count += 1
+        last_value = value
+    return boundaries
+
+
+# Records the most recent upload of every server with an upload matching
+# upload_condition in LatestServerUpload. Entries are only replaced by newer
+# uploads, so calling this for overlapping or out of order intervals (possibly
+# from concurrent workers) is safe.
+# Uploads with the same upload_time are ordered by their id.
+def _update_latest_server_uploads(upload_condition: str, params: tuple):
+    query = f"""
+    INSERT INTO feedback_plugin_latestserverupload
+        (server_id, upload_id, upload_time)
+    SELECT
+        u.server_id,
+        MAX(u.id),
+        u.upload_time
+    FROM
+        feedback_plugin_upload u JOIN
+        (SELECT
+            server_id,
+            MAX(upload_time) as upload_time
+         FROM
+            feedback_plugin_upload
+         WHERE
+            {upload_condition}
+         GROUP BY server_id) latest
+            ON u.server_id = latest.server_id AND
+               u.upload_time = latest.upload_time
+    GROUP BY u.server_id, u.upload_time
+    ON DUPLICATE KEY UPDATE
+        feedback_plugin_latestserverupload.upload_id = IF(
+            (VALUES(upload_time), VALUES(upload_id)) >
+            (feedback_plugin_latestserverupload.upload_time,
+             feedback_plugin_latestserverupload.upload_id),
+            VALUES(upload_id),
+            feedback_plugin_latestserverupload.upload_id),
+        feedback_plugin_latestserverupload.upload_time = GREATEST(
+            feedback_plugin_latestserverupload.upload_time,
+            VALUES(upload_time))"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+
+
+# Records the latest upload of all servers that uploaded between start_date
+# and end_date. See _update_latest_server_uploads.
+def update_latest_server_uploads(start_date: datetime,
+                                 end_date: datetime,
+                                 end_inclusive: bool = True,
+                                 shard: tuple[int, int] | None = None):
+    condition, params = server_shard_condition(shard)
+    _update_latest_server_uploads(
+        f'upload_time >= %s AND upload_time {"<=" if end_inclusive else "<"} %s'
+        f'{condition}',
+        (connection.ops.adapt_datetimefield_value(start_date),
+         connection.ops.adapt_datetimefield_value(end_date)) + params)
+
+
+# Records the latest upload of all servers with uploads whose id is within
+# (first_upload_id, last_upload_id]. See _update_latest_server_uploads.
+def update_latest_server_uploads_by_id(first_upload_id: int,
+                                       last_upload_id: int,
+                                       shard: tuple[int, int] | None = None):
+    condition, params = server_shard_condition(shard)
+    _update_latest_server_uploads(f'id > %s AND id <= %s{condition}',
+                                  (first_upload_id, last_upload_id) + params)
+
+
+# The FactExtractorState entry holding the id of the last upload recorded in
+# ServerMonth.
+SERVER_MONTH_STATE = 'ServerMonth'
+
+# The upload facts recorded in ServerMonthFact, for charts to break the
+# servers of each month down by.
+SERVER_MONTH_FACTS = {'server_version'}
+
+# Uploads are recorded in ServerMonth this many at a time.
+SERVER_MONTH_BATCH_SIZE = 10000
+
+
+# Returns the first day of the (UTC) month of time.
+def get_month(time: datetime) -> date:
+    time = time.astimezone(timezone.utc)
+    return date(time.year, time.month, 1)
+
+
+# Records the months in which servers uploaded data in ServerMonth, for all
+# uploads added since the last call. Existing entries are left as they are, so
+# calling this again, or concurrently, is safe.
+def update_server_months(batch_size: int = SERVER_MONTH_BATCH_SIZE):
+    state, _ = FactExtractorState.objects.get_or_create(
+        extractor=SERVER_MONTH_STATE, defaults={'version': 1})
+    last_upload_id = Upload.objects.aggregate(id=Max('id'))['id'] or 0
+
+    first = state.last_upload_id
+    while first < last_upload_id:
+        last = min(first + batch_size, last_upload_id)
+        server_months = Upload.objects.filter(
+            id__gt=first, id__lte=last
+        ).values_list('month', 'server_id').distinct()
+
+        ServerMonth.objects.bulk_create(
+            [ServerMonth(month=month, server_id=server_id)
+             for (month, server_id) in server_months],
+            batch_size=1000,
+            ignore_conflicts=True)
+
+        state.last_upload_id = last
+        state.save(update_fields=['last_upload_id'])
+        first = last
+
+
+# Rebuilds the ServerMonthFact entries of the given keys for the server-months
+# of the uploads, from the upload facts of all uploads of these
+# server-months. Values no upload of a server-month has anymore, such as the
+# previous value of a fact that was extracted again, are removed. Only
+# SERVER_MONTH_FACTS are recorded.
+def refresh_server_month_facts(upload_ids: Iterable[int], keys: Iterable[str]):
+    keys = sorted(set(keys) & SERVER_MONTH_FACTS)
+    if not keys:
+        return
+    upload_ids = sorted(set(upload_ids))
+    for start in range(0, len(upload_ids), STORE_LOOKUP_BATCH_SIZE):
+        server_months = set(Upload.objects.filter(
+            id__in=upload_ids[start:start + STORE_LOOKUP_BATCH_SIZE]
+        ).values_list('server_id', 'month'))
+        server_ids = {server_id for (server_id, _) in server_months}
+        months = {month for (_, month) in server_months}
+
+        # All server-months of these servers and months are rebuilt, which
+        # keeps the queries simple and gives the same entries for the
+        # others.
+        facts = ComputedUploadFact.objects.filter(
+            key__in=keys,
+            upload__server_id__in=server_ids,
+            upload__month__in=months,
+        ).values_list('upload__month', 'upload__server_id', 'key',
+                      'value').distinct()
+        with transaction.atomic():
+            ServerMonthFact.objects.filter(server_id__in=server_ids,
+                                           month__in=months,
+                                           key__in=keys).delete()
+            ServerMonthFact.objects.bulk_create(
+                [ServerMonthFact(month=month, server_id=server_id, key=key,
+                                 value=value)
+                 for (month, server_id, key, value) in facts],
+                batch_size=1000,
+                ignore_conflicts=True)
+            invalidate_server_bitmaps(months)
+
+
+# Rebuilds the feature masks of the ServerMonth entries of the server-months
+# of the uploads from the masks of all uploads of these server-months.
+# Features no upload of a server-month uses anymore, such as after the
+# features of its uploads were extracted again, are removed.
+def refresh_server_month_feature_masks(upload_ids: Iterable[int]):
+    upload_ids = sorted(set(upload_ids))
+    for start in range(0, len(upload_ids), STORE_LOOKUP_BATCH_SIZE):
+        server_months = set(Upload.objects.filter(
+            id__in=upload_ids[start:start + STORE_LOOKUP_BATCH_SIZE]
+        ).values_list('server_id', 'month'))
+        server_ids = {server_id for (server_id, _) in server_months}
+        months = {month for (_, month) in server_months}
+
+        masks = defaultdict(int)
+        for (server_id, month, mask) in UploadFeatureMask.objects.filter(
+                upload__server_id__in=server_ids,
+                upload__month__in=months,
+        ).values_list('upload__server_id', 'upload__month', 'mask'):
+            masks[(server_id, month)] |= mask
+
+        ServerMonth.objects.bulk_create(
+            [ServerMonth(month=month, server_id=server_id,
+                         feature_mask=masks[(server_id, month)])
+             for (server_id, month) in server_months],
+            batch_size=1000,
+            update_conflicts=True,
+            update_fields=['feature_mask'],
+            unique_fields=get_upsert_unique_fields(['month', 'server_id']))
+        invalidate_server_bitmaps(months)
+
+
+# The FactExtractorState entry holding the id of the last upload whose month
+# was indexed in ServerBitmap.
+SERVER_BITMAP_STATE = 'ServerBitmap'
+
+# The server facts indexed in ServerBitmap, along with SERVER_MONTH_FACTS and
+# the features used by the servers, under FEATURE_BITMAP_KEY.
+SERVER_BITMAP_FACTS = {'country_code', 'distribution_family',
+                       'hardware_architecture', 'operating_system'}
+FEATURE_BITMAP_KEY = 'feature'
+
+# The (key, value) of the ServerBitmap entry holding all servers of a month.
+ALL_SERVERS = ('', '')
+
+
+# Records that the ServerBitmap entries of the months may be out of date, for
+# update_server_bitmaps to index these months again. To be called once the
+# facts the entries are built from changed.
+def invalidate_server_bitmaps(months: Iterable[date]):
+    StaleServerBitmapMonth.objects.bulk_create(
+        [StaleServerBitmapMonth(month=month) for month in set(months)])
+
+
+# Same as invalidate_server_bitmaps, for the months in which the servers
+# uploaded data.
+def invalidate_server_bitmaps_of_servers(server_ids: Iterable[int]):
+    server_ids = sorted(set(server_ids))
+    for start in range(0, len(server_ids), STORE_LOOKUP_BATCH_SIZE):
+        invalidate_server_bitmaps(ServerMonth.objects.filter(
+            server_id__in=server_ids[start:start + STORE_LOOKUP_BATCH_SIZE]
+        ).values_list('month', flat=True).distinct())
+
+
+# Returns the bitmaps of the servers that uploaded data in month, by
+# (fact key, fact value), built from the server-month rollups.
+def build_server_bitmaps(month: date) -> dict[tuple[str, str], RoaringBitmap]:
+    server_ids = defaultdict(list)
+    feature_bits = dict(Feature.objects.filter(
+        bit__isnull=False).values_list('name', 'bit'))
+    for (server_id, mask) in ServerMonth.objects.filter(
+            month=month).values_list('server_id', 'feature_mask').iterator():
+        server_ids[ALL_SERVERS].append(server_id)
+        for (feature, bit) in feature_bits.items():
+            if mask & (1 << bit):
+                server_ids[(FEATURE_BITMAP_KEY, feature)].append(server_id)
+
+    facts = ServerMonthFact.objects.filter(month=month).values_list(
+        'server_id', 'key', 'value')
+    for (server_id, key, value) in facts.iterator():
+        server_ids[(key, value)].append(server_id)
+
+    facts = ComputedServerFact.objects.filter(
+        key__in=SERVER_BITMAP_FACTS,
+        server__servermonth__month=month).values_list('server_id', 'key',
+                                                      'value')
+    for (server_id, key, value) in facts.iterator():
+        server_ids[(key, value)].append(server_id)
+
+    return {key_value: RoaringBitmap(ids)
+            for (key_value, ids) in server_ids.items()}
+
+
+# Indexes the servers that uploaded data in the given months in ServerBitmap,
+# replacing the entries of these months. Without months, the months of the
+# uploads added since the last call are indexed, along with the months
+# recorded by invalidate_server_bitmaps.
+#
+# Months are indexed from the server-month rollups and the server facts, so
+# this has to run once the facts of the new uploads were extracted.
+def update_server_bitmaps(months: Iterable[date] | None = None):
+    state, _ = FactExtractorState.objects.get_or_create(
+        extractor=SERVER_BITMAP_STATE, defaults={'version': 1})
+    last_upload_id = Upload.objects.aggregate(id=Max('id'))['id'] or 0
+    # Months invalidated while indexing are recorded after this id, they are
+    # kept for the next call.
+    last_stale_id = StaleServerBitmapMonth.objects.aggregate(
+        id=Max('id'))['id'] or 0
+
+    if months is None:
+        months = set(Upload.objects.filter(
+            id__gt=state.last_upload_id, id__lte=last_upload_id
+        ).values_list('month', flat=True).distinct())
+        months.update(StaleServerBitmapMonth.objects.filter(
+            id__lte=last_stale_id).values_list('month', flat=True))
+    months = sorted(set(months))
+
+    for month in months:
+        bitmaps = build_server_bitmaps(month)
+        with transaction.atomic():
+            ServerBitmap.objects.filter(month=month).delete()
+            ServerBitmap.objects.bulk_create(
+                [ServerBitmap(month=month, key=key, value=value,
+                              bitmap=bitmap.to_bytes())
+                 for ((key, value), bitmap) in bitmaps.items()],
+                batch_size=100)
+        logger.debug(f'Indexed {len(bitmaps)} fact values of {month:%Y-%m}')
+
+    StaleServerBitmapMonth.objects.filter(id__lte=last_stale_id,
+                                          month__in=months).delete()
+    state.last_upload_id = last_upload_id
+    state.save(update_fields=['last_upload_id'])
+
+
+# Servers are split in shards by the remainder of their id. A shard is given
+# as a (shard_index, shard_count) tuple and holds the servers for which
+# server_id % shard_count == shard_index. Each server belongs to exactly one
+# shard, so jobs that process different shards never write the facts of the
+# same server.
+#
+# Returns the filter for a server id field to be within shard. A shard of None
+# matches all servers.
+def server_shard_filter(field: str, shard: tuple[int, int] | None) -> Q:
+    if shard is None:
+        return Q()
+    (shard_index, shard_count) = shard
+    return Q(Exact(Mod(field, shard_count), shard_index))
+
+
+# Same as server_shard_filter, for raw SQL conditions on a server_id column.
+def server_shard_condition(shard: tuple[int, int] | None) -> tuple[str, tuple]:
+    if shard is None:
+        return '', ()
+    (shard_index, shard_count) = shard
+    return ' AND MOD(server_id, %s) = %s', (shard_count, shard_index)
+
+
+# Returns the Data keys required by the data extractors passed in as a filter.
+def get_key_filter(data_extractors: Sequence[DataExtractor]) -> Q:
+    keys = set()
+    prefixes = set()
+    for extractor in data_extractors:
+        keys |= extractor.get_required_keys()
+        prefixes |= extractor.get_required_key_prefixes()
+    key_filter = Q()
+    for key in keys:
+        key_filter |= Q(key__iexact=key)
+    for prefix in prefixes:
+        key_filter |= Q(key__istartswith=prefix)
+    return key_filter
+
+
+# Returns the Data entries matching data_filter that are required by the
+# data extractors passed in, as columns.
+def get_data_columns_for_data_extractors(
+        data_filter: Q,
+        data_extractors: Sequence[DataExtractor]) -> DataColumns:
+    columns = DataColumns.empty()
+
+    key_filter = get_key_filter(data_extractors)
+    if not key_filter:
+        return columns  # Extractors only require computed facts.
+
+    data_to_process = Data.objects.filter(
+        data_filter & key_filter
+    ).order_by('upload_id', 'id').values_list('upload__server_id',
+                                              'upload_id', 'key', 'value')
+
+    for (server_id, upload_id, key, value) in data_to_process:
+        columns.server_ids.append(server_id)
+        columns.upload_ids.append(upload_id)
+        columns.keys.append(key.lower())
+        columns.values.append(value)
+
+    return columns
+
+
+# Returns the Data entries matching data_filter that are required by the
+# data extractors passed in, arranged by server and upload.
+def get_data_for_data_extractors(data_filter: Q,
+                                 data_extractors: Sequence[DataExtractor]
+) -> dict[int, dict[int, dict[str, list[str]]]]:
+    return get_data_columns_for_data_extractors(
+        data_filter, data_extractors).to_data_dict()
+
+
+# Adds the upload facts that the data extractors require, but do not compute
+# themselves, for the uploads matching data_filter.
+def add_stored_upload_facts(columns: DataColumns,
+                            data_filter: Q,
+                            data_extractors: Sequence[DataExtractor]):
+    keys = ExtractorGraph(data_extractors).get_external_facts()
+    if not keys:
+        return
+
+    facts = ComputedUploadFact.objects.filter(
+        data_filter & Q(key__in=keys)
+    ).values_list('upload__server_id', 'upload_id', 'key', 'value')
+
+    for (server_id, upload_id, key, value) in facts:
+        columns.server_ids.append(server_id)
+        columns.upload_ids.append(upload_id)
+        columns.keys.append(key)
+        columns.values.append(value)
+
+
+# Adds the server facts that the data extractors require, but do not compute
+# themselves, to the latest upload of the servers matching
+# latest_upload_filter.
+def add_stored_server_facts(servers: dict[int, dict[int, dict[str, list[str]]]],
+                            latest_upload_filter: Q,
+                            data_extractors: Sequence[DataExtractor]):
+    keys = ExtractorGraph(data_extractors).get_external_facts()
+    if not keys:
+        return
+
+    facts = ComputedServerFact.objects.filter(
+        server__latestserverupload__in=LatestServerUpload.objects.filter(
+            latest_upload_filter),
+        key__in=keys
+    ).values_list('server_id', 'server__latestserverupload__upload_id',
+                  'key', 'value')
+
+    for (server_id, upload_id, key, value) in facts:
+        servers[server_id][upload_id][key] = [value]
+
+
 # Filters Data entries based on [start_date, end_date) date interval and
 # returns only those entries that are required by the data extractors passed
 # in.
@@ -160,51 +624,159 @@ def get_upload_data_for_data_extractors(start_date: datetime,
                                         data_extractors: Sequence[DataExtractor],
                                         end_inclusive: bool
 ) -> dict[int, dict[int, dict[str, list[str]]]]:
-    keys = set()
-    for extractor in data_extractors:
-        keys |= extractor.get_required_keys()
-    key_filter = Q()
-    for key in keys:
-        key_filter |= Q(key__iexact=key)
+    return get_data_for_data_extractors(
+        date_filter('upload__upload_time', start_date, end_date, end_inclusive),
+        data_extractors)
 
-    date_filter = Q(upload__upload_time__gte=start_date)
-    if end_inclusive:
-        date_filter &= Q(upload__upload_time__lte=end_date)
+
+# Splits the rows of queryset in slices of slice_size consecutive values of
+# the integer field and returns a filter for each slice. The filters apply to
+# filter_field, which defaults to field.
+def get_slice_filters(queryset: QuerySet,
+                      field: str,
+                      slice_size: int,
+                      filter_field: str | None = None) -> list[Q]:
+    filter_field = filter_field or field
+    bounds = queryset.aggregate(first=Min(field), last=Max(field))
+    if bounds['first'] is None:
+        return []
+    return [Q(**{f'{filter_field}__gte': start,
+                 f'{filter_field}__lt': start + slice_size})
+            for start in range(bounds['first'], bounds['last'] + 1,
+                               slice_size)]
+
+
+# Creates the filter for an Upload id field to be within the
+# (first_upload_id, last_upload_id] interval.
+def upload_id_filter(field: str,
+                     first_upload_id: int,
+                     last_upload_id: int) -> Q:
+    return Q(**{f'{field}__gt': first_upload_id,
+                f'{field}__lte': last_upload_id})
+
+
+# Returns the data required by the data extractors for the latest upload of
+# each server, if that upload matches latest_upload_filter. This way the amount
+# of data read scales with the number of servers, not with the number of
+# uploads.
+def get_latest_upload_data_for_data_extractors(
+        latest_upload_filter: Q,
+        data_extractors: Sequence[DataExtractor]
+) -> dict[int, dict[int, dict[str, list[str]]]]:
+    latest_uploads = LatestServerUpload.objects.filter(
+        latest_upload_filter
+    ).values('upload_id')
+
+    return get_data_for_data_extractors(Q(upload_id__in=latest_uploads),
+                                        data_extractors)
+
+
+# Logs how effective the memoization of the extractors' classification
+# functions is. The caches live for the whole process, so the numbers
+# accumulate over all the slices a worker processed so far.
+def log_classification_cache_info():
+    for name, info in get_classification_cache_info().items():
+        lookups = info.hits + info.misses
+        if lookups == 0:
+            continue
+        logger.info(f'{name}: {info.hits} of {lookups} lookups were cache '
+                    f'hits ({100 * info.hits / lookups:.1f}%), '
+                    f'{info.currsize} cached entries')
+
+
+# Extracts and stores the facts of the servers whose LatestServerUpload entry
+# matches latest_upload_filter, using the data_extractors provided.
+#
+# If slice_size is set, the servers are processed in slices of slice_size
+# server ids, fetching the data of the next slices and storing the facts of
+# the previous slices while the current one is extracted. See run_pipeline.
+#
+# Returns the time spent fetching, extracting and storing.
+def _extract_server_facts(latest_upload_filter: Q,
+                          data_extractors: list[ServerFactExtractor],
+                          slice_size: int | None) -> dict[str, float]:
+    if slice_size is None:
+        slices = [latest_upload_filter]
     else:
-        date_filter &= Q(upload__upload_time__lt=end_date)
+        slices = [latest_upload_filter & slice_filter
+                  for slice_filter in get_slice_filters(
+                      LatestServerUpload.objects.filter(latest_upload_filter),
+                      'server_id', slice_size)]
 
-    # Extract server data about Architecture and OS
-    data_to_process = Data.objects.filter(
-        date_filter & key_filter
-    ).select_related('upload__server')
+    def fetch(slice_filter: Q):
+        servers = get_latest_upload_data_for_data_extractors(slice_filter,
+                                                             data_extractors)
+        add_stored_server_facts(servers, slice_filter, data_extractors)
+        return servers
 
-    servers = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    for data in data_to_process:
-        # In case there are multiple entries for the same server, use the
-        # latest one only
-        server_id = data.upload.server.id
-        upload_id = data.upload.id
-        # Appending to a list allows for multiple values for the same key.
-        servers[server_id][upload_id][data.key.lower()].append(data.value)
+    timings = run_pipeline(
+        slices, fetch,
+        lambda servers: compute_server_facts(servers, data_extractors),
+        store_server_facts,
+        threaded=slice_size is not None)
 
-    return servers
+    start = time.monotonic()
+    refresh_upload_summaries(Upload.objects.filter(
+        server_id__in=LatestServerUpload.objects.filter(
+            latest_upload_filter).values('server_id')))
+    timings['summaries'] = time.monotonic() - start
+    logger.info(f'Extracted server facts: {format_timings(timings)}')
+    return timings
 
 
 # Extract server facts for all data between start_date and end_date,
 # using the data_extractors provided.
 # If end_inclusive is set to True, the interval is closed, otherwise open.
+# If shard is set, only the servers of that shard are processed, see
+# server_shard_filter.
+# See _extract_server_facts for slice_size and the return value.
 def extract_server_facts(start_date: datetime,
                          end_date: datetime,
                          data_extractors: list[ServerFactExtractor],
-                         end_inclusive: bool = True):
-    logger.info(f'Extracting facts from {start_date} to {end_date}')
-    servers = get_upload_data_for_data_extractors(start_date, end_date,
-                                                  data_extractors,
-                                                  end_inclusive)
-    facts = combine_server_facts(
-        [extractor.extract_facts(servers) for extractor in data_extractors]
-    )
+                         end_inclusive: bool = True,
+                         shard: tuple[int, int] | None = None,
+                         slice_size: int | None = None) -> dict[str, float]:
+    logger.info(f'Extracting facts from {start_date} to {end_date}'
+                f'{f" for shard {shard}" if shard else ""}')
+    # Uploads might not have gone through process_raw_data, make sure the
+    # latest upload of each server is known.
+    update_latest_server_uploads(start_date, end_date, end_inclusive, shard)
+    return _extract_server_facts(
+        date_filter('upload_time', start_date, end_date, end_inclusive)
+        & server_shard_filter('server_id', shard),
+        data_extractors, slice_size)
+
 
+# Extract server facts for servers whose latest upload has an id within
+# (first_upload_id, last_upload_id], using the data_extractors provided.
+# If shard is set, only the servers of that shard are processed, see
+# server_shard_filter.
+# See _extract_server_facts for slice_size and the return value.
+def extract_server_facts_by_upload_id(first_upload_id: int,
+                                      last_upload_id: int,
+                                      data_extractors: list[ServerFactExtractor],
+                                      shard: tuple[int, int] | None = None,
+                                      slice_size: int | None = None
+) -> dict[str, float]:
+    logger.info(f'Extracting facts for uploads {first_upload_id} '
+                f'to {last_upload_id}'
+                f'{f" for shard {shard}" if shard else ""}')
+    update_latest_server_uploads_by_id(first_upload_id, last_upload_id, shard)
+    return _extract_server_facts(
+        upload_id_filter('upload_id', first_upload_id, last_upload_id)
+        & server_shard_filter('server_id', shard),
+        data_extractors, slice_size)
+
+
+def compute_server_facts(servers: dict[int, dict[int, dict[str, list[str]]]],
+                         data_extractors: list[ServerFactExtractor]
+) -> dict[int, dict[str, str]]:
+    facts = ExtractorGraph(data_extractors).extract_server_facts(servers)
+    log_classification_cache_info()
+    return facts
+
+
+def store_server_facts(facts: dict[int, dict[str, str]]):
     # Arrange all facts { 'key' : { server_id : value ... } }
     facts_by_key = defaultdict(dict)
     for server_id in facts:
@@ -240,10 +812,13 @@ def extract_server_facts(start_date: datetime,
         # that need to be created.
         facts_create = []
         facts_update = []
+        changed_server_ids = []
         for s_id in servers_with_computed_fact:
             fact_value = facts_by_key[key][s_id]
 
             if s_id in facts_in_db_by_s_id:
+                if facts_in_db_by_s_id[s_id].value != fact_value:
+                    changed_server_ids.append(s_id)
                 facts_in_db_by_s_id[s_id].value = fact_value
                 facts_update.append(facts_in_db_by_s_id[s_id])
             else:
@@ -256,54 +831,596 @@ def extract_server_facts(start_date: datetime,
         ComputedServerFact.objects.bulk_update(facts_update, ['value'],
                                                batch_size=1000)
 
+        # The servers are indexed in all the months they uploaded data,
+        # which a new fact or value changes.
+        if key in SERVER_BITMAP_FACTS:
+            invalidate_server_bitmaps_of_servers(
+                changed_server_ids + [fact.server_id for fact in facts_create])
 
-def check_if_upload_fact_exists(key: str,
-                                upload_id: int) -> ComputedUploadFact | None:
-    try:
-        return ComputedUploadFact.objects.get(key=key, upload_id=upload_id)
-    except ComputedUploadFact.DoesNotExist:
-        return None
+
+# Extracts and stores the facts of the uploads matching upload_filter, a
+# filter on Data, using the data_extractors provided. uploads must hold the
+# same uploads as upload_filter matches.
+#
+# If slice_size is set, the uploads are processed in slices of slice_size
+# upload ids, fetching the data of the next slices and storing the facts of
+# the previous slices while the current one is extracted. See run_pipeline.
+#
+# Returns the time spent fetching, extracting and storing.
+def _extract_upload_facts(upload_filter: Q,
+                          uploads: QuerySet,
+                          data_extractors: list[UploadFactExtractor],
+                          slice_size: int | None) -> dict[str, float]:
+    if slice_size is None:
+        slices = [upload_filter]
+    else:
+        slices = [upload_filter & slice_filter
+                  for slice_filter in get_slice_filters(uploads, 'id',
+                                                        slice_size,
+                                                        'upload_id')]
+
+    # The filter of each slice goes along with its data, the facts of the
+    # extractors are replaced for all uploads of the slice.
+    def fetch(slice_filter: Q):
+        columns = get_data_columns_for_data_extractors(slice_filter,
+                                                       data_extractors)
+        add_stored_upload_facts(columns, slice_filter, data_extractors)
+        return (slice_filter, columns)
+
+    def compute(fetched: tuple[Q, DataColumns]):
+        (slice_filter, columns) = fetched
+        return (slice_filter,
+                compute_upload_fact_columns(columns, data_extractors))
+
+    def store(computed: tuple[Q, FactColumns]):
+        (slice_filter, facts) = computed
+        store_upload_fact_columns(facts, slice_filter, data_extractors)
+
+    timings = run_pipeline(slices, fetch, compute, store,
+                           threaded=slice_size is not None)
+    logger.info(f'Extracted upload facts: {format_timings(timings)}')
+    return timings
+
+
+# Computes the facts of the data_extractors that support it inside the
+# database, using set-based INSERT ... SELECT statements. See
+# UploadFactExtractor.get_fact_queries. uploads_sql is a SELECT statement
+# returning the ids of the uploads to process, its parameters are in params.
+# Facts of these uploads that are already stored are replaced.
+#
+# Returns the extractors whose facts still have to be extracted in Python.
+def push_down_upload_facts(uploads_sql: str,
+                           params: dict[str, Any],
+                           data_extractors: Sequence[UploadFactExtractor]
+) -> list[UploadFactExtractor]:
+    remaining = []
+    for extractor in get_individual_extractors(data_extractors):
+        # Facts of other extractors might not be stored yet.
+        if extractor.get_required_facts():
+            remaining.append(extractor)
+            continue
+        queries = extractor.get_fact_queries()
+        if not queries:
+            remaining.append(extractor)
+            continue
+
+        for query in queries:
+            query_params = {**query.params, **params, 'fact_key': query.key}
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"""
+                DELETE FROM
+                    feedback_plugin_computeduploadfact
+                WHERE
+                    `key` = %(fact_key)s AND
+                    upload_id IN ({uploads_sql})""", query_params)
+                cursor.execute(f"""
+                INSERT INTO feedback_plugin_computeduploadfact
+                    (upload_id, `key`, value)
+                SELECT
+                    f.upload_id, %(fact_key)s, f.value
+                FROM
+                    ({query.sql.replace('{uploads}', uploads_sql)}) f""",
+                    query_params)
+
+        if 'features' in extractor.get_provided_facts():
+            push_down_upload_feature_masks(uploads_sql, params)
+    return remaining
+
+
+# Runs push_down_upload_facts if push_down is set, followed by
+# _extract_upload_facts for the remaining extractors.
+def _push_down_and_extract_upload_facts(
+        uploads_sql: str,
+        params: dict[str, Any],
+        upload_filter: Q,
+        uploads: QuerySet,
+        data_extractors: list[UploadFactExtractor],
+        slice_size: int | None,
+        push_down: bool) -> dict[str, float]:
+    timings = {}
+    if push_down:
+        start = time.monotonic()
+        data_extractors = push_down_upload_facts(uploads_sql, params,
+                                                 data_extractors)
+        timings['push down'] = time.monotonic() - start
+
+    if data_extractors:
+        timings.update(_extract_upload_facts(upload_filter, uploads,
+                                             data_extractors, slice_size))
+
+    start = time.monotonic()
+    refresh_upload_summaries(uploads)
+    timings['summaries'] = time.monotonic() - start
+    return timings
 
 
 # Create upload facts between [start_date, end_date) using the data_extractors
 # provided.
 # If end_inclusive is true, the interval is [start_date, end_date].
+# If push_down is set, facts are computed inside the database where possible,
+# see push_down_upload_facts.
+# See _extract_upload_facts for slice_size and the return value.
 def extract_upload_facts(start_date: datetime,
                          end_date: datetime,
                          data_extractors: list[UploadFactExtractor],
-                         end_inclusive: bool = True):
+                         end_inclusive: bool = True,
+                         slice_size: int | None = None,
+                         push_down: bool = False) -> dict[str, float]:
     logger.info(f'Extracting facts from {start_date} to {end_date}')
-    servers = get_upload_data_for_data_extractors(start_date, end_date,
-                                                  data_extractors,
-                                                  end_inclusive)
+    return _push_down_and_extract_upload_facts(
+        f"""SELECT id FROM feedback_plugin_upload
+            WHERE upload_time >= %(start_date)s AND
+                  upload_time {'<=' if end_inclusive else '<'} %(end_date)s""",
+        {'start_date': connection.ops.adapt_datetimefield_value(start_date),
+         'end_date': connection.ops.adapt_datetimefield_value(end_date)},
+        date_filter('upload__upload_time', start_date, end_date,
+                    end_inclusive),
+        Upload.objects.filter(
+            date_filter('upload_time', start_date, end_date, end_inclusive)),
+        data_extractors, slice_size, push_down)
+
 
-    facts = combine_upload_facts(
-        [extractor.extract_facts(servers) for extractor in data_extractors]
-    )
+# Create upload facts for uploads with an id within
+# (first_upload_id, last_upload_id] using the data_extractors provided.
+# If push_down is set, facts are computed inside the database where possible,
+# see push_down_upload_facts.
+# See _extract_upload_facts for slice_size and the return value.
+def extract_upload_facts_by_upload_id(first_upload_id: int,
+                                      last_upload_id: int,
+                                      data_extractors: list[UploadFactExtractor],
+                                      slice_size: int | None = None,
+                                      push_down: bool = False
+) -> dict[str, float]:
+    logger.info(f'Extracting facts for uploads {first_upload_id} '
+                f'to {last_upload_id}')
+    return _push_down_and_extract_upload_facts(
+        """SELECT id FROM feedback_plugin_upload
+           WHERE id > %(first_upload_id)s AND id <= %(last_upload_id)s""",
+        {'first_upload_id': first_upload_id,
+         'last_upload_id': last_upload_id},
+        upload_id_filter('upload_id', first_upload_id, last_upload_id),
+        Upload.objects.filter(
+            upload_id_filter('id', first_upload_id, last_upload_id)),
+        data_extractors, slice_size, push_down)
+
+
+def compute_upload_facts(servers: dict[int, dict[int, dict[str, list[str]]]],
+                         data_extractors: list[UploadFactExtractor]
+) -> dict[int, dict[int, dict[str, str]]]:
+    facts = ExtractorGraph(data_extractors).extract_upload_facts(servers)
+    log_classification_cache_info()
 
     logger.debug(f'Extracted facts for {len(facts)} servers')
+    return facts
+
+
+def compute_upload_fact_columns(columns: DataColumns,
+                                data_extractors: list[UploadFactExtractor]
+) -> FactColumns:
+    facts = ExtractorGraph(data_extractors).extract_upload_fact_columns(
+        columns)
+    log_classification_cache_info()
+
+    logger.debug(f'Extracted {len(facts.upload_ids)} facts')
+    return facts
+
+
+def store_upload_facts(facts: dict[int, dict[int, dict[str, str]]]):
+    store_upload_fact_columns(FactColumns.from_facts(facts))
+
+
+# Facts already in the database are looked up for this many uploads at once.
+STORE_LOOKUP_BATCH_SIZE = 1000
+
+
+# Stores the facts. With upload_filter, a filter on the upload of a
+# ComputedUploadFact, the facts the data_extractors provide are replaced for
+# all uploads it matches: the facts the extractors did not return again, such
+# as the ones a new version of an extractor no longer provides, are deleted.
+def store_upload_fact_columns(facts: FactColumns,
+                              upload_filter: Q | None = None,
+                              data_extractors: Sequence[DataExtractor] = ()):
+    values = {}
+    for (upload_id, key, value) in zip(*facts):
+        values[(upload_id, key)] = value
+
+    replaced_keys = set()
+    if upload_filter is not None:
+        for extractor in get_individual_extractors(data_extractors):
+            replaced_keys.update(extractor.get_provided_facts())
+
+    store_upload_feature_masks({upload_id: value
+                                for ((upload_id, key), value) in values.items()
+                                if key == 'features'},
+                               upload_filter if 'features' in replaced_keys
+                               else None)
+
+    upload_ids = set(facts.upload_ids)
+    with transaction.atomic():
+        if replaced_keys:
+            replaced = ComputedUploadFact.objects.filter(upload_filter,
+                                                         key__in=replaced_keys)
+            upload_ids.update(replaced.values_list('upload_id', flat=True))
+            replaced.delete()
+
+        # To avoid inserting for every individual fact and retrying with an
+        # update if the fact already exists, look up the facts already present
+        # for a batch of uploads at once and call update for those via
+        # bulk_update.
+        stored_upload_ids = sorted(set(facts.upload_ids))
+        keys = set(facts.keys) - replaced_keys
+        facts_update = []
+        for start in range(0, len(stored_upload_ids) if keys else 0,
+                           STORE_LOOKUP_BATCH_SIZE):
+            facts_already_in_db = ComputedUploadFact.objects.filter(
+                upload_id__in=stored_upload_ids[
+                    start:start + STORE_LOOKUP_BATCH_SIZE],
+                key__in=keys)
+            for up_fact in facts_already_in_db:
+                value = values.pop((up_fact.upload_id, up_fact.key), None)
+                if value is None:
+                    continue
+                up_fact.value = value
+                facts_update.append(up_fact)
+
+        facts_create = [ComputedUploadFact(key=key, value=value,
+                                           upload_id=upload_id)
+                        for ((upload_id, key), value) in values.items()]
+
+        logger.debug(f'Creating {len(facts_create)} new facts')
+        ComputedUploadFact.objects.bulk_create(facts_create, batch_size=1000)
+        logger.debug(f'Updating {len(facts_update)} already existing facts')
+        ComputedUploadFact.objects.bulk_update(facts_update, ['value'],
+                                               batch_size=1000)
+
+    refresh_server_month_facts(upload_ids, set(facts.keys) | replaced_keys)
+
+
+# The server facts copied to the columns of the same name of UploadSummary.
+UPLOAD_SUMMARY_SERVER_FACTS = {'country_code', 'distribution',
+                               'distribution_family', 'hardware_architecture',
+                               'operating_system'}
+
+# The upload facts copied to UploadSummary, by column. Their values are
+# numbers.
+UPLOAD_SUMMARY_UPLOAD_FACTS = {'version_major': 'server_version_major',
+                               'version_minor': 'server_version_minor',
+                               'version_point': 'server_version_point'}
+
+
+def _to_int(value: str | None) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Rebuilds the UploadSummary rows of the uploads from their facts, the facts
+# of their servers and their feature masks, batch_size uploads at a time.
+def refresh_upload_summaries(uploads: QuerySet,
+                             batch_size: int = STORE_LOOKUP_BATCH_SIZE):
+    rows = uploads.order_by('id').values_list('id', 'server_id', 'month')
+    batch = []
+    for row in rows.iterator():
+        batch.append(row)
+        if len(batch) == batch_size:
+            _store_upload_summaries(batch)
+            batch = []
+    if batch:
+        _store_upload_summaries(batch)
+
+
+def _store_upload_summaries(uploads: list[tuple[int, int, date]]):
+    upload_ids = [upload_id for (upload_id, _, _) in uploads]
+    server_ids = {server_id for (_, server_id, _) in uploads}
+
+    upload_facts = defaultdict(dict)
+    for (upload_id, key, value) in ComputedUploadFact.objects.filter(
+            upload_id__in=upload_ids,
+            key__in=UPLOAD_SUMMARY_UPLOAD_FACTS.values()
+    ).values_list('upload_id', 'key', 'value'):
+        upload_facts[upload_id][key] = value
+
+    server_facts = defaultdict(dict)
+    for (server_id, key, value) in ComputedServerFact.objects.filter(
+            server_id__in=server_ids,
+            key__in=UPLOAD_SUMMARY_SERVER_FACTS
+    ).values_list('server_id', 'key', 'value'):
+        server_facts[server_id][key] = value
+
+    masks = dict(UploadFeatureMask.objects.filter(
+        upload_id__in=upload_ids).values_list('upload_id', 'mask'))
+
+    summaries = []
+    for (upload_id, server_id, month) in uploads:
+        summary = UploadSummary(upload_id=upload_id, server_id=server_id,
+                                month=month,
+                                feature_mask=masks.get(upload_id, 0))
+        for key in UPLOAD_SUMMARY_SERVER_FACTS:
+            setattr(summary, key, server_facts[server_id].get(key, ''))
+        for (column, key) in UPLOAD_SUMMARY_UPLOAD_FACTS.items():
+            setattr(summary, column, _to_int(upload_facts[upload_id].get(key)))
+        summaries.append(summary)
+
+    UploadSummary.objects.bulk_create(
+        summaries,
+        batch_size=1000,
+        update_conflicts=True,
+        update_fields=['server_id', 'month', 'feature_mask',
+                       *sorted(UPLOAD_SUMMARY_SERVER_FACTS),
+                       *UPLOAD_SUMMARY_UPLOAD_FACTS],
+        unique_fields=get_upsert_unique_fields(['upload_id']))
+
+
+# The number of bits of UploadFeatureMask.mask that features can use. The
+# sign bit is left out, so that masks stay positive.
+MAX_FEATURE_BITS = 63
+
+
+# Returns the bit of each of the features in the Feature catalog. Features
+# that are not cataloged yet are added to it. Uploads with an id up to
+# backfill_upload_id were processed before these features were discovered,
+# see backfill_features.
+def get_feature_bits(features: Iterable[str],
+                     backfill_upload_id: int = 0) -> dict[str, int | None]:
+    bits = dict(Feature.objects.values_list('name', 'bit'))
+    for name in sorted(set(features) - bits.keys()):
+        bits[name] = add_feature(name, backfill_upload_id)
+    return bits
+
+
+# Adds a feature to the catalog, with the next free bit, and returns its bit.
+# The feature gets no bit if all bits are taken.
+def add_feature(name: str, backfill_upload_id: int) -> int | None:
+    # Jobs running in parallel may discover features at the same time, then
+    # either the feature or its bit already exist and adding it is retried.
+    while True:
+        try:
+            with transaction.atomic():
+                last_bit = Feature.objects.aggregate(bit=Max('bit'))['bit']
+                bit = 0 if last_bit is None else last_bit + 1
+                if bit >= MAX_FEATURE_BITS:
+                    logger.warning(f'No bit left for feature {name}, it is '
+                                   'not counted in charts')
+                    bit = None
+                Feature.objects.create(name=name, bit=bit,
+                                       backfill_upload_id=backfill_upload_id)
+                logger.info(f'Discovered feature {name}')
+                return bit
+        except IntegrityError:
+            feature = Feature.objects.filter(name=name).first()
+            if feature is not None:
+                return feature.bit
+
+
+def get_feature_mask(features_json: str,
+                     feature_bits: dict[str, int | None]) -> int:
+    mask = 0
+    for feature in ServerFeatureExtractor.json_to_features(features_json):
+        if feature_bits.get(feature) is not None:
+            mask |= 1 << feature_bits[feature]
+    return mask
+
+
+# Stores the "features" facts of uploads, given by upload id, in
+# UploadFeatureMask as well, adding the features they use to the catalog. With
+# upload_filter, a filter on the upload of an UploadFeatureMask, the masks of
+# all uploads it matches are replaced: the masks of those without a "features"
+# fact are deleted.
+def store_upload_feature_masks(features: dict[int, str],
+                               upload_filter: Q | None = None):
+    upload_ids = set(features)
+    used = set()
+    for value in features.values():
+        used.update(ServerFeatureExtractor.json_to_features(value))
+    feature_bits = (get_feature_bits(used, min(features) - 1) if features
+                    else {})
+
+    with transaction.atomic():
+        if upload_filter is not None:
+            replaced = UploadFeatureMask.objects.filter(upload_filter)
+            upload_ids.update(replaced.values_list('upload_id', flat=True))
+            replaced.delete()
+        UploadFeatureMask.objects.bulk_create(
+            [UploadFeatureMask(upload_id=upload_id,
+                               mask=get_feature_mask(value, feature_bits))
+             for (upload_id, value) in features.items()],
+            batch_size=1000,
+            update_conflicts=True,
+            update_fields=['mask'],
+            unique_fields=get_upsert_unique_fields(['upload_id']))
+
+    refresh_server_month_feature_masks(upload_ids)
+
+
+# Same as store_upload_feature_masks, for the "features" facts already stored
+# for the uploads returned by the uploads_sql statement, see
+# push_down_upload_facts. The masks of these uploads are replaced.
+def push_down_upload_feature_masks(uploads_sql: str, params: dict[str, Any]):
+    prefix = ServerFeatureExtractor.KEY_PREFIX
+    with connection.cursor() as cursor:
+        cursor.execute(uploads_sql, params)
+        upload_ids = [upload_id for (upload_id,) in cursor.fetchall()]
+        cursor.execute(f"""
+        SELECT
+            SUBSTRING(LOWER(d.`key`), {len(prefix) + 1}) feature,
+            MIN(d.upload_id)
+        FROM
+            feedback_plugin_data d
+        WHERE
+            d.`key` LIKE %(feature_pattern)s AND
+            CAST(d.value AS BINARY) <> '0' AND
+            d.upload_id IN ({uploads_sql})
+        GROUP BY feature""",
+            {**params,
+             'feature_pattern': ServerFeatureExtractor.KEY_LIKE_PATTERN})
+        used = dict(cursor.fetchall())
+    feature_bits = (get_feature_bits(used, min(used.values()) - 1) if used
+                    else {})
+
+    bit_params = {}
+    bits = []
+    for (index, feature) in enumerate(sorted(used)):
+        if feature_bits[feature] is None:
+            continue
+        bit_params[f'feature_path_{index}'] = f'$."{feature}"'
+        bits.append(f"(JSON_VALUE(cuf.value, %(feature_path_{index})s) = "
+                    f"'true') * {1 << feature_bits[feature]}")
+    mask_sql = ' +\n            '.join(bits) or '0'
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"""
+        DELETE FROM
+            feedback_plugin_uploadfeaturemask
+        WHERE
+            upload_id IN ({uploads_sql})""", params)
+        cursor.execute(f"""
+        INSERT INTO feedback_plugin_uploadfeaturemask
+            (upload_id, mask)
+        SELECT
+            cuf.upload_id,
+            {mask_sql}
+        FROM
+            feedback_plugin_computeduploadfact cuf
+        WHERE
+            cuf.`key` = 'features' AND
+            cuf.upload_id IN ({uploads_sql})""",
+            {**params, **bit_params})
+
+    refresh_server_month_feature_masks(upload_ids)
+
+
+# Extracts the "features" facts again for the uploads that were processed
+# before a feature was discovered and that report it, batch_size uploads at a
+# time, going back from the most recent ones. Only these uploads are
+# processed again. Progress is kept in Feature.backfill_upload_id, so an
+# interrupted backfill continues where it stopped.
+def backfill_features(batch_size: int = STORE_LOOKUP_BATCH_SIZE):
+    extractor = ServerFeatureExtractor()
+    while (feature := Feature.objects.filter(
+            backfill_upload_id__gt=0).order_by('id').first()) is not None:
+        upload_ids = list(Data.objects.filter(
+            key__iexact=ServerFeatureExtractor.KEY_PREFIX + feature.name,
+            upload_id__lte=feature.backfill_upload_id
+        ).order_by('-upload_id').values_list(
+            'upload_id', flat=True).distinct()[:batch_size])
+
+        if upload_ids:
+            columns = get_data_columns_for_data_extractors(
+                Q(upload_id__in=upload_ids), [extractor])
+            store_upload_fact_columns(
+                compute_upload_fact_columns(columns, [extractor]),
+                Q(upload_id__in=upload_ids), [extractor])
+            refresh_upload_summaries(Upload.objects.filter(id__in=upload_ids))
+        logger.debug(f'Backfilled feature {feature.name} for '
+                     f'{len(upload_ids)} uploads')
+
+        if len(upload_ids) < batch_size:
+            feature.backfill_upload_id = 0
+        else:
+            feature.backfill_upload_id = min(upload_ids) - 1
+        feature.save(update_fields=['backfill_upload_id'])
+
+
+def get_extractor_name(extractor: DataExtractor) -> str:
+    return type(extractor).__name__
+
+
+# Computes which uploads each of the data_extractors still needs to extract
+# facts from. Returns a list of (first_upload_id, last_upload_id, extractors)
+# entries, meaning that extractors need to process all uploads with an id
+# within (first_upload_id, last_upload_id]. Entries are ordered by upload ids
+# and do not overlap, so all extractors with pending uploads in a range are
+# run together.
+#
+# Extractors normally continue from their watermark. Extractors that never ran,
+# or whose version changed since they last ran, start over from the first
+# upload so that only their facts get recomputed.
+def get_pending_fact_extractions(data_extractors: Sequence[DataExtractor]
+) -> list[tuple[int, int, list[DataExtractor]]]:
+    last_upload_id = Upload.objects.aggregate(last=Max('id'))['last']
+    if last_upload_id is None:
+        return []
+
+    data_extractors = get_individual_extractors(data_extractors)
+    states = FactExtractorState.objects.in_bulk(
+        [get_extractor_name(extractor) for extractor in data_extractors])
+
+    watermarks = {}
+    for extractor in data_extractors:
+        state = states.get(get_extractor_name(extractor))
+        if state is None or state.version != extractor.version:
+            if state is not None:
+                logger.info(f'{get_extractor_name(extractor)} changed from '
+                            f'version {state.version} to {extractor.version}, '
+                            'recomputing all of its facts')
+            watermarks[extractor] = 0
+        else:
+            watermarks[extractor] = state.last_upload_id
+
+    # The facts derived from facts that are recomputed have to be recomputed
+    # as well. An extractor that is behind the extractors it requires facts
+    # from reads their stored facts instead, they are left as they are.
+    dependencies = ExtractorGraph(data_extractors).dependencies
+    changed = True
+    while changed:
+        changed = False
+        for extractor in data_extractors:
+            for dependency in dependencies[extractor]:
+                if watermarks[dependency] < watermarks[extractor]:
+                    watermarks[extractor] = watermarks[dependency]
+                    changed = True
+
+    # Uploads are split at each watermark, so that an extractor never runs
+    # separately from the extractors it requires facts from while those
+    # compute them.
+    boundaries = sorted({watermark for watermark in watermarks.values()
+                         if watermark < last_upload_id})
+    result = []
+    for (first, last) in zip(boundaries, boundaries[1:] + [last_upload_id]):
+        result.append((first, last, [extractor
+                                     for extractor in data_extractors
+                                     if watermarks[extractor] <= first]))
+    return result
+
 
-    facts_create = []
-    facts_update = []
-    for s_id in facts:
-        for upload_id in facts[s_id]:
-            for key in facts[s_id][upload_id]:
-                fact_value = facts[s_id][upload_id][key]
-
-                # TODO(cvicentiu) This is a rather slow check, it does one
-                # database lookup per upload_id. This should be optimized for
-                # faster processing.
-                up_fact = check_if_upload_fact_exists(key, upload_id)
-                if up_fact is None:
-                    up_fact = ComputedUploadFact(key=key, value=fact_value,
-                                                 upload_id=upload_id)
-                    facts_create.append(up_fact)
-                else:
-                    up_fact.value = fact_value
-                    facts_update.append(up_fact)
-
-    logger.debug(f'Creating {len(facts_create)} new facts')
-    ComputedUploadFact.objects.bulk_create(facts_create, batch_size=1000)
-    logger.debug(f'Updating {len(facts_update)} already existing facts')
-    ComputedUploadFact.objects.bulk_update(facts_update, ['value'],
-                                           batch_size=1000)
+# Records that data_extractors extracted the facts of all uploads with an id
+# within (first_upload_id, last_upload_id], moving their watermarks forward.
+def finish_fact_extraction(data_extractors: Sequence[DataExtractor],
+                           first_upload_id: int,
+                           last_upload_id: int,
+                           start_time: datetime):
+    with transaction.atomic():
+        for extractor in data_extractors:
+            name = get_extractor_name(extractor)
+            FactExtractorState.objects.update_or_create(
+                extractor=name,
+                defaults={
+                    'version': extractor.version,
+                    'last_upload_id': last_upload_id,
+                })
+            FactExtractionRun.objects.create(extractor=name,
+                                             version=extractor.version,
+                                             first_upload_id=first_upload_id,
+                                             last_upload_id=last_upload_id,
+                                             start_time=start_time)
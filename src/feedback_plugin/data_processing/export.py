@@ -0,0 +1,98 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+import tempfile
+
+
+SUFFIXES = {
+    'identity': '',
+    'gzip': '.gz',
+}
+'''
+    The suffix of the precompressed sibling of a file, for each encoding
+    exported. nginx only serves gzip siblings, with gzip_static.
+'''
+
+MANIFEST = 'manifest.json'
+
+
+def write_atomically(path: Path, content: bytes):
+    '''
+        Writes the content to path through a temporary file renamed over it,
+        so that readers see either the previous file or the whole new one.
+    '''
+    (fd, temp_path) = tempfile.mkstemp(dir=path.parent,
+                                       prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            temp.write(content)
+            temp.flush()
+            os.fsync(temp.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_payloads(path: Path, payloads: dict[str, bytes]):
+    # The compressed siblings are written first, so that the file is never
+    # newer than them.
+    for encoding in sorted(payloads, key=lambda encoding: encoding ==
+                           'identity'):
+        write_atomically(path.with_name(path.name + SUFFIXES[encoding]),
+                         payloads[encoding])
+
+
+def get_version(payloads: dict[str, bytes]) -> str:
+    return hashlib.sha256(payloads['identity']).hexdigest()[:16]
+
+
+def export_chart(root: Path, chart_id: str,
+                 payloads: dict[str, bytes]) -> str:
+    '''
+        Writes the payloads of a chart, by content encoding, as a file under
+        root that a web server can serve as it is, along with its
+        precompressed .gz sibling: <chart_id>/<version>.json, where version
+        is a hash of the content. Its content never changes, it can be cached
+        forever. update_manifest makes it the latest version of the chart.
+
+        Returns the version.
+    '''
+    version = get_version(payloads)
+    chart_dir = root / chart_id
+    chart_dir.mkdir(parents=True, exist_ok=True)
+    write_payloads(chart_dir / f'{version}.json',
+                   {encoding: payloads[encoding] for encoding in SUFFIXES})
+    return version
+
+
+def update_manifest(root: Path, url: str, versions: dict[str, str]):
+    '''
+        Records the versions of the exported charts in the manifest.json of
+        root, which maps the id of each exported chart to the URL of its
+        latest version under url. The files of other versions than the
+        latest and the previous one are deleted, clients that just read the
+        previous manifest can still fetch the chart.
+    '''
+    manifest_path = root / MANIFEST
+    try:
+        manifest = json.loads(manifest_path.read_bytes())
+    except FileNotFoundError:
+        manifest = {}
+
+    for (chart_id, version) in versions.items():
+        previous = manifest.get(chart_id, '').rpartition('/')[2]
+        manifest[chart_id] = f'{url}{chart_id}/{version}.json'
+        keep = {f'{version}.json', previous}
+        for path in (root / chart_id).iterdir():
+            name = path.name
+            for suffix in filter(None, SUFFIXES.values()):
+                name = name.removesuffix(suffix)
+            if name not in keep and not name.startswith('.'):
+                path.unlink()
+
+    write_payloads(manifest_path,
+                   {'identity': json.dumps(manifest, indent=2,
+                                           sort_keys=True).encode()})
@@ -1,13 +1,59 @@
 from abc import ABC, abstractmethod
 
 from collections import defaultdict
+import functools
 import inspect
 import re
 import sys
 import json
+from typing import Any, NamedTuple, Sequence
+
+from . import rules
+
+
+CLASSIFICATION_CACHE_SIZE = 1 << 16
+'''Maximum number of entries kept by each memoized classification'''
+
+MEMOIZED_CLASSIFICATIONS = {}
+'''All memoized classification functions, by qualified name'''
+
+
+def memoize_classification(function):
+    '''
+        Bounded memoization for functions that classify raw upload values.
+        Such values repeat across many uploads, so each distinct input is
+        only classified once per process. Worker processes keep the cache
+        between the slices they process.
+
+        The arguments of the function must be hashable and its result must
+        not be modified by callers.
+    '''
+    memoized = functools.lru_cache(maxsize=CLASSIFICATION_CACHE_SIZE)(function)
+    MEMOIZED_CLASSIFICATIONS[function.__qualname__] = memoized
+    return memoized
+
+
+def get_classification_cache_info() -> dict:
+    '''
+        Returns the functools.lru_cache statistics (hits, misses, maxsize,
+        currsize) for every memoized classification.
+    '''
+    return {name: function.cache_info()
+            for name, function in MEMOIZED_CLASSIFICATIONS.items()}
+
+
+def clear_classification_caches():
+    for function in MEMOIZED_CLASSIFICATIONS.values():
+        function.cache_clear()
 
 
 class DataExtractor(ABC):
+    version = 1
+    '''
+        Version of the extraction logic. Bump it whenever an extractor's logic
+        changes, the extractor's facts are then recomputed for all uploads.
+    '''
+
     @abstractmethod
     def get_required_keys(self) -> set[str]:
         '''
@@ -16,8 +62,133 @@ class DataExtractor(ABC):
         '''
         pass
 
+    def get_required_key_prefixes(self) -> set[str]:
+        '''
+            Returns prefixes of Data keys that this data extractor needs to
+            look at, for keys that are not known in advance.
+        '''
+        return set()
+
+    def get_required_facts(self) -> set[str]:
+        '''
+            Returns the keys of computed facts that this data extractor
+            needs to look at in order to extract Facts. They are passed in
+            along with the Data keys, as if they were uploaded data.
+        '''
+        return set()
+
+    @abstractmethod
+    def get_provided_facts(self) -> set[str]:
+        '''
+            Returns the keys of the facts this data extractor computes.
+        '''
+        pass
+
+
+class DataColumns(NamedTuple):
+    '''
+        The data of a set of uploads, as one column per field. Entry i of
+        every column belongs to the same Data row. Keys are lower-cased and
+        rows of the same upload and key are in the order they were uploaded.
+    '''
+    server_ids: list[int]
+    upload_ids: list[int]
+    keys: list[str]
+    values: list[str]
+
+    @staticmethod
+    def empty() -> 'DataColumns':
+        return DataColumns([], [], [], [])
+
+    def extend(self, other: 'DataColumns'):
+        for column, other_column in zip(self, other):
+            column.extend(other_column)
+
+    def to_data_dict(self) -> dict[int, dict[int, dict[str, list[str]]]]:
+        servers = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+        for (server_id, upload_id, key, value) in zip(*self):
+            servers[server_id][upload_id][key].append(value)
+        return servers
+
+    def last_values(self, key: str) -> dict[int, str]:
+        '''Returns the last value of key for each upload that has one.'''
+        return {upload_id: value
+                for (upload_id, row_key, value) in zip(self.upload_ids,
+                                                       self.keys,
+                                                       self.values)
+                if row_key == key}
+
+
+class FactColumns(NamedTuple):
+    '''
+        Upload facts, as one column per field. There is at most one entry for
+        each upload and key.
+    '''
+    upload_ids: list[int]
+    keys: list[str]
+    values: list[str]
+
+    @staticmethod
+    def empty() -> 'FactColumns':
+        return FactColumns([], [], [])
+
+    def extend(self, other: 'FactColumns'):
+        for column, other_column in zip(self, other):
+            column.extend(other_column)
+
+    @staticmethod
+    def from_facts(facts: dict[int, dict[int, dict[str, str]]]
+                   ) -> 'FactColumns':
+        result = FactColumns.empty()
+        for uploads in facts.values():
+            for upload_id, fields in uploads.items():
+                for key, value in fields.items():
+                    result.upload_ids.append(upload_id)
+                    result.keys.append(key)
+                    result.values.append(value)
+        return result
+
+
+class FactQuery(NamedTuple):
+    '''
+        A SELECT statement that computes the upload fact `key` inside the
+        database. It selects an (upload_id, value) row per upload that has the
+        fact, considering only uploads whose id is returned by the {uploads}
+        subquery, which is substituted before the statement runs. Parameters
+        use the %(name)s format and are passed in params.
+    '''
+    key: str
+    sql: str
+    params: dict[str, Any]
+
 
 class UploadFactExtractor(DataExtractor):
+    supports_columns = False
+    '''
+        Set by extractors that implement extract_fact_columns over the
+        columns themselves. The facts of other extractors are extracted with
+        extract_facts.
+    '''
+
+    def extract_fact_columns(self, columns: DataColumns) -> FactColumns:
+        '''
+            Batch version of extract_facts. Columns hold the data of a whole
+            slice of uploads and the facts are returned as columns as well, so
+            that extractors that set supports_columns can process each column
+            at once instead of one upload at a time. By default the columns
+            are converted to a data_dict for extract_facts.
+        '''
+        return FactColumns.from_facts(
+            self.extract_facts(columns.to_data_dict()))
+
+    def get_fact_queries(self) -> list[FactQuery]:
+        '''
+            Returns the queries that compute the facts of this extractor
+            inside the database, one per provided fact, or an empty list if
+            the facts can only be computed in Python.
+        '''
+        return []
+
     @abstractmethod
     def extract_facts(self,
                       data_dict: dict[int, dict[int, dict[str, list[str]]]]
@@ -68,33 +239,43 @@ class ServerFactExtractor(DataExtractor):
         pass
 
 
+NORMALIZATION_RULES = rules.load_rules()
+
+
 class ArchitectureExtractor(ServerFactExtractor):
+    MACHINE_RULES = rules.RuleTable(
+        [(rule['pattern'], rule['value'])
+         for rule in NORMALIZATION_RULES['hardware_architecture']])
+    SYSNAME_RULES = rules.KeywordRuleTable(
+        [(rule['keywords'], rule['value'])
+         for rule in NORMALIZATION_RULES['operating_system']])
+    DISTRIBUTION_RULES = rules.KeywordRuleTable(
+        [(rule['keywords'], rule['value'])
+         for rule in NORMALIZATION_RULES['distribution']])
+    GENERIC_VERSION_RULES = rules.KeywordRuleTable(
+        [(NORMALIZATION_RULES['operating_system_version']['generic_keywords'],
+          'generic')])
+    DISTRIBUTION_VERSION_PATTERNS = [
+        re.compile(pattern, re.DOTALL)
+        for pattern in
+        NORMALIZATION_RULES['operating_system_version']['from_distribution']]
+
     def get_required_keys(self) -> set[str]:
         return {'uname_machine', 'uname_sysname', 'uname_version',
                 'uname_distribution', 'uname_release'}
 
+    def get_provided_facts(self) -> set[str]:
+        return {'operating_system', 'hardware_architecture', 'distribution',
+                'operating_system_version'}
+
     @staticmethod
     def extract_distribution(upload: dict[str, list[str]]) -> str:
         if 'uname_distribution' not in upload:
             return None
 
         distro_string = upload['uname_distribution'][-1].lower()
-        distro_keywords = [
-            (['archlinux'], 'ArchLinux'),
-            (['centos', 'rhel'], 'CentOS'),
-            (['fedora'], 'Fedora'),
-            (['gentoo'], 'Gentoo'),
-            (['mint'], 'Linux Mint'),
-            (['redhat', 'rhel'], 'Red Hat Enterprise Linux'),
-            (['ubuntu'], 'Ubuntu'),
-            # TODO: fill in more names that need to be cleaned up.
-        ]
-
-        for (patterns, pretty_form) in distro_keywords:
-            for pattern in patterns:
-                if pattern in distro_string:
-                    return pretty_form
-        return distro_string
+        return ArchitectureExtractor.DISTRIBUTION_RULES.lookup(distro_string,
+                                                               distro_string)
 
     @staticmethod
     def extract_machine_architecture(upload: dict[str, list[str]]) -> str:
@@ -102,25 +283,7 @@ class ArchitectureExtractor(ServerFactExtractor):
             return None
 
         machine = upload['uname_machine'][-1].lower()
-        if re.match('^(x(86_)?64)|(amd64)$', machine):
-            machine_architecture = 'x86_64'
-        elif re.match('^[ix][3-6]*86$', machine):
-            # This check must happen after x86_64
-            machine_architecture = 'x86'
-        elif re.match('^armv[5-7]', machine):
-            machine_architecture = 'ARM 32Bit'
-        elif re.match('^aarch64$', machine):
-            machine_architecture = 'ARM 64Bit'
-        elif re.match('^hp_', machine):
-            machine_architecture = 'HP Itanium'
-        elif re.match('^alpha', machine):
-            machine_architecture = 'Alpha'
-        elif re.match('^mips$', machine):
-            machine_architecture = 'MIPS'
-        else:
-            machine_architecture = machine
-
-        return machine_architecture
+        return ArchitectureExtractor.MACHINE_RULES.lookup(machine, machine)
 
     @staticmethod
     def extract_operating_system(upload: dict[str, list[str]]) -> str:
@@ -128,18 +291,7 @@ class ArchitectureExtractor(ServerFactExtractor):
             return None
 
         sysname = upload['uname_sysname'][-1].lower()
-        if 'linux' in sysname:
-            operating_system = 'Linux'
-        elif 'windows' in sysname:
-            operating_system = 'Windows'
-        elif 'freebsd' in sysname:
-            operating_system = 'FreeBSD'
-        elif 'darwin' in sysname:
-            operating_system = 'OSX'
-        else:
-            operating_system = 'unknown'
-
-        return operating_system
+        return ArchitectureExtractor.SYSNAME_RULES.lookup(sysname, 'unknown')
 
     @staticmethod
     def extract_os_version(upload: dict[str, list[str]]) -> str:
@@ -148,83 +300,174 @@ class ArchitectureExtractor(ServerFactExtractor):
 
         version_string = upload['uname_version'][-1].lower()
 
-        # TODO(cvicentiu): Hack to clean up version strings. This will need
-        # to be changed to cover and extract a wide range of data points.
-        if 'smp' in version_string:
+        # TODO(cvicentiu): Generic version strings are only resolved through
+        # the distribution. This will need to be changed to cover and extract
+        # a wide range of data points.
+        if ArchitectureExtractor.GENERIC_VERSION_RULES.lookup(version_string):
             version_string = 'unknown'
-            try:
-                version_string = 'unknown'
-                distro_string = ''
-                if 'uname_distribution' in upload:
-                    distro_string = upload['uname_distribution'][-1].lower()
-
-                # Crude expression for CentOS 8
-                if 'linux release' in distro_string:
-                    first_digit = re.search('[0-9]+', distro_string)
-                    if first_digit is not None:
-                        version_string = distro_string[first_digit.start():]
-            except KeyError:
-                pass
+            distro_string = ''
+            if 'uname_distribution' in upload:
+                distro_string = upload['uname_distribution'][-1].lower()
+
+            for pattern in ArchitectureExtractor.DISTRIBUTION_VERSION_PATTERNS:
+                matches = pattern.match(distro_string)
+                if matches is not None:
+                    version_string = matches.group('version')
+                    break
 
         return version_string
 
+    @staticmethod
+    @memoize_classification
+    def classify(machine: str | None,
+                 sysname: str | None,
+                 version: str | None,
+                 distribution: str | None) -> tuple[tuple[str, str], ...]:
+        '''
+            Returns the (fact_key, fact_value) pairs for the given raw uname
+            values. Values that are None are treated as missing from the
+            upload.
+        '''
+        upload = {}
+        for key, value in (('uname_machine', machine),
+                           ('uname_sysname', sysname),
+                           ('uname_version', version),
+                           ('uname_distribution', distribution)):
+            if value is not None:
+                upload[key] = [value]
+
+        facts = (
+            ('operating_system',
+             ArchitectureExtractor.extract_operating_system(upload)),
+            ('hardware_architecture',
+             ArchitectureExtractor.extract_machine_architecture(upload)),
+            ('distribution',
+             ArchitectureExtractor.extract_distribution(upload)),
+            ('operating_system_version',
+             ArchitectureExtractor.extract_os_version(upload)),
+        )
+        return tuple((key, value) for key, value in facts if value is not None)
+
+    @staticmethod
+    def extract_architecture(upload: dict[str, list[str]]) -> dict[str, str]:
+        def last_value(key):
+            values = upload.get(key)
+            return values[-1] if values else None
+
+        return dict(ArchitectureExtractor.classify(
+            last_value('uname_machine'),
+            last_value('uname_sysname'),
+            last_value('uname_version'),
+            last_value('uname_distribution')))
+
     def extract_facts(self,
                       data_dict: dict[int, dict[int, dict[str, list[str]]]]
                       ) -> dict[int, dict[str, str]]:
         result = {}
 
         for server_id, server_uploads in data_dict.items():
-            facts = {}
-            for upload_id, upload in server_uploads.items():
-                fact = ArchitectureExtractor.extract_operating_system(upload)
-            if fact is not None:
-                facts['operating_system'] = fact
-
-            fact = ArchitectureExtractor.extract_machine_architecture(upload)
-            if fact is not None:
-                facts['hardware_architecture'] = fact
-
-            fact = ArchitectureExtractor.extract_distribution(upload)
-            if fact is not None:
-                facts['distribution'] = fact
-
-            fact = ArchitectureExtractor.extract_os_version(upload)
-            if fact is not None:
-                facts['operating_system_version'] = fact
-
-            result[server_id] = facts
+            # Server facts are computed from the server's latest upload, which
+            # is normally the only one passed in (see LatestServerUpload).
+            # Otherwise use the most recently created one.
+            upload = server_uploads[max(server_uploads)]
+            result[server_id] = ArchitectureExtractor.extract_architecture(
+                upload)
         return result
 
 
 class ServerVersionExtractor(UploadFactExtractor):
+    VERSION_PATTERN = re.compile(NORMALIZATION_RULES['server_version'])
+    supports_columns = True
+
     @staticmethod
     def extract_server_version(upload: dict[str, list[str]]) -> dict[str, str]:
         # Version key not present or its present with NULL values.
         # TODO(cvicentiu): Can upload['version'] actually be an empty list?
         if 'version' not in upload or len(upload['version']) == 0:
             return None
-        pattern = re.compile('(?P<major>\\d+).(?P<minor>\\d+).(?P<point>\\d+)')
 
         # We always take the last entry from a CSV if there happen to be
         # duplicates.
-        matches = pattern.match(upload['version'][-1])
+        version = ServerVersionExtractor.parse_version(upload['version'][-1])
+        if version is None:
+            return None
+
+        return {
+            'server_version_major': version[0],
+            'server_version_minor': version[1],
+            'server_version_point': version[2],
+        }
+
+    @staticmethod
+    @memoize_classification
+    def parse_version(version: str) -> tuple[str, str, str] | None:
+        matches = ServerVersionExtractor.VERSION_PATTERN.match(version)
 
         # TODO(cvicentiu) Matches set to None means regex missmatch.
         # Create a test case for this.
         if matches is None:
             return None
 
-        result = {
-            'server_version_major': matches.group('major'),
-            'server_version_minor': matches.group('minor'),
-            'server_version_point': matches.group('point'),
-        }
-
-        return result
+        return (matches.group('major'),
+                matches.group('minor'),
+                matches.group('point'))
 
     def get_required_keys(self) -> set[str]:
         return {'version'}
 
+    def get_provided_facts(self) -> set[str]:
+        return {'server_version_major', 'server_version_minor',
+                'server_version_point'}
+
+    def extract_fact_columns(self, columns: DataColumns) -> FactColumns:
+        versions = columns.last_values('version')
+        # Uploads of the same server release share their version string, so
+        # there are much fewer distinct versions than uploads.
+        parsed = {version: ServerVersionExtractor.parse_version(version)
+                  for version in set(versions.values())}
+
+        result = FactColumns.empty()
+        for upload_id, version in versions.items():
+            version = parsed[version]
+            if version is None:
+                continue
+            result.upload_ids.extend((upload_id, upload_id, upload_id))
+            result.keys.extend(('server_version_major',
+                                'server_version_minor',
+                                'server_version_point'))
+            result.values.extend(version)
+        return result
+
+    def get_fact_queries(self) -> list[FactQuery]:
+        # The same expression as VERSION_PATTERN, matched at the start of the
+        # last version uploaded, with the groups selected by REGEXP_REPLACE.
+        pattern = '^' + self.VERSION_PATTERN.pattern
+        groups = self.VERSION_PATTERN.groupindex
+        sql = """
+        SELECT
+            d.upload_id,
+            REGEXP_REPLACE(d.value, %(version_pattern)s, %(group)s) value
+        FROM
+            feedback_plugin_data d JOIN
+            (SELECT
+                MAX(id) id
+             FROM
+                feedback_plugin_data
+             WHERE
+                `key` = 'version' AND
+                upload_id IN ({uploads})
+             GROUP BY upload_id) last_version
+                ON d.id = last_version.id
+        WHERE
+            d.value REGEXP %(version_pattern)s"""
+
+        return [FactQuery(f'server_version_{group}', sql, {
+                    # Unlike ".", this also matches newlines.
+                    'version_pattern': pattern + r'[\s\S]*',
+                    'group': f'\\{groups[group]}',
+                })
+                for group in ('major', 'minor', 'point')]
+
     def extract_facts(self,
                       data_dict: dict[int, dict[int, dict[str, list[str]]]]
                       ) -> dict[int, dict[int, dict[str, str]]]:
@@ -240,21 +483,128 @@ class ServerVersionExtractor(UploadFactExtractor):
         return result
 
 
-COLLECTED_FEATURES = {'check_constraint', 'json', 'subquery', 'timezone'}
-'''The set of features collected by the extractor'''
+class ServerVersionSeriesExtractor(UploadFactExtractor):
+    '''Derives the "major.minor" release series of the server version.'''
+    def get_required_keys(self) -> set[str]:
+        return set()
+
+    def get_required_facts(self) -> set[str]:
+        return {'server_version_major', 'server_version_minor'}
+
+    def get_provided_facts(self) -> set[str]:
+        return {'server_version'}
+
+    def extract_facts(self,
+                      data_dict: dict[int, dict[int, dict[str, list[str]]]]
+                      ) -> dict[int, dict[int, dict[str, str]]]:
+        result = {}
+        for server_id, server_uploads in data_dict.items():
+            facts = {}
+            for upload_id, upload in server_uploads.items():
+                if ('server_version_major' not in upload
+                        or 'server_version_minor' not in upload):
+                    continue
+                facts[upload_id] = {
+                    'server_version': (f"{upload['server_version_major'][-1]}."
+                                       f"{upload['server_version_minor'][-1]}")
+                }
+            result[server_id] = facts
+        return result
+
 
 class ServerFeatureExtractor(UploadFactExtractor):
+    '''
+        Collects the features an upload reports as used, from all of its
+        feature_* keys. Features are not known in advance, they are added to
+        the Feature catalog as they are discovered, see
+        etl.store_upload_feature_masks.
+    '''
+    supports_columns = True
+    KEY_PREFIX = 'feature_'
+    KEY_LIKE_PATTERN = r'feature\_%'
+
     @staticmethod
     def extract_features(upload: dict[str, list[str]]) -> dict[str, bool]:
-        result: dict[str, bool] = {}
-        for feature in COLLECTED_FEATURES:
-            if values := upload.get('feature_' + feature):
-                if any(value != "0" for value in values):
-                    result[feature] = True
-        return result
+        return dict.fromkeys(
+            ServerFeatureExtractor.classify_features(
+                ServerFeatureExtractor.get_feature_values(upload)),
+            True)
+
+    @staticmethod
+    def get_feature_values(upload: dict[str, list[str]]
+                           ) -> tuple[tuple[str, tuple[str, ...]], ...]:
+        '''Returns the raw values of all reported features, as a key.'''
+        prefix = ServerFeatureExtractor.KEY_PREFIX
+        return tuple((key[len(prefix):], tuple(values))
+                     for key, values in sorted(upload.items())
+                     if key.startswith(prefix) and values)
+
+    @staticmethod
+    @memoize_classification
+    def classify_features(feature_values: tuple[tuple[str, tuple[str, ...]], ...]
+                          ) -> tuple[str, ...]:
+        '''Returns the features that are in use, given their raw values.'''
+        return tuple(feature for feature, values in feature_values
+                     if any(value != "0" for value in values))
+
+    @staticmethod
+    @memoize_classification
+    def features_to_json(features: tuple[str, ...]) -> str:
+        return json.dumps(dict.fromkeys(features, True))
+
+    @staticmethod
+    def json_to_features(features_json: str) -> list[str]:
+        '''Returns the features that are in use in a "features" fact.'''
+        return [feature for feature, used in json.loads(features_json).items()
+                if used]
 
     def get_required_keys(self) -> set[str]:
-        return {'feature_' + feature for feature in COLLECTED_FEATURES}
+        return set()
+
+    def get_required_key_prefixes(self) -> set[str]:
+        return {self.KEY_PREFIX}
+
+    def get_provided_facts(self) -> set[str]:
+        return {'features'}
+
+    def get_fact_queries(self) -> list[FactQuery]:
+        # Builds the same JSON document as features_to_json. Features are
+        # sorted by their binary value, as Python sorts them.
+        params = {'feature_pattern': self.KEY_LIKE_PATTERN}
+        name_start = len(self.KEY_PREFIX) + 1
+        sql = f"""
+        SELECT
+            d.upload_id,
+            CONCAT('{{', GROUP_CONCAT(
+                DISTINCT CONCAT('"', SUBSTRING(LOWER(d.`key`), {name_start}),
+                                '": true')
+                ORDER BY CAST(LOWER(d.`key`) AS BINARY)
+                SEPARATOR ', '), '}}') value
+        FROM
+            feedback_plugin_data d
+        WHERE
+            d.`key` LIKE %(feature_pattern)s AND
+            CAST(d.value AS BINARY) <> '0' AND
+            d.upload_id IN ({{uploads}})
+        GROUP BY d.upload_id"""
+
+        return [FactQuery('features', sql, params)]
+
+    def extract_fact_columns(self, columns: DataColumns) -> FactColumns:
+        prefix = self.KEY_PREFIX
+        used = defaultdict(set)
+        for (upload_id, key, value) in zip(columns.upload_ids, columns.keys,
+                                           columns.values):
+            if key.startswith(prefix) and value != "0":
+                used[upload_id].add(key[len(prefix):])
+
+        result = FactColumns.empty()
+        for upload_id, features in used.items():
+            result.upload_ids.append(upload_id)
+            result.keys.append('features')
+            result.values.append(ServerFeatureExtractor.features_to_json(
+                tuple(sorted(features))))
+        return result
 
     def extract_facts(self,
                       data_dict: dict[int, dict[int, dict[str, list[str]]]]
@@ -263,14 +613,54 @@ class ServerFeatureExtractor(UploadFactExtractor):
         for server_id, server_uploads in data_dict.items():
             facts: dict[int, dict[str, str]] = {}
             for upload_id, upload in server_uploads.items():
-                fact = ServerFeatureExtractor.extract_features(upload)
-                if not fact:
+                features = ServerFeatureExtractor.classify_features(
+                    ServerFeatureExtractor.get_feature_values(upload))
+                if not features:
                     continue
-                facts[upload_id] = {"features": json.dumps(fact)}
+                facts[upload_id] = {
+                    "features": ServerFeatureExtractor.features_to_json(features)
+                }
             result[server_id] = facts
         return result
 
 
+class DistributionFamilyExtractor(ServerFactExtractor):
+    '''Derives the family a distribution belongs to, such as "Debian".'''
+    FAMILY_RULES = rules.KeywordRuleTable(
+        [(rule['keywords'], rule['value'])
+         for rule in NORMALIZATION_RULES['distribution_family']])
+
+    def get_required_keys(self) -> set[str]:
+        return set()
+
+    def get_required_facts(self) -> set[str]:
+        return {'distribution'}
+
+    def get_provided_facts(self) -> set[str]:
+        return {'distribution_family'}
+
+    @staticmethod
+    @memoize_classification
+    def classify_family(distribution: str) -> str:
+        return DistributionFamilyExtractor.FAMILY_RULES.lookup(
+            distribution.lower(), distribution)
+
+    def extract_facts(self,
+                      data_dict: dict[int, dict[int, dict[str, list[str]]]]
+                      ) -> dict[int, dict[str, str]]:
+        result = {}
+        for server_id, server_uploads in data_dict.items():
+            upload = server_uploads[max(server_uploads)]
+            if 'distribution' not in upload:
+                continue
+            result[server_id] = {
+                'distribution_family':
+                    DistributionFamilyExtractor.classify_family(
+                        upload['distribution'][-1])
+            }
+        return result
+
+
 def combine_server_facts(factset: list[dict[int, dict[str, str]]]) -> dict[int, dict[str, str]]:
     '''Combine the provided server facts into a single fact dictionary.'''
 
@@ -292,6 +682,42 @@ def combine_upload_facts(factset: list[dict[int, dict[int, dict[str, str]]]]) ->
     return result
 
 
+def add_upload_facts(data_dict: dict[int, dict[int, dict[str, list[str]]]],
+                     facts: dict[int, dict[int, dict[str, str]]]):
+    '''Add upload facts to the data of their upload, as if they were Data.'''
+    for server_id, uploads in facts.items():
+        for upload_id, fields in uploads.items():
+            upload = data_dict[server_id][upload_id]
+            for key, value in fields.items():
+                upload[key] = [value]
+
+
+def add_upload_fact_columns(columns: DataColumns,
+                            facts: FactColumns) -> DataColumns:
+    '''
+        Returns the columns with the facts added as the last values of their
+        upload, as if they were Data.
+    '''
+    upload_servers = dict(zip(columns.upload_ids, columns.server_ids))
+    result = DataColumns(*(list(column) for column in columns))
+    result.extend(DataColumns(
+        [upload_servers[upload_id] for upload_id in facts.upload_ids],
+        facts.upload_ids, facts.keys, facts.values))
+    return result
+
+
+def add_server_facts(data_dict: dict[int, dict[int, dict[str, list[str]]]],
+                     facts: dict[int, dict[str, str]]):
+    '''Add server facts to the data of the server's latest upload.'''
+    for server_id, fields in facts.items():
+        server_uploads = data_dict.get(server_id)
+        if not server_uploads:
+            continue
+        upload = server_uploads[max(server_uploads)]
+        for key, value in fields.items():
+            upload[key] = [value]
+
+
 class AllFactExtractor(DataExtractor):
     def __init__(self, class_type: type):
         def class_filter(member):
@@ -314,15 +740,169 @@ class AllFactExtractor(DataExtractor):
             result |= extractor.get_required_keys()
         return result
 
+    def get_required_key_prefixes(self):
+        result = set()
+        for extractor in self.extractors:
+            result |= extractor.get_required_key_prefixes()
+        return result
+
+    def get_required_facts(self):
+        return ExtractorGraph(self.extractors).get_external_facts()
+
+    def get_provided_facts(self):
+        result = set()
+        for extractor in self.extractors:
+            result |= extractor.get_provided_facts()
+        return result
+
+
+def get_individual_extractors(data_extractors: Sequence[DataExtractor]
+                              ) -> list[DataExtractor]:
+    '''Replaces AllFactExtractor entries with the extractors they combine.'''
+    result = []
+    for extractor in data_extractors:
+        if isinstance(extractor, AllFactExtractor):
+            result += get_individual_extractors(extractor.extractors)
+        else:
+            result.append(extractor)
+    return result
+
+
+class CyclicExtractorDependency(Exception):
+    pass
+
+
+class ExtractorGraph:
+    '''
+        Schedules data extractors according to the facts they require from
+        each other.
+
+        Extractors are grouped in levels. An extractor only depends on
+        extractors of previous levels, so extractors in the same level are
+        independent. Once a level finishes, its facts are added to the data
+        passed to the following levels.
+
+        Levels, and the extractors of a level, run one after another:
+        extractors are CPU bound Python code, threads would only contend for
+        the GIL. Extraction commands run partitions of uploads in separate
+        processes instead.
+    '''
+    def __init__(self, data_extractors: Sequence[DataExtractor]):
+        self.extractors = get_individual_extractors(data_extractors)
+
+        providers = defaultdict(list)
+        for extractor in self.extractors:
+            for fact in extractor.get_provided_facts():
+                providers[fact].append(extractor)
+
+        self.dependencies = {}
+        for extractor in self.extractors:
+            self.dependencies[extractor] = [
+                provider
+                for fact in sorted(extractor.get_required_facts())
+                for provider in providers[fact]
+            ]
+
+        self.levels = []
+        scheduled = set()
+        remaining = list(self.extractors)
+        while remaining:
+            level = [extractor for extractor in remaining
+                     if all(dependency in scheduled
+                            for dependency in self.dependencies[extractor])]
+            if not level:
+                raise CyclicExtractorDependency(
+                    ', '.join(type(extractor).__name__
+                              for extractor in remaining))
+            self.levels.append(level)
+            scheduled.update(level)
+            remaining = [extractor for extractor in remaining
+                         if extractor not in scheduled]
+
+    def get_required_keys(self) -> set[str]:
+        result = set()
+        for extractor in self.extractors:
+            result |= extractor.get_required_keys()
+        return result
+
+    def get_required_key_prefixes(self) -> set[str]:
+        result = set()
+        for extractor in self.extractors:
+            result |= extractor.get_required_key_prefixes()
+        return result
+
+    def get_external_facts(self) -> set[str]:
+        '''
+            Returns the facts required by the extractors that none of the
+            extractors provide, so they have to be read from the database.
+        '''
+        required = set()
+        provided = set()
+        for extractor in self.extractors:
+            required |= extractor.get_required_facts()
+            provided |= extractor.get_provided_facts()
+        return required - provided
+
+    def run(self, data_dict, add_facts, combine_facts):
+        factset = []
+        for level in self.levels:
+            level_facts = [extractor.extract_facts(data_dict)
+                           for extractor in level]
+
+            if level is not self.levels[-1]:
+                for facts in level_facts:
+                    add_facts(data_dict, facts)
+            factset += level_facts
+        return combine_facts(factset)
+
+    def extract_upload_facts(self, data_dict
+                             ) -> dict[int, dict[int, dict[str, str]]]:
+        return self.run(data_dict, add_upload_facts, combine_upload_facts)
+
+    def extract_server_facts(self, data_dict) -> dict[int, dict[str, str]]:
+        return self.run(data_dict, add_server_facts, combine_server_facts)
+
+    def extract_upload_fact_columns(self, columns: DataColumns) -> FactColumns:
+        '''
+            Same as extract_upload_facts, for data and facts in columns.
+            Extractors that do not support columns get the data as a
+            dictionary instead.
+        '''
+        data_dict = None
+        result = FactColumns.empty()
+        for level in self.levels:
+            if data_dict is None and not all(extractor.supports_columns
+                                             for extractor in level):
+                data_dict = columns.to_data_dict()
+
+            def extract(extractor):
+                if extractor.supports_columns:
+                    return extractor.extract_fact_columns(columns)
+                return FactColumns.from_facts(
+                    extractor.extract_facts(data_dict))
+
+            level_facts = [extract(extractor) for extractor in level]
+
+            for facts in level_facts:
+                if level is not self.levels[-1]:
+                    columns = add_upload_fact_columns(columns, facts)
+                    data_dict = None
+                result.extend(facts)
+        return result
+
 
 class AllUploadFactExtractor(AllFactExtractor, UploadFactExtractor):
     def __init__(self):
         super().__init__(UploadFactExtractor)
 
+    supports_columns = True
+
+    def extract_fact_columns(self, columns: DataColumns) -> FactColumns:
+        return ExtractorGraph(self.extractors).extract_upload_fact_columns(
+            columns)
+
     def extract_facts(self, data_dict) -> dict[int, dict[int, dict[str, str]]]:
-        return combine_upload_facts(
-            [extractor.extract_facts(data_dict) for extractor in self.extractors]
-        )
+        return ExtractorGraph(self.extractors).extract_upload_facts(data_dict)
 
 
 class AllServerFactExtractor(AllFactExtractor, ServerFactExtractor):
@@ -330,6 +910,4 @@ class AllServerFactExtractor(AllFactExtractor, ServerFactExtractor):
         super().__init__(ServerFactExtractor)
 
     def extract_facts(self, data_dict) -> dict[int, dict[str, str]]:
-        return combine_server_facts(
-            [extractor.extract_facts(data_dict) for extractor in self.extractors]
-        )
+        return ExtractorGraph(self.extractors).extract_server_facts(data_dict)
@@ -0,0 +1,187 @@
+from abc import ABC, abstractmethod
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any, Callable, Iterable
+import time
+
+from django.db import connection
+
+
+QUEUE_SIZE = 2
+'''How many slices can wait between two stages of the pipeline.'''
+
+_POLL_INTERVAL = 0.1
+_DONE = object()
+
+
+class _Stopped(Exception):
+    pass
+
+
+class _Stage(ABC):
+    def __init__(self, name: str, stop: Event):
+        self.name = name
+        self.stop = stop
+        self.error = None
+        self.elapsed = 0.0
+
+    def put(self, queue: Queue, item: Any):
+        while True:
+            if self.stop.is_set():
+                raise _Stopped()
+            try:
+                queue.put(item, timeout=_POLL_INTERVAL)
+                return
+            except Full:
+                pass
+
+    def get(self, queue: Queue) -> Any:
+        while True:
+            if self.stop.is_set():
+                raise _Stopped()
+            try:
+                return queue.get(timeout=_POLL_INTERVAL)
+            except Empty:
+                pass
+
+    @abstractmethod
+    def work(self):
+        pass
+
+
+def _start_thread(stage: _Stage) -> Thread:
+    '''
+        Runs the work of the stage in a new thread. An error stops the other
+        stages and is kept in stage.error.
+    '''
+    def run():
+        try:
+            stage.work()
+        except _Stopped:
+            pass
+        except BaseException as e:
+            stage.error = e
+            stage.stop.set()
+        finally:
+            # Each thread uses its own database connection.
+            connection.close()
+
+    thread = Thread(target=run, name=stage.name, daemon=True)
+    thread.start()
+    return thread
+
+
+class _FetchStage(_Stage):
+    def __init__(self, stop: Event, slices: Iterable, fetch: Callable,
+                 output: Queue):
+        super().__init__('fetch', stop)
+        self.slices = slices
+        self.fetch = fetch
+        self.output = output
+
+    def work(self):
+        for data_slice in self.slices:
+            start = time.monotonic()
+            data = self.fetch(data_slice)
+            self.elapsed += time.monotonic() - start
+            self.put(self.output, data)
+        self.put(self.output, _DONE)
+
+
+class _ComputeStage(_Stage):
+    def __init__(self, stop: Event, compute: Callable, input: Queue,
+                 output: Queue):
+        super().__init__('extract', stop)
+        self.compute = compute
+        self.input = input
+        self.output = output
+
+    def work(self):
+        while (data := self.get(self.input)) is not _DONE:
+            start = time.monotonic()
+            facts = self.compute(data)
+            self.elapsed += time.monotonic() - start
+            self.put(self.output, facts)
+        self.put(self.output, _DONE)
+
+
+class _StoreStage(_Stage):
+    def __init__(self, stop: Event, store: Callable, input: Queue):
+        super().__init__('store', stop)
+        self.store = store
+        self.input = input
+
+    def work(self):
+        while (facts := self.get(self.input)) is not _DONE:
+            start = time.monotonic()
+            self.store(facts)
+            self.elapsed += time.monotonic() - start
+
+
+def run_pipeline(slices: Iterable,
+                 fetch: Callable[[Any], Any],
+                 compute: Callable[[Any], Any],
+                 store: Callable[[Any], None],
+                 threaded: bool = True,
+                 queue_size: int = QUEUE_SIZE) -> dict[str, float]:
+    '''
+        Calls store(compute(fetch(data_slice))) for every slice, overlapping
+        the three stages: while the current slice is computed in the calling
+        thread, the data of the next slices is fetched and the facts of the
+        previous slices are stored by two other threads.
+
+        The queues between the stages hold at most queue_size slices, so a
+        slow stage holds back the others instead of piling up data.
+
+        If threaded is False, the slices are processed one stage after the
+        other in the calling thread instead.
+
+        Returns the time spent in each stage. As the stages overlap, the sum
+        of their times is larger than the time the whole pipeline took.
+    '''
+    stop = Event()
+    fetched = Queue(maxsize=queue_size)
+    computed = Queue(maxsize=queue_size)
+    fetcher = _FetchStage(stop, slices, fetch, fetched)
+    storer = _StoreStage(stop, store, computed)
+    compute_stage = _ComputeStage(stop, compute, fetched, computed)
+
+    if not threaded:
+        for data_slice in slices:
+            start = time.monotonic()
+            data = fetch(data_slice)
+            fetcher.elapsed += time.monotonic() - start
+            start = time.monotonic()
+            facts = compute(data)
+            compute_stage.elapsed += time.monotonic() - start
+            start = time.monotonic()
+            store(facts)
+            storer.elapsed += time.monotonic() - start
+        return get_timings(fetcher, compute_stage, storer)
+
+    threads = [_start_thread(fetcher), _start_thread(storer)]
+    try:
+        compute_stage.work()
+    except _Stopped:
+        pass
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    for stage in (fetcher, storer):
+        if stage.error is not None:
+            raise stage.error
+
+    return get_timings(fetcher, compute_stage, storer)
+
+
+def get_timings(*stages: _Stage) -> dict[str, float]:
+    return {stage.name: stage.elapsed for stage in stages}
+
+
+def format_timings(timings: dict[str, float]) -> str:
+    return ', '.join(f'{stage} {elapsed:.1f}s'
+                     for stage, elapsed in timings.items())
@@ -0,0 +1,49 @@
+import os
+import re
+
+import yaml
+
+
+RULES_PATH = os.path.join(os.path.dirname(__file__), 'normalization_rules.yml')
+
+
+class RuleTable:
+    '''
+        An ordered list of (pattern, value) rules, compiled into a single
+        regular expression. The first rule whose pattern matches at the start
+        of the input wins, just as if the patterns were tried one by one with
+        re.match.
+    '''
+    def __init__(self, rules: list[tuple[str, str]], flags: int = 0):
+        self.values = {}
+        alternatives = []
+        for i, (pattern, value) in enumerate(rules):
+            self.values[f'r{i}'] = value
+            alternatives.append(f'(?P<r{i}>{pattern})')
+        self.regex = re.compile('|'.join(alternatives), flags)
+
+    def lookup(self, string: str, default: str | None = None) -> str | None:
+        match = self.regex.match(string)
+        if match is None:
+            return default
+        # The rule's own group is the outermost one, so it is the last
+        # group to be closed.
+        return self.values[match.lastgroup]
+
+
+class KeywordRuleTable(RuleTable):
+    '''
+        An ordered list of (keywords, value) rules. The first rule with a
+        keyword contained anywhere in the input wins, regardless of where in
+        the input the keyword occurs.
+    '''
+    def __init__(self, rules: list[tuple[list[str], str]]):
+        super().__init__(
+            [('.*?(?:' + '|'.join(map(re.escape, keywords)) + ')', value)
+             for (keywords, value) in rules],
+            re.DOTALL)
+
+
+def load_rules(path: str = RULES_PATH) -> dict:
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
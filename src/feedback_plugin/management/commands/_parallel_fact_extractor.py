@@ -1,23 +1,66 @@
-from concurrent.futures import ProcessPoolExecutor, wait
-from datetime import datetime, timedelta, timezone
-from typing import Callable, TypeVar, Generic
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Any, Callable, TypeVar, Generic
+import time
 
-from django.core.management.base import BaseCommand
+from django import db
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone as django_timezone
 
-from ...data_processing import extractors
+from ...data_processing import etl, extractors
+from ...data_processing.pipeline import format_timings
+
+
+# Each worker gets at least this many partitions, so that workers that finish
+# their partitions early pick up the remaining ones instead of idling.
+PARTITIONS_PER_WORKER = 4
 
 
 Extractor = TypeVar('Extractor', bound=extractors.DataExtractor)
 class ProcessPoolFactExtractor(Generic[Extractor], BaseCommand):
+    '''
+        Extracts facts in parallel, using a pool of worker processes.
+
+        When called with a start_time and an end_time, all facts for uploads
+        in that interval are (re)computed.
+
+        When called without an interval, only uploads that were added since
+        the last run are processed. Extractors whose version changed since
+        they last ran recompute their facts for all uploads.
+
+        Uploads are split in partitions holding about the same number of
+        uploads. Partitions are handed out to workers as they become idle and
+        failed partitions are retried. The command fails if a partition still
+        fails after all of its attempts.
+
+        If push_down is set, the command accepts --push-down, which is passed
+        on to the callbacks.
+
+        If shard_by_server is set, the command accepts --shard-by-server. The
+        servers are then split in shards instead, see
+        etl.server_shard_filter, and each partition processes all uploads of
+        the servers in one shard. The callbacks get the shard as their last
+        argument. As no two partitions process the same server, their writes
+        never conflict.
+    '''
     def __init__(
             self,
             extract_cb: Callable[[datetime, datetime,
                                   list[Extractor], bool], None],
+            extract_by_upload_id_cb: Callable[[int, int,
+                                               list[Extractor]], None],
             extractors: list[Extractor],
-            *args, **kwargs):
+            *args,
+            shard_by_server: bool = False,
+            push_down: bool = False,
+            **kwargs):
         super().__init__(*args, **kwargs)
         self._extract_cb = extract_cb
+        self._extract_by_upload_id_cb = extract_by_upload_id_cb
         self._extractors = extractors
+        self._shard_by_server = shard_by_server
+        self._push_down = push_down
 
     @staticmethod
     def date_with_tz_from_str(string: str) -> datetime:
@@ -27,32 +70,219 @@ class ProcessPoolFactExtractor(Generic[Extractor], BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument(
-            'start_time', type=ProcessPoolFactExtractor.date_with_tz_from_str)
+            'start_time', nargs='?',
+            type=ProcessPoolFactExtractor.date_with_tz_from_str)
         parser.add_argument(
-            'end_time', type=ProcessPoolFactExtractor.date_with_tz_from_str)
+            'end_time', nargs='?',
+            type=ProcessPoolFactExtractor.date_with_tz_from_str)
         parser.add_argument(
             '--workers', type=int, default=4,
-            help='How many threads to use to compute facts')
+            help='How many processes to use to compute facts')
+        parser.add_argument(
+            '--partition-size', type=int, default=10000,
+            help='The maximum number of uploads each job processes')
+        parser.add_argument(
+            '--retries', type=int, default=2,
+            help='How many times a failed job is retried')
+        parser.add_argument(
+            '--slice-size', type=int, default=1000,
+            help='Jobs fetch the data of the next slice of this many uploads '
+                 'or servers and store the facts of the previous slice while '
+                 'extracting the facts of the current one')
+        if self._shard_by_server:
+            parser.add_argument(
+                '--shard-by-server', action='store_true',
+                help='Split the work by server instead of by upload, so that '
+                     'each server is processed by a single job')
+        if self._push_down:
+            parser.add_argument(
+                '--push-down', action='store_true',
+                help='Compute the facts of extractors that support it inside '
+                     'the database')
 
     def handle(self, *args, **options):
-        start_time = options['start_time']
-        end_time = options['end_time']
-        workers = options['workers']
-
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            jobs = []
-            while start_time + timedelta(seconds=60 * 60 * 24) <= end_time:
-                cur_end = start_time + timedelta(seconds=60 * 60 * 24)
-
-                job = executor.submit(self._extract_cb,
-                                      start_time, cur_end,
-                                      self._extractors,
-                                      end_inclusive=False)
-                jobs.append(job)
-                start_time = cur_end
-
-            wait(jobs)
-
-            self._extract_cb(start_time, end_time,
-                             self._extractors,
-                             end_inclusive=True)
+        self._workers = options['workers']
+        self._partition_size = options['partition_size']
+        self._retries = options['retries']
+        self._callback_kwargs = {'slice_size': options['slice_size']}
+        if options.get('push_down'):
+            self._callback_kwargs['push_down'] = True
+        self._shards = None
+        if options.get('shard_by_server'):
+            self._shards = self._workers * PARTITIONS_PER_WORKER
+
+        if options['start_time'] is None:
+            self.extract_new_facts()
+            return
+
+        if options['end_time'] is None:
+            raise CommandError('end_time is required when start_time is set')
+
+        self.extract_facts_between(options['start_time'],
+                                   options['end_time'])
+
+    def run_partitions(self,
+                       callback: Callable[..., None],
+                       partitions: list[tuple[str, tuple[Any, ...]]]
+                       ) -> set[int]:
+        '''
+            Calls callback(*args) for every (description, args) partition in
+            the pool of worker processes, retrying failed partitions. The
+            --slice-size and --push-down options are passed as keyword
+            arguments. The callback may return the time spent in each of its
+            stages, which is reported along with the progress.
+
+            Returns the indexes of the partitions that failed after all of
+            their attempts.
+        '''
+        # Forked worker processes must not share the database connection
+        # used for planning.
+        db.connections.close_all()
+
+        max_attempts = self._retries + 1
+        attempts = [0] * len(partitions)
+        failed = set()
+
+        # Worker processes are reused between jobs, so the classification
+        # caches of the extractors are shared by all partitions a worker
+        # processes.
+        with ProcessPoolExecutor(max_workers=self._workers) as executor:
+            jobs = {}
+
+            def submit(index):
+                attempts[index] += 1
+                try:
+                    job = executor.submit(callback, *partitions[index][1],
+                                          **self._callback_kwargs)
+                except BrokenProcessPool as e:
+                    self.stderr.write(f'Partition {partitions[index][0]} '
+                                      f'could not be started: {e}')
+                    failed.add(index)
+                    return
+                jobs[job] = (index, time.monotonic())
+
+            for index in range(len(partitions)):
+                submit(index)
+
+            while jobs:
+                done, _ = wait(jobs, return_when=FIRST_COMPLETED)
+                for job in done:
+                    index, start = jobs.pop(job)
+                    description = partitions[index][0]
+                    elapsed = time.monotonic() - start
+                    error = job.exception()
+                    if error is None:
+                        timings = job.result()
+                        self.stdout.write(
+                            f'Partition {index + 1}/{len(partitions)} '
+                            f'{description} done in {elapsed:.1f}s'
+                            f'{f" ({format_timings(timings)})" if timings else ""}')
+                        continue
+
+                    self.stderr.write(
+                        f'Partition {index + 1}/{len(partitions)} '
+                        f'{description} failed after {elapsed:.1f}s, attempt '
+                        f'{attempts[index]}/{max_attempts}: {error!r}')
+                    if attempts[index] < max_attempts:
+                        submit(index)
+                    else:
+                        failed.add(index)
+
+        return failed
+
+    @staticmethod
+    def check_failed_partitions(failed: set[int],
+                                partitions: list[tuple[str, tuple[Any, ...]]]):
+        if failed:
+            raise CommandError(f'{len(failed)} of {len(partitions)} '
+                               'partitions failed')
+
+    def get_shard_partitions(self, description: str, args: tuple[Any, ...]
+                             ) -> list[tuple[str, tuple[Any, ...]]]:
+        return [(f'{description} shard {shard_index + 1}/{self._shards}',
+                 args + ((shard_index, self._shards),))
+                for shard_index in range(self._shards)]
+
+    def extract_facts_between(self, start_time: datetime, end_time: datetime):
+        if self._shards is not None:
+            partitions = self.get_shard_partitions(
+                f'[{start_time}, {end_time}]',
+                (start_time, end_time, self._extractors, True))
+        else:
+            boundaries = etl.get_partition_boundaries(
+                etl.date_filter('upload_time', start_time, end_time, True),
+                'upload_time',
+                self._partition_size,
+                self._workers * PARTITIONS_PER_WORKER)
+
+            starts = [start_time] + boundaries
+            ends = boundaries + [end_time]
+            partitions = []
+            for (index, (start, end)) in enumerate(zip(starts, ends)):
+                end_inclusive = index == len(boundaries)
+                partitions.append((
+                    f'[{start}, {end}{"]" if end_inclusive else ")"}',
+                    (start, end, self._extractors, end_inclusive)))
+
+        failed = self.run_partitions(self._extract_cb, partitions)
+        self.check_failed_partitions(failed, partitions)
+
+    def extract_new_facts(self):
+        pending = etl.get_pending_fact_extractions(self._extractors)
+
+        partitions = []
+        groups = []
+        for (first_upload_id, last_upload_id, extractors) in pending:
+            group_start = len(partitions)
+            if self._shards is not None:
+                partitions += self.get_shard_partitions(
+                    f'uploads ({first_upload_id}, {last_upload_id}]',
+                    (first_upload_id, last_upload_id, extractors))
+            else:
+                boundaries = etl.get_partition_boundaries(
+                    etl.upload_id_filter('id', first_upload_id,
+                                         last_upload_id),
+                    'id',
+                    self._partition_size,
+                    self._workers * PARTITIONS_PER_WORKER)
+
+                starts = [first_upload_id] + [b - 1 for b in boundaries]
+                ends = [b - 1 for b in boundaries] + [last_upload_id]
+                for (start, end) in zip(starts, ends):
+                    partitions.append((f'uploads ({start}, {end}]',
+                                       (start, end, extractors)))
+            group_partitions = range(group_start, len(partitions))
+            groups.append((first_upload_id, last_upload_id, extractors,
+                           group_partitions))
+
+        start_time = django_timezone.now()
+        failed = self.run_partitions(self._extract_by_upload_id_cb, partitions)
+
+        stalled = set()
+        for (first_upload_id, last_upload_id, extractors,
+             group_partitions) in groups:
+            # Watermarks of extractors with failed partitions are left as
+            # they were, so their uploads are processed again on the next run.
+            # Groups are ordered by upload ids, the watermarks of these
+            # extractors are not moved by later groups either.
+            if failed.intersection(group_partitions):
+                names = ', '.join(map(etl.get_extractor_name, extractors))
+                self.stderr.write(f'Not all facts of uploads '
+                                  f'({first_upload_id}, {last_upload_id}] '
+                                  f'were extracted using {names}')
+                stalled.update(extractors)
+                continue
+            extractors = [extractor for extractor in extractors
+                          if extractor not in stalled]
+            if not extractors:
+                continue
+            names = ', '.join(map(etl.get_extractor_name, extractors))
+
+            etl.finish_fact_extraction(extractors,
+                                       first_upload_id, last_upload_id,
+                                       start_time)
+            self.stdout.write(f'Extracted facts of uploads '
+                              f'({first_upload_id}, {last_upload_id}] '
+                              f'using {names}')
+
+        self.check_failed_partitions(failed, partitions)
@@ -1,12 +1,17 @@
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from pathlib import Path
 from typing import Callable
-import copy
 import logging
+import time
 
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from feedback_plugin.models import (Chart, ChartMetadata, Upload)
-from feedback_plugin.data_processing import charts
+from feedback_plugin.models import (Chart, ChartMetadata, ChartPoint,
+                                    ChartState, ServerMonth, Upload)
+from feedback_plugin.data_processing import charts, distinct, etl, export
 from sql_utils.utils import print_sql
 
 
@@ -14,22 +19,34 @@ class DatabaseHasNoUploads(Exception):
     pass
 
 
+def format_month(month: date) -> str:
+    return f'{month:%Y-%m}'
+
+
+def format_month_unpadded(month: date) -> str:
+    return f'{month.year}-{month.month}'
+
+
 CHARTS_MAP = {
         'server-count': {
-            'callback': charts.compute_server_count_by_month,
+            'callback': charts.get_servers_by_month,
             'title': 'Server Count by Month',
+            'format_month': format_month,
         },
         'feature-count': {
-            'callback': charts.compute_feature_counts_by_month,
+            'callback': charts.get_feature_servers_by_month,
             'title': 'Feature Count by Month',
+            'format_month': format_month,
         },
         'version-breakdown': {
-            'callback': charts.compute_version_breakdown_by_month,
+            'callback': charts.get_version_servers_by_month,
             'title': 'Server Version Breakdown by Month',
+            'format_month': format_month_unpadded,
         },
         'architecture-breakdown': {
-            'callback': charts.compute_architecture_breakdown_by_month,
+            'callback': charts.get_architecture_servers_by_month,
             'title': 'Architecture Breakdown by Month',
+            'format_month': format_month_unpadded,
         }
 }
 
@@ -52,14 +69,73 @@ class Command(BaseCommand):
            not previously used. (see ChartMetadata.computed_end_date)
            The data that will be used in this case is the one from:
            (ChartMetadata.computed_end_date, last_upload.get().upload_time]
+
+           Charts count whole months. The servers counted for each series and
+           month are kept in ChartState, as exact sets of server ids or as
+           HyperLogLog sketches (--distinct-counter=hll, with a standard
+           error of at most --hll-error). The servers of the new data are
+           merged into them, so servers already counted in the month of
+           computed_end_date are not counted twice. Changing the kind of
+           counter requires --recreate. Only the points whose count changed
+           are written to ChartPoint. The response bodies of the REST API
+           are rendered and compressed into ChartPayload along with them.
+        c. The last months of a chart can be computed again with
+           --tail-months=K, which replaces the points of the last K months
+           (and of any month after computed_end_date) and leaves older
+           points untouched. Late uploads of these months are counted then,
+           without going through the whole history as --recreate does.
+
+        Uploads added since the last run are recorded in ServerMonth first,
+        see etl.update_server_months, and the months they touch are indexed
+        in ServerBitmap, see etl.update_server_bitmaps, along with the months
+        whose facts changed since. --recreate indexes all months again.
+
+        Charts are computed concurrently by --workers threads, each with its
+        own database connection, and each chart is saved in its own
+        transaction. The series of a chart come from a single query per
+        shard of --shard-months months, the shards of a chart are queried
+        concurrently as well, which spreads the recreation of a chart over
+        the cores of the database. The wall time of each chart is reported.
+
+        With --export, the REST API response of each computed chart is also
+        written to files under CHART_EXPORT_ROOT, or --export-dir, that the
+        web server serves without going through Django, see
+        data_processing.export. Their URLs are listed in manifest.json.
+        Charts are only exported when asked to, a CHART_EXPORT_ROOT set in
+        the environment alone does not export them.
     '''
 
     def add_arguments(self, parser):
         parser.add_argument('--recreate', action='store_true')
         parser.add_argument('--chart', default='all')
+        parser.add_argument('--distinct-counter', default='exact',
+                            choices=sorted(distinct.COUNTERS))
+        parser.add_argument('--hll-error', type=float, default=0.01)
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='How many charts to compute concurrently, each in its own '
+                 'thread and database connection')
+        parser.add_argument(
+            '--tail-months', type=int, default=0,
+            help='Compute the last this many months of the charts again, '
+                 'replacing their points, to pick up data that arrived late')
+        parser.add_argument(
+            '--shard-months', type=int, default=12,
+            help='Charts fetch the servers of this many months per query, '
+                 'the queries of a chart run concurrently on --workers '
+                 'threads')
+        parser.add_argument(
+            '--export', action='store_true',
+            help='Write the computed charts as static files to '
+                 'CHART_EXPORT_ROOT')
+        parser.add_argument(
+            '--export-dir', type=Path,
+            help='Write the computed charts as static files to this '
+                 'directory instead of CHART_EXPORT_ROOT, implies --export')
 
     @staticmethod
-    def get_computation_object(chart_id: str, force_recreate: bool):
+    def get_computation_object(chart_id: str, force_recreate: bool,
+                               tail_months: int = 0):
         first_upload = Upload.objects.all().order_by('upload_time')[:1]
         last_upload = Upload.objects.all().order_by('-upload_time')[:1]
 
@@ -78,96 +154,219 @@ class Command(BaseCommand):
         metadata = chart.metadata
 
         if force_recreate:
-            chart.values = {}
             start_date = first_upload.get().upload_time
             metadata.computed_start_date = start_date
-            start_closed_interval = True
+            since = None
+            replace_from = None
+        elif tail_months > 0:
+            # The last tail_months months are computed again, along with
+            # any month after the previous computation.
+            replace_from = min(charts.add_months(etl.get_month(end_date),
+                                                 1 - tail_months),
+                               etl.get_month(metadata.computed_end_date))
+            start_date = datetime(replace_from.year, replace_from.month, 1,
+                                  tzinfo=timezone.utc)
+            since = None
         else:
+            # Only the uploads after the previous computation are read, their
+            # servers are merged into the stored states.
             start_date = metadata.computed_end_date
-            start_closed_interval = False
+            since = metadata.computed_end_date
+            replace_from = None
 
         metadata.computed_end_date = end_date
 
-        return (chart, metadata, start_date, end_date, start_closed_interval)
-
-    @staticmethod
-    def merge_multi_series_chart_data(chart_values: dict[str, dict[str, list]],
-                                      new_data: dict[str, dict[str, list]]
-    ) -> dict[str, dict[str, list]]:
-        logger.info(f'Already: {chart_values}')
-        logger.info(f'{new_data}')
-        result = {}
-        for series in chart_values:
-            new_data_series = {}
-            if series in new_data:
-                new_data_series = new_data[series]
-
-            result[series] = Command.merge_chart_data(chart_values[series],
-                                                      new_data_series)
-        for series in new_data:
-            if series not in result:
-                result[series] = copy.deepcopy(new_data[series])
-        logger.info(f'Result: {result}')
-        return result
-
-    @staticmethod
-    def merge_chart_data(chart_values: dict[str, list],
-                         new_data: dict[str, list]) -> dict[str, list]:
-        result = copy.deepcopy(chart_values)
-
-        if 'x' not in new_data or len(new_data['x']) == 0:
-            return result
-
-        if len(result['x']) > 0 and result['x'][-1] == new_data['x'][0]:
-            result['y'][-1] += new_data['y'][0]
-            new_data['x'].pop(0)
-            new_data['y'].pop(0)
-
-        result['x'] += new_data['x']
-        result['y'] += new_data['y']
-
-        return result
+        return (chart, metadata, start_date, end_date, since, replace_from)
 
     @staticmethod
     def compute_chart(chart_id: str,
                       title: str,
-                      fetch_data_callback: Callable[[datetime, datetime, bool],
-                                                    dict],
-                      force_recreate: bool):
+                      fetch_servers_callback: Callable[
+                          [datetime, datetime, datetime | None],
+                          charts.ServersByMonth],
+                      format_month: Callable[[date], str],
+                      force_recreate: bool,
+                      create_counter: Callable[[], distinct.DistinctCounter],
+                      shard_months: int = 12,
+                      map_shards: Callable = map,
+                      tail_months: int = 0,
+                      export_root: Path | None = None) -> str | None:
+        '''
+            Computes the chart and, with export_root, exports it once saved.
+            Returns the exported version of the chart.
+        '''
         logger.info(f'Computing chart: {chart_id} - {title}')
         (chart, metadata,
          start_date, end_date,
-         start_closed_interval
-        ) = Command.get_computation_object(chart_id, force_recreate)
+         since,
+         replace_from
+        ) = Command.get_computation_object(chart_id, force_recreate,
+                                           tail_months)
 
-        data = fetch_data_callback(start_date, end_date, start_closed_interval)
+        # The servers are fetched by shards of months, which map_shards may
+        # fetch concurrently.
+        shards = charts.get_month_shards(start_date, end_date, shard_months)
+        servers = charts.merge_servers_by_month(map_shards(
+            lambda shard: fetch_servers_callback(*shard, since), shards))
 
         chart.title = title
 
-        logger.info(f'Appending {len(data)} series, between {start_date} '
-                    f'and {end_date}')
-        chart.values = Command.merge_multi_series_chart_data(chart.values,
-                                                             data)
+        with transaction.atomic():
+            chart.save()
+            metadata.save()
+            if force_recreate:
+                ChartState.objects.filter(chart_id=chart_id).delete()
+                ChartPoint.objects.filter(chart_id=chart_id).delete()
+            elif replace_from is not None:
+                # The states of the months computed again are replaced, older
+                # ones are left as they are.
+                ChartState.objects.filter(chart_id=chart_id,
+                                          month__gte=replace_from).delete()
+            try:
+                counts = charts.update_chart_states(chart_id, servers,
+                                                    create_counter)
+            except distinct.IncompatibleCounters as e:
+                raise CommandError(f'{e}, use --recreate to change the kind '
+                                   'of counter of a chart')
+
+            written = charts.update_chart_points(chart_id, counts,
+                                                 format_month, replace_from)
+            logger.info(f'Wrote {written} points of {len(counts)} series, '
+                        f'between {start_date} and {end_date}')
+            payloads = charts.update_chart_payloads(metadata)
+
+        if export_root is None:
+            return None
+        return export.export_chart(export_root, chart_id, payloads)
+
+    def compute_charts(self,
+                       chart_ids: list[str],
+                       force_recreate: bool,
+                       create_counter: Callable[[], distinct.DistinctCounter],
+                       workers: int,
+                       shard_months: int,
+                       tail_months: int = 0,
+                       export_root: Path | None = None):
+        '''
+            Computes the charts in a pool of workers threads and reports the
+            wall time of each of them. The shards of months of the charts are
+            fetched by another pool of workers threads. All charts are
+            computed even if some fail, the error of the first failed chart is
+            raised afterwards. The manifest of export_root is updated with
+            the charts exported successfully.
+        '''
+        # Other threads would not see the changes of a transaction the
+        # command is called in, everything runs in the calling thread then.
+        concurrent = workers > 1 and not connection.in_atomic_block
+        threaded = concurrent and len(chart_ids) > 1
+        shard_executor = (ThreadPoolExecutor(max_workers=workers)
+                          if concurrent else None)
+
+        def fetch_shard(fetch: Callable, shard: tuple[datetime, datetime]):
+            try:
+                return fetch(shard)
+            finally:
+                connection.close()
+
+        def map_shards(fetch: Callable,
+                       shards: list[tuple[datetime, datetime]]):
+            if shard_executor is None or len(shards) == 1:
+                return map(fetch, shards)
+            return shard_executor.map(fetch_shard, [fetch] * len(shards),
+                                      shards)
+
+        def compute(chart_id: str
+        ) -> tuple[float, str | None, Exception | None]:
+            start = time.monotonic()
+            version = None
+            error = None
+            try:
+                version = Command.compute_chart(chart_id,
+                                      CHARTS_MAP[chart_id]['title'],
+                                      CHARTS_MAP[chart_id]['callback'],
+                                      CHARTS_MAP[chart_id]['format_month'],
+                                      force_recreate,
+                                      create_counter,
+                                      shard_months,
+                                      map_shards,
+                                      tail_months,
+                                      export_root)
+            except Exception as e:
+                error = e
+            finally:
+                if threaded:
+                    # Each thread uses its own database connection.
+                    connection.close()
+            return (time.monotonic() - start, version, error)
 
-        chart.save()
-        metadata.save()
+        try:
+            if threaded:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(compute, chart_ids))
+            else:
+                results = [compute(chart_id) for chart_id in chart_ids]
+        finally:
+            if shard_executor is not None:
+                shard_executor.shutdown()
+
+        errors = []
+        versions = {}
+        for (chart_id, (elapsed, version, error)) in zip(chart_ids, results):
+            if version is not None:
+                versions[chart_id] = version
+            if error is None:
+                self.stdout.write(f'Chart {chart_id} computed in '
+                                  f'{elapsed:.1f}s')
+            else:
+                self.stderr.write(f'Chart {chart_id} failed after '
+                                  f'{elapsed:.1f}s: {error!r}')
+                errors.append(error)
+        if versions:
+            export.update_manifest(export_root, settings.CHART_EXPORT_URL,
+                                   versions)
+        if errors:
+            raise errors[0]
 
     def handle(self, *args, **options):
+        if options['shard_months'] < 1:
+            raise CommandError('--shard-months must be at least 1')
+        if options['tail_months'] < 0:
+            raise CommandError('--tail-months can not be negative')
+        if options['tail_months'] and options['recreate']:
+            raise CommandError('--tail-months can not be used with '
+                               '--recreate')
+        export_root = options['export_dir']
+        if options['export'] and export_root is None:
+            if not settings.CHART_EXPORT_ROOT:
+                raise CommandError('--export needs CHART_EXPORT_ROOT or '
+                                   '--export-dir')
+            export_root = Path(settings.CHART_EXPORT_ROOT)
+
+        etl.update_server_months()
+        if options['recreate']:
+            etl.update_server_bitmaps(
+                ServerMonth.objects.order_by().values_list(
+                    'month', flat=True).distinct())
+        else:
+            etl.update_server_bitmaps()
+
+        def create_counter():
+            return distinct.create_counter(options['distinct_counter'],
+                                           options['hll_error'])
+
         try:
             all = options['chart'] == 'all'
             if not all:
                 if options['chart'] not in CHARTS_MAP:
                     raise CommandError('Invalid chart id')
-
-                Command.compute_chart(options['chart'],
-                                      CHARTS_MAP[options['chart']]['title'],
-                                      CHARTS_MAP[options['chart']]['callback'],
-                                      options['recreate'])
+                chart_ids = [options['chart']]
             else:
-                for chart_id in CHARTS_MAP:
-                    Command.compute_chart(chart_id,
-                                          CHARTS_MAP[chart_id]['title'],
-                                          CHARTS_MAP[chart_id]['callback'],
-                                          options['recreate'])
+                chart_ids = list(CHARTS_MAP)
+
+            if not Upload.objects.exists():
+                raise DatabaseHasNoUploads()
+            self.compute_charts(chart_ids, options['recreate'], create_counter,
+                                options['workers'], options['shard_months'],
+                                options['tail_months'], export_root)
         except DatabaseHasNoUploads:
             raise CommandError('No uploads, can not compute charts!')
@@ -5,5 +5,6 @@ from ._parallel_fact_extractor import ProcessPoolFactExtractor
 class Command(ProcessPoolFactExtractor):
     def __init__(self, *args, **kwargs):
         super().__init__(etl.extract_server_facts,
+                         etl.extract_server_facts_by_upload_id,
                          [extractors.AllServerFactExtractor()],
-                         *args, **kwargs)
+                         *args, shard_by_server=True, **kwargs)
@@ -5,5 +5,12 @@ from ._parallel_fact_extractor import ProcessPoolFactExtractor
 class Command(ProcessPoolFactExtractor):
     def __init__(self, *args, **kwargs):
         super().__init__(etl.extract_upload_facts,
+                         etl.extract_upload_facts_by_upload_id,
                          [extractors.AllUploadFactExtractor()],
-                         *args, **kwargs)
+                         *args, push_down=True, **kwargs)
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+        # Features discovered by this run are looked up in the uploads that
+        # were processed before.
+        etl.backfill_features()
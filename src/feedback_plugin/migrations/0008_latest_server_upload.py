@@ -0,0 +1,26 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0007_add_index_data_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestServerUpload',
+            fields=[
+                ('server', models.OneToOneField(db_column='server_id', on_delete=django.db.models.deletion.PROTECT, primary_key=True, serialize=False, to='feedback_plugin.server')),
+                ('upload_time', models.DateTimeField()),
+                ('upload', models.ForeignKey(db_column='upload_id', on_delete=django.db.models.deletion.PROTECT, to='feedback_plugin.upload')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='latestserverupload',
+            index=models.Index(fields=['upload_time', 'upload'], name='feedback_pl_upload__b8cc98_idx'),
+        ),
+    ]
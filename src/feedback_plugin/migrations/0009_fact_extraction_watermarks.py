@@ -0,0 +1,38 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0008_latest_server_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FactExtractionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('extractor', models.CharField(max_length=100)),
+                ('version', models.IntegerField()),
+                ('first_upload_id', models.BigIntegerField()),
+                ('last_upload_id', models.BigIntegerField()),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FactExtractorState',
+            fields=[
+                ('extractor', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.IntegerField()),
+                ('last_upload_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='factextractionrun',
+            index=models.Index(fields=['extractor', 'last_upload_id'], name='feedback_pl_extract_372075_idx'),
+        ),
+    ]
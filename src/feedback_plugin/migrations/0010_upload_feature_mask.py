@@ -0,0 +1,53 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import json
+
+
+# extractors.FEATURE_BITS at the time of this migration.
+FEATURE_BITS = {
+    'check_constraint': 1 << 0,
+    'json': 1 << 1,
+    'subquery': 1 << 2,
+    'timezone': 1 << 3,
+}
+
+
+def create_feature_masks(apps, schema_editor):
+    ComputedUploadFact = apps.get_model('feedback_plugin',
+                                        'ComputedUploadFact')
+    UploadFeatureMask = apps.get_model('feedback_plugin', 'UploadFeatureMask')
+
+    masks = []
+    facts = ComputedUploadFact.objects.filter(
+        key='features').values_list('upload_id', 'value')
+    for (upload_id, value) in facts.iterator():
+        mask = 0
+        for feature, used in json.loads(value).items():
+            if used and feature in FEATURE_BITS:
+                mask |= FEATURE_BITS[feature]
+        masks.append(UploadFeatureMask(upload_id=upload_id, mask=mask))
+        if len(masks) >= 1000:
+            UploadFeatureMask.objects.bulk_create(masks, ignore_conflicts=True)
+            masks = []
+    UploadFeatureMask.objects.bulk_create(masks, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0009_fact_extraction_watermarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadFeatureMask',
+            fields=[
+                ('upload', models.OneToOneField(db_column='upload_id', on_delete=django.db.models.deletion.PROTECT, primary_key=True, serialize=False, to='feedback_plugin.upload')),
+                ('mask', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_feature_masks,
+                             migrations.RunPython.noop),
+    ]
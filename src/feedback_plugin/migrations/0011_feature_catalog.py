@@ -0,0 +1,35 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:26
+
+from django.db import migrations, models
+
+
+# The features with a bit in the masks created by migration 0010, which keep
+# their bits.
+FEATURES = ['check_constraint', 'json', 'subquery', 'timezone']
+
+
+def create_feature_catalog(apps, schema_editor):
+    Feature = apps.get_model('feedback_plugin', 'Feature')
+    Feature.objects.bulk_create([Feature(name=name, bit=bit)
+                                 for bit, name in enumerate(FEATURES)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0010_upload_feature_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Feature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('bit', models.SmallIntegerField(null=True, unique=True)),
+                ('backfill_upload_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_feature_catalog,
+                             migrations.RunPython.noop),
+    ]
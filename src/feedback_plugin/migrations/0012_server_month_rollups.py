@@ -0,0 +1,84 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:30
+
+from collections import defaultdict
+from datetime import date, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def get_month(time):
+    time = time.astimezone(timezone.utc)
+    return date(time.year, time.month, 1)
+
+
+def create_server_month_rollups(apps, schema_editor):
+    ComputedUploadFact = apps.get_model('feedback_plugin',
+                                        'ComputedUploadFact')
+    UploadFeatureMask = apps.get_model('feedback_plugin', 'UploadFeatureMask')
+    ServerMonth = apps.get_model('feedback_plugin', 'ServerMonth')
+    ServerMonthFact = apps.get_model('feedback_plugin', 'ServerMonthFact')
+
+    # Only the facts already extracted are recorded here. The months in which
+    # servers uploaded data are recorded by etl.update_server_months, starting
+    # from the first upload.
+    masks = defaultdict(int)
+    uploads = UploadFeatureMask.objects.values_list(
+        'upload__server_id', 'upload__upload_time', 'mask')
+    for (server_id, upload_time, mask) in uploads.iterator():
+        masks[(get_month(upload_time), server_id)] |= mask
+    ServerMonth.objects.bulk_create(
+        [ServerMonth(month=month, server_id=server_id, feature_mask=mask)
+         for ((month, server_id), mask) in masks.items()],
+        batch_size=1000)
+
+    versions = set()
+    facts = ComputedUploadFact.objects.filter(
+        key='server_version').values_list('upload__server_id',
+                                          'upload__upload_time', 'value')
+    for (server_id, upload_time, value) in facts.iterator():
+        versions.add((get_month(upload_time), server_id, value))
+    ServerMonthFact.objects.bulk_create(
+        [ServerMonthFact(month=month, server_id=server_id,
+                         key='server_version', value=value)
+         for (month, server_id, value) in versions],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0011_feature_catalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServerMonthFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('key', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=100)),
+                ('server', models.ForeignKey(db_column='server_id', on_delete=django.db.models.deletion.PROTECT, to='feedback_plugin.server')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ServerMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('feature_mask', models.BigIntegerField(default=0)),
+                ('server', models.ForeignKey(db_column='server_id', on_delete=django.db.models.deletion.PROTECT, to='feedback_plugin.server')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='servermonthfact',
+            constraint=models.UniqueConstraint(fields=('key', 'month', 'value', 'server'), name='unique_server_month_fact'),
+        ),
+        migrations.AddConstraint(
+            model_name='servermonth',
+            constraint=models.UniqueConstraint(fields=('month', 'server'), name='unique_server_month'),
+        ),
+        migrations.RunPython(create_server_month_rollups,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0012_server_month_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=250)),
+                ('month', models.DateField()),
+                ('state', models.BinaryField()),
+                ('chart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='states', to='feedback_plugin.chart')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chartstate',
+            constraint=models.UniqueConstraint(fields=('chart', 'series', 'month'), name='unique_chart_state'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0013_chart_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServerBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('key', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=250)),
+                ('bitmap', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StaleServerBitmapMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='serverbitmap',
+            constraint=models.UniqueConstraint(fields=('month', 'key', 'value'), name='unique_server_bitmap'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:40
+
+from datetime import date
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_chart_values(apps, schema_editor):
+    Chart = apps.get_model('feedback_plugin', 'Chart')
+    ChartPoint = apps.get_model('feedback_plugin', 'ChartPoint')
+
+    points = []
+    for chart in Chart.objects.all():
+        for (series, values) in chart.values.items():
+            for (x, y) in zip(values['x'], values['y']):
+                # Months are labelled either YYYY-MM or YYYY-M.
+                (year, month) = x.split('-')
+                points.append(ChartPoint(chart=chart, series=series,
+                                         month=date(int(year), int(month), 1),
+                                         x=x, y=y))
+    ChartPoint.objects.bulk_create(points, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0014_server_bitmap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=250)),
+                ('month', models.DateField()),
+                ('x', models.CharField(max_length=20)),
+                ('y', models.BigIntegerField()),
+                ('chart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points', to='feedback_plugin.chart')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chartpoint',
+            constraint=models.UniqueConstraint(fields=('chart', 'series', 'month'), name='unique_chart_point'),
+        ),
+        migrations.RunPython(copy_chart_values, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='chart',
+            name='values',
+        ),
+    ]
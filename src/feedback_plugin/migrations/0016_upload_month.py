@@ -0,0 +1,47 @@
+# Generated by Django 4.1.2 on 2026-10-19 12:10
+
+from datetime import timezone
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import TruncMonth
+
+
+BATCH_SIZE = 100000
+
+
+def fill_upload_months(apps, schema_editor):
+    Upload = apps.get_model('feedback_plugin', 'Upload')
+
+    last_upload_id = Upload.objects.aggregate(id=Max('id'))['id'] or 0
+    for first in range(0, last_upload_id, BATCH_SIZE):
+        Upload.objects.filter(
+            id__gt=first, id__lte=first + BATCH_SIZE
+        ).update(
+            month=TruncMonth('upload_time', output_field=models.DateField(),
+                             tzinfo=timezone.utc))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0015_chart_point'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='month',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(fill_upload_months, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='upload',
+            name='month',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='upload',
+            index=models.Index(fields=['month', 'server_id'], name='feedback_pl_month_9fcc33_idx'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:43
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 10000
+
+SERVER_FACTS = {'country_code', 'distribution', 'distribution_family',
+                'hardware_architecture', 'operating_system'}
+UPLOAD_FACTS = {'version_major': 'server_version_major',
+                'version_minor': 'server_version_minor',
+                'version_point': 'server_version_point'}
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def create_upload_summaries(apps, schema_editor):
+    Upload = apps.get_model('feedback_plugin', 'Upload')
+    UploadSummary = apps.get_model('feedback_plugin', 'UploadSummary')
+    UploadFeatureMask = apps.get_model('feedback_plugin', 'UploadFeatureMask')
+    ComputedUploadFact = apps.get_model('feedback_plugin',
+                                        'ComputedUploadFact')
+    ComputedServerFact = apps.get_model('feedback_plugin',
+                                        'ComputedServerFact')
+
+    server_facts = defaultdict(dict)
+    for (server_id, key, value) in ComputedServerFact.objects.filter(
+            key__in=SERVER_FACTS).values_list('server_id', 'key',
+                                              'value').iterator():
+        server_facts[server_id][key] = value
+
+    last_upload_id = 0
+    while batch := list(Upload.objects.filter(
+            id__gt=last_upload_id).order_by('id').values_list(
+                'id', 'server_id', 'month')[:BATCH_SIZE]):
+        upload_ids = [upload_id for (upload_id, _, _) in batch]
+        last_upload_id = upload_ids[-1]
+
+        upload_facts = defaultdict(dict)
+        for (upload_id, key, value) in ComputedUploadFact.objects.filter(
+                upload_id__in=upload_ids,
+                key__in=UPLOAD_FACTS.values()).values_list('upload_id', 'key',
+                                                           'value'):
+            upload_facts[upload_id][key] = value
+        masks = dict(UploadFeatureMask.objects.filter(
+            upload_id__in=upload_ids).values_list('upload_id', 'mask'))
+
+        summaries = []
+        for (upload_id, server_id, month) in batch:
+            summary = UploadSummary(upload_id=upload_id, server_id=server_id,
+                                    month=month,
+                                    feature_mask=masks.get(upload_id, 0))
+            for key in SERVER_FACTS:
+                setattr(summary, key, server_facts[server_id].get(key, ''))
+            for (column, key) in UPLOAD_FACTS.items():
+                setattr(summary, column,
+                        to_int(upload_facts[upload_id].get(key)))
+            summaries.append(summary)
+        UploadSummary.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0016_upload_month'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSummary',
+            fields=[
+                ('upload', models.OneToOneField(db_column='upload_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='feedback_plugin.upload')),
+                ('month', models.DateField()),
+                ('country_code', models.CharField(blank=True, max_length=1000)),
+                ('version_major', models.IntegerField(null=True)),
+                ('version_minor', models.IntegerField(null=True)),
+                ('version_point', models.IntegerField(null=True)),
+                ('hardware_architecture', models.CharField(blank=True, max_length=1000)),
+                ('operating_system', models.CharField(blank=True, max_length=1000)),
+                ('distribution', models.CharField(blank=True, max_length=1000)),
+                ('distribution_family', models.CharField(blank=True, max_length=1000)),
+                ('feature_mask', models.BigIntegerField(default=0)),
+                ('server', models.ForeignKey(db_column='server_id', on_delete=django.db.models.deletion.PROTECT, to='feedback_plugin.server')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='uploadsummary',
+            index=models.Index(fields=['month', 'server'], name='feedback_pl_month_bc984f_idx'),
+        ),
+        migrations.RunPython(create_upload_summaries,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:47
+
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def set_computed_at(apps, schema_editor):
+    ChartMetadata = apps.get_model('feedback_plugin', 'ChartMetadata')
+    ChartMetadata.objects.update(computed_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0017_upload_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chartmetadata',
+            name='computed_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.RunPython(set_computed_at, migrations.RunPython.noop),
+    ]
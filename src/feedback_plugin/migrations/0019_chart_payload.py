@@ -0,0 +1,27 @@
+# Generated by Django 4.1.2 on 2026-10-19 11:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback_plugin', '0018_chart_computed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encoding', models.CharField(max_length=20)),
+                ('content', models.BinaryField()),
+                ('chart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payloads', to='feedback_plugin.chart')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chartpayload',
+            constraint=models.UniqueConstraint(fields=('chart', 'encoding'), name='unique_chart_payload'),
+        ),
+    ]
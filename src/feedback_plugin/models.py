@@ -14,6 +14,8 @@
    along with this program; if not, write to the Free Software
    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1335  USA
 '''
+import datetime
+
 from django.db import models
 from django_countries.fields import CountryField
 
@@ -50,8 +52,12 @@ class Server(models.Model):
 class Upload(models.Model):
     '''
       This table represents a data upload done by a particular server.
+      month is the first day of the UTC month of upload_time, it is set when
+      the upload is saved so that uploads can be grouped by month from the
+      (month, server_id) index alone.
     '''
     upload_time = models.DateTimeField()
+    month = models.DateField()
     server = models.ForeignKey(
         'Server',
         on_delete=models.PROTECT,
@@ -60,12 +66,48 @@ class Upload(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=['upload_time', 'server_id'])
+            models.Index(fields=['upload_time', 'server_id']),
+            models.Index(fields=['month', 'server_id']),
         ]
 
     def __str__(self):
         return f'{self.upload_time}, {self.server.id}'
 
+    def save(self, *args, **kwargs):
+        upload_time = self.upload_time.astimezone(datetime.timezone.utc)
+        self.month = datetime.date(upload_time.year, upload_time.month, 1)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'upload_time' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'month'}
+        super().save(*args, **kwargs)
+
+
+class LatestServerUpload(models.Model):
+    '''
+      This table tracks the most recent upload of each server. Server facts
+      are extracted from this upload only.
+    '''
+    server = models.OneToOneField(
+        'Server',
+        primary_key=True,
+        on_delete=models.PROTECT,
+        db_column='server_id'
+    )
+    upload = models.ForeignKey(
+        'Upload',
+        on_delete=models.PROTECT,
+        db_column='upload_id'
+    )
+    upload_time = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['upload_time', 'upload'])
+        ]
+
+    def __str__(self):
+        return f'{self.server_id} -> {self.upload_id}, {self.upload_time}'
+
 
 class Data(models.Model):
     '''
@@ -133,14 +175,231 @@ class ComputedServerFact(models.Model):
         return f'{self.server_id} -> {self.key} = {self.value}'
 
 
+class Feature(models.Model):
+    '''
+        This table is the catalog of the features reported by servers, as
+        feature_* keys. Features are added as they are discovered while
+        extracting facts and keep their id and bit in UploadFeatureMask.mask
+        from then on. Features discovered once all bits are taken have no bit.
+
+        Uploads with an id up to backfill_upload_id were processed before the
+        feature was discovered. Their "features" facts are extracted again by
+        etl.backfill_features, if they report the feature.
+    '''
+    name = models.CharField(max_length=100, unique=True)
+    bit = models.SmallIntegerField(unique=True, null=True)
+    backfill_upload_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.id}: {self.name} -> {self.bit}'
+
+
+class UploadFeatureMask(models.Model):
+    '''
+        This table holds the features used by each upload as a bitmask, with
+        the bits given by the Feature catalog. It holds the same information
+        as the "features" upload facts, in a form that charts can count with
+        bit operations.
+    '''
+    upload = models.OneToOneField(
+        'Upload',
+        primary_key=True,
+        on_delete=models.PROTECT,
+        db_column='upload_id'
+    )
+    mask = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.upload_id} -> {self.mask:b}'
+
+
+class UploadSummary(models.Model):
+    '''
+        This table holds one row per upload with the facts charts break
+        uploads down by as columns: the facts of the upload's server, the
+        version of the server and the features used by the upload. It is a
+        denormalized copy of ComputedServerFact, ComputedUploadFact and
+        UploadFeatureMask, so that charts aggregate a single table instead of
+        joining the facts one key at a time.
+
+        Rows are rebuilt by etl.refresh_upload_summaries whenever the facts of
+        an upload or of its server are extracted.
+    '''
+    upload = models.OneToOneField(
+        'Upload',
+        primary_key=True,
+        on_delete=models.CASCADE,
+        db_column='upload_id'
+    )
+    server = models.ForeignKey(
+        'Server',
+        on_delete=models.PROTECT,
+        db_column='server_id'
+    )
+    month = models.DateField()
+    country_code = models.CharField(max_length=1000, blank=True)
+    version_major = models.IntegerField(null=True)
+    version_minor = models.IntegerField(null=True)
+    version_point = models.IntegerField(null=True)
+    hardware_architecture = models.CharField(max_length=1000, blank=True)
+    operating_system = models.CharField(max_length=1000, blank=True)
+    distribution = models.CharField(max_length=1000, blank=True)
+    distribution_family = models.CharField(max_length=1000, blank=True)
+    feature_mask = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['month', 'server'])
+        ]
+
+    def __str__(self):
+        return f'{self.upload_id} : S{self.server_id} {self.month:%Y-%m}'
+
+
+class ServerMonth(models.Model):
+    '''
+        This table holds an entry for each month in which a server uploaded
+        data, along with the features the server used that month, as the
+        bitwise or of the masks of its uploads, see UploadFeatureMask.
+        Charts count servers from it instead of going through all uploads.
+
+        Entries are added by etl.update_server_months, the feature masks are
+        rebuilt as the feature facts of the uploads are stored, see
+        etl.refresh_server_month_feature_masks.
+    '''
+    month = models.DateField()
+    server = models.ForeignKey(
+        'Server',
+        on_delete=models.PROTECT,
+        db_column='server_id'
+    )
+    feature_mask = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'server'],
+                                    name='unique_server_month')
+        ]
+
+    def __str__(self):
+        return f'{self.month:%Y-%m}: S{self.server_id} -> {self.feature_mask:b}'
+
+
+class ServerMonthFact(models.Model):
+    '''
+        This table holds the values of the upload facts charts break servers
+        down by, for each month in which a server's uploads had them, see
+        etl.SERVER_MONTH_FACTS. The entries of a server-month are rebuilt
+        from the facts of its uploads whenever facts of these uploads are
+        stored, see etl.refresh_server_month_facts.
+    '''
+    month = models.DateField()
+    server = models.ForeignKey(
+        'Server',
+        on_delete=models.PROTECT,
+        db_column='server_id'
+    )
+    key = models.CharField(max_length=100)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'month', 'value', 'server'],
+                                    name='unique_server_month_fact')
+        ]
+
+    def __str__(self):
+        return (f'{self.month:%Y-%m}: S{self.server_id} -> '
+                f'{self.key} = {self.value}')
+
+
+class ServerBitmap(models.Model):
+    '''
+        This table indexes the servers that uploaded data in a month by the
+        values of their facts. Each entry holds the ids of the servers with
+        a fact value in a month, as a serialized
+        data_processing.bitmaps.RoaringBitmap. The entry with an empty key and
+        value holds all servers of the month.
+
+        Counting the servers with several fact values intersects their
+        bitmaps, see charts.count_servers_by_month. Entries are rebuilt a
+        month at a time by etl.update_server_bitmaps.
+    '''
+    month = models.DateField()
+    key = models.CharField(max_length=100)
+    value = models.CharField(max_length=250)
+    bitmap = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'key', 'value'],
+                                    name='unique_server_bitmap')
+        ]
+
+    def __str__(self):
+        return f'{self.month:%Y-%m}: {self.key} = {self.value}'
+
+
+class StaleServerBitmapMonth(models.Model):
+    '''
+        This table holds the months whose ServerBitmap entries may no longer
+        match the facts they were built from: the server-month rollups or the
+        server facts of servers that uploaded data in these months changed
+        after they were indexed, for instance when a feature was backfilled or
+        an extractor ran again. etl.update_server_bitmaps indexes these months
+        again and removes their entries. A month can be recorded several
+        times.
+    '''
+    month = models.DateField()
+
+    def __str__(self):
+        return f'{self.month:%Y-%m}'
+
+
+class FactExtractorState(models.Model):
+    '''
+        This table holds, for each data extractor, the version of the
+        extractor that last ran and the id of the last upload whose facts it
+        extracted (its watermark).
+    '''
+    extractor = models.CharField(max_length=100, primary_key=True)
+    version = models.IntegerField()
+    last_upload_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.extractor} v{self.version} -> {self.last_upload_id}'
+
+
+class FactExtractionRun(models.Model):
+    '''
+        This table holds the lineage of computed facts. Each entry records
+        that a version of a data extractor extracted the facts of all uploads
+        with an id in (first_upload_id, last_upload_id].
+    '''
+    extractor = models.CharField(max_length=100)
+    version = models.IntegerField()
+    first_upload_id = models.BigIntegerField()
+    last_upload_id = models.BigIntegerField()
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['extractor', 'last_upload_id'])
+        ]
+
+    def __str__(self):
+        return (f'{self.extractor} v{self.version}: '
+                f'({self.first_upload_id}, {self.last_upload_id}]')
+
+
 class Chart(models.Model):
     '''
         This table holds the pre-computed feedback plugin data used for charts
-        generation.
+        generation. The data itself is stored as ChartPoint entries.
     '''
     id = models.SlugField(max_length=100, primary_key=True)
     title = models.CharField(max_length=250)  # Pretty title
-    values = models.JSONField(default=dict, blank=True, null=False)
 
     class Meta:
         verbose_name_plural = "Feedback Plugin Chart Results"
@@ -148,8 +407,29 @@ class Chart(models.Model):
     def __str__(self):
         return self.title
 
+    @property
+    def values(self) -> dict[str, dict[str, list]]:
+        '''
+            The points of the chart as served by the REST API: the x and y
+            values of each series, in month order.
+        '''
+        result = {}
+        points = self.points.order_by('series', 'month').values_list(
+            'series', 'x', 'y')
+        for (series, x, y) in points.iterator():
+            values = result.setdefault(series, {'x': [], 'y': []})
+            values['x'].append(x)
+            values['y'].append(y)
+        return result
+
 
 class ChartMetadata(models.Model):
+    '''
+        This table holds the interval of uploads a chart was computed from,
+        and when it was last computed. computed_at changes whenever the chart
+        is saved, the REST API derives the ETag and Last-Modified of the chart
+        from it.
+    '''
     chart = models.OneToOneField(
         'Chart',
         primary_key=True,
@@ -157,11 +437,86 @@ class ChartMetadata(models.Model):
         related_name='metadata')
     computed_start_date = models.DateTimeField(blank=True, null=True)
     computed_end_date = models.DateTimeField(blank=True, null=True)
+    computed_at = models.DateTimeField(auto_now=True, null=True)
 
     def __str__(self):
         return f'{self.computed_start_date}, {self.computed_end_date}'
 
 
+class ChartState(models.Model):
+    '''
+        This table holds, for each series and month of a chart, the servers
+        counted so far as a serialized distinct counter, see
+        data_processing.distinct. Incremental chart computations merge the
+        servers of new uploads into it.
+    '''
+    chart = models.ForeignKey(
+        'Chart',
+        on_delete=models.CASCADE,
+        related_name='states')
+    series = models.CharField(max_length=250)
+    month = models.DateField()
+    state = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chart', 'series', 'month'],
+                                    name='unique_chart_state')
+        ]
+
+    def __str__(self):
+        return f'{self.chart_id}: {self.series} {self.month:%Y-%m}'
+
+
+class ChartPoint(models.Model):
+    '''
+        This table holds the value of each series of a chart for each month,
+        along with the label of the month on the x axis of the chart.
+        Computing a chart only writes the points whose value changed.
+    '''
+    chart = models.ForeignKey(
+        'Chart',
+        on_delete=models.CASCADE,
+        related_name='points')
+    series = models.CharField(max_length=250)
+    month = models.DateField()
+    x = models.CharField(max_length=20)
+    y = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chart', 'series', 'month'],
+                                    name='unique_chart_point')
+        ]
+
+    def __str__(self):
+        return f'{self.chart_id}: {self.series} {self.x} = {self.y}'
+
+
+class ChartPayload(models.Model):
+    '''
+        This table holds the response body of the REST API for a chart, once
+        for each content encoding (identity, gzip and br), rendered and
+        compressed when the chart is computed, see
+        charts.update_chart_payloads.
+    '''
+    chart = models.ForeignKey(
+        'Chart',
+        on_delete=models.CASCADE,
+        related_name='payloads')
+    encoding = models.CharField(max_length=20)
+    content = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chart', 'encoding'],
+                                    name='unique_chart_payload')
+        ]
+
+    def __str__(self):
+        return f'{self.chart_id}: {self.encoding}'
+
+
 class Config(models.Model):
     key = models.CharField(max_length=128, primary_key=True)
     value = models.CharField(max_length=1024)
@@ -128,6 +128,13 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Charts exported by compute_charts --export, for the web server to serve them
+# without going through Django.
+# It must not be under STATIC_ROOT, collectstatic --clear would empty it.
+
+CHART_EXPORT_ROOT = os.environ.get('DJANGO_CHART_EXPORT_ROOT')
+CHART_EXPORT_URL = '/charts/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
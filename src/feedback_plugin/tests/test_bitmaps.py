@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+import itertools
+import random
+
+from django.test import SimpleTestCase, TestCase
+
+from feedback_plugin.data_processing import charts, etl
+from feedback_plugin.data_processing.bitmaps import RoaringBitmap, union
+from feedback_plugin.models import (ComputedServerFact, ServerBitmap,
+                                    ServerMonth, ServerMonthFact,
+                                    StaleServerBitmapMonth, Upload)
+from feedback_plugin.tests.utils import create_test_database
+
+
+class TestRoaringBitmap(SimpleTestCase):
+    def test_set_operations(self):
+        rng = random.Random(42)
+        for _ in range(20):
+            # Ids spread over a few containers, some sparse and some dense.
+            first = {rng.randrange(1 << 18) for _ in range(rng.randrange(
+                1, 20000))}
+            second = {rng.randrange(1 << 18) for _ in range(rng.randrange(
+                1, 20000))}
+            first_bitmap = RoaringBitmap(first)
+            second_bitmap = RoaringBitmap(second)
+
+            self.assertEqual(len(first_bitmap), len(first))
+            self.assertEqual(list(first_bitmap), sorted(first))
+            self.assertEqual(list(first_bitmap | second_bitmap),
+                             sorted(first | second))
+            self.assertEqual(list(first_bitmap & second_bitmap),
+                             sorted(first & second))
+            self.assertEqual(RoaringBitmap.from_bytes(first_bitmap.to_bytes()),
+                             first_bitmap)
+
+        self.assertIn(70000, RoaringBitmap([70000]))
+        self.assertNotIn(4464, RoaringBitmap([70000]))
+        self.assertFalse(RoaringBitmap([1]) & RoaringBitmap([2]))
+        self.assertEqual(list(union([RoaringBitmap([3]), RoaringBitmap([1])])),
+                         [1, 3])
+        with self.assertRaises(ValueError):
+            RoaringBitmap([-1])
+
+    def test_size(self):
+        self.assertEqual(len(RoaringBitmap().to_bytes()), 4)
+        # Sparse containers take two bytes per id, dense ones 8 KiB.
+        self.assertEqual(len(RoaringBitmap(range(0, 1 << 16, 64)).to_bytes()),
+                         4 + 5 + 2 * 1024)
+        self.assertEqual(len(RoaringBitmap(range(1 << 17)).to_bytes()),
+                         4 + 2 * (5 + 8192))
+
+
+class TestServerBitmaps(TestCase):
+    def test_counts_match_rollups(self):
+        create_test_database()
+        etl.update_server_months()
+        etl.update_server_bitmaps()
+        self.assertTrue(ServerBitmap.objects.exists())
+
+        # Count the servers of each month, version and architecture from the
+        # rollups directly.
+        architectures = dict(ComputedServerFact.objects.filter(
+            key='hardware_architecture').values_list('server_id', 'value'))
+        months = defaultdict(set)
+        for (month, server_id) in ServerMonth.objects.values_list(
+                'month', 'server_id'):
+            months[month].add(server_id)
+        versions = defaultdict(set)
+        for (month, server_id, version) in ServerMonthFact.objects.filter(
+                key='server_version').values_list('month', 'server_id',
+                                                  'value'):
+            versions[(month, version)].add(server_id)
+
+        start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2100, 1, 1, tzinfo=timezone.utc)
+        self.assertEqual(charts.count_servers_by_month(start, end, {}),
+                         {month: len(servers)
+                          for (month, servers) in months.items()})
+
+        all_versions = sorted({version for (_, version) in versions})
+        all_architectures = sorted(set(architectures.values()))
+        self.assertTrue(all_versions and all_architectures)
+        for (version, architecture) in itertools.product(all_versions,
+                                                         all_architectures):
+            expected = {}
+            for month in months:
+                count = len([server_id
+                             for server_id in versions[(month, version)]
+                             if architectures.get(server_id) == architecture])
+                if count:
+                    expected[month] = count
+            counts = charts.count_servers_by_month(start, end, {
+                'server_version': [version],
+                'hardware_architecture': [architecture]})
+            self.assertEqual(counts, expected)
+
+        # Values of the same key are or-ed.
+        counts = charts.count_servers_by_month(
+            start, end, {'server_version': all_versions})
+        self.assertEqual(counts, {
+            month: len(set().union(*(versions[(month, version)]
+                                     for version in all_versions)))
+            for month in months})
+        self.assertEqual(charts.count_servers_by_month(
+            start, end, {'server_version': ['0.0']}), {})
+
+        # Indexing the same months again gives the same bitmaps.
+        bitmaps = set(ServerBitmap.objects.values_list('month', 'key', 'value',
+                                                       'bitmap'))
+        etl.update_server_bitmaps(months)
+        self.assertEqual(
+            set(ServerBitmap.objects.values_list('month', 'key', 'value',
+                                                 'bitmap')),
+            bitmaps)
+
+    def test_changed_facts(self):
+        create_test_database()
+        etl.update_server_months()
+        etl.update_server_bitmaps()
+        start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2100, 1, 1, tzinfo=timezone.utc)
+
+        # Facts of servers and uploads of months already indexed change, with
+        # no new upload.
+        upload = Upload.objects.order_by('upload_time').first()
+        server_months = set(ServerMonth.objects.filter(
+            server_id=upload.server_id).values_list('month', flat=True))
+        etl.store_server_facts(
+            {upload.server_id: {'hardware_architecture': 'changed'}})
+        etl.store_upload_feature_masks({upload.id: '{"changed": true}'})
+        self.assertTrue(StaleServerBitmapMonth.objects.exists())
+
+        etl.update_server_bitmaps()
+        self.assertEqual(charts.count_servers_by_month(
+            start, end, {'hardware_architecture': ['changed']}),
+            {month: 1 for month in server_months})
+        self.assertEqual(charts.count_servers_by_month(
+            start, end, {'feature': ['changed']}), {upload.month: 1})
+        self.assertFalse(StaleServerBitmapMonth.objects.exists())
+
+        # The same entries as indexing all months again.
+        bitmaps = set(ServerBitmap.objects.values_list('month', 'key', 'value',
+                                                       'bitmap'))
+        etl.update_server_bitmaps(
+            ServerMonth.objects.values_list('month', flat=True).distinct())
+        self.assertEqual(
+            set(ServerBitmap.objects.values_list('month', 'key', 'value',
+                                                 'bitmap')),
+            bitmaps)
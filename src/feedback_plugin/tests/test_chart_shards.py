@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta, timezone
+
+from django.test import SimpleTestCase, TestCase
+
+from feedback_plugin.data_processing import charts, etl
+from feedback_plugin.models import Upload
+from feedback_plugin.tests.utils import create_test_database
+
+
+class TestMonthShards(SimpleTestCase):
+    def test_shards(self):
+        start = datetime(2021, 11, 15, 12, tzinfo=timezone.utc)
+        end = datetime(2022, 3, 2, tzinfo=timezone.utc)
+
+        shards = charts.get_month_shards(start, end, 2)
+        self.assertEqual([charts.get_months(*shard) for shard in shards],
+                         [(date(2021, 11, 1), date(2021, 12, 1)),
+                          (date(2022, 1, 1), date(2022, 2, 1)),
+                          (date(2022, 3, 1), date(2022, 3, 1))])
+
+        self.assertEqual(len(charts.get_month_shards(start, end, 12)), 1)
+        self.assertEqual(len(charts.get_month_shards(start, start, 1)), 1)
+
+
+class TestShardedCharts(TestCase):
+    def test_shards_merge_exactly(self):
+        create_test_database()
+        etl.update_server_months()
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+        for callback in (charts.get_servers_by_month,
+                         charts.get_feature_servers_by_month,
+                         charts.get_version_servers_by_month,
+                         charts.get_architecture_servers_by_month):
+            expected = callback(start, end)
+            self.assertTrue(expected)
+            merged = charts.merge_servers_by_month(
+                callback(*shard)
+                for shard in charts.get_month_shards(start, end, 1))
+            self.assertEqual(
+                {series: {month: sorted(server_ids)
+                          for (month, server_ids) in months.items()}
+                 for (series, months) in merged.items()},
+                {series: {month: sorted(server_ids)
+                          for (month, server_ids) in months.items()}
+                 for (series, months) in expected.items()})
+
+    def test_since(self):
+        create_test_database()
+        etl.update_server_months()
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+        # Only the server-months with uploads after since are read.
+        last_upload = Upload.objects.order_by('-upload_time').first()
+        since = last_upload.upload_time - timedelta(seconds=1)
+        self.assertEqual(charts.get_servers_by_month(start, end, since),
+                         {'count': {last_upload.month: [
+                             last_upload.server_id]}})
+        for callback in (charts.get_feature_servers_by_month,
+                         charts.get_version_servers_by_month,
+                         charts.get_architecture_servers_by_month):
+            for months in callback(start, end, since).values():
+                self.assertEqual(months, {last_upload.month: [
+                    last_upload.server_id]})
@@ -1,9 +1,13 @@
+import gzip
 import json
 
 from django.core.management import call_command
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.utils import timezone
 
+from feedback_plugin.data_processing import charts
+from feedback_plugin.models import ChartMetadata, ChartPayload
 from .utils import create_test_database
 
 
@@ -62,6 +66,87 @@ class ChartViewTest(TestCase):
                                  "computed_end_date": "2022-03-06T19:21:42Z"
                              }})
 
+    def test_conditional_get(self):
+        c = Client()
+
+        response = c.get(reverse('server_count'))
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        # Unchanged charts are neither rendered nor sent again.
+        with self.assertNumQueries(1):
+            response = c.get(reverse('server_count'),
+                             HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        response = c.get(reverse('server_count'),
+                         HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # The chart is served from the cache of the process.
+        with self.assertNumQueries(1):
+            cached = c.get(reverse('server_count'))
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(json.loads(cached.content)['values']['count']['y'],
+                         [3, 4, 1])
+
+        # The cache is only checked against the ETag of the chart, changes
+        # are served once the chart is computed again.
+        ChartPayload.objects.filter(chart_id='server-count').update(
+            content=b'{"title": "Servers"}')
+        response = c.get(reverse('server_count'))
+        self.assertEqual(json.loads(response.content)['title'],
+                         'Server Count by Month')
+        ChartMetadata.objects.filter(chart_id='server-count').update(
+            computed_at=timezone.now())
+        response = c.get(reverse('server_count'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['title'], 'Servers')
+
+        etag = response.headers['ETag']
+        call_command('compute_charts', '--chart=server-count')
+        response = c.get(reverse('server_count'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['title'],
+                         'Server Count by Month')
+
+    def test_content_encodings(self):
+        c = Client()
+        payloads = dict(ChartPayload.objects.filter(
+            chart_id='version-breakdown').values_list('encoding', 'content'))
+        self.assertEqual(gzip.decompress(payloads['gzip']),
+                         bytes(payloads['identity']))
+
+        # Stored payloads are served as they are, the chart is not rendered.
+        with self.assertNumQueries(2):
+            response = c.get(reverse('version_breakdown'),
+                             HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.content, payloads['gzip'])
+        content = json.loads(gzip.decompress(response.content))
+        self.assertEqual(content['values']['10.4'], {'x': ['2022-1', '2022-2'],
+                                                     'y': [2, 2]})
+
+        for accept_encoding in ('', 'gzip;q=0', 'identity', 'compress'):
+            response = c.get(reverse('version_breakdown'),
+                             HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(json.loads(response.content), content)
+
+        if charts.brotli is None:
+            self.assertNotIn('br', payloads)
+        else:
+            response = c.get(reverse('version_breakdown'),
+                             HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response.headers['Content-Encoding'], 'br')
+            self.assertEqual(
+                json.loads(charts.brotli.decompress(response.content)),
+                content)
+
     def setUp(self):
         create_test_database()
         call_command('compute_charts')
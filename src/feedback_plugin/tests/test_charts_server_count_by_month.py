@@ -4,6 +4,7 @@ from datetime import datetime, timedelta, timezone
 from django.test import TestCase
 
 from feedback_plugin.data_processing.charts import compute_server_count_by_month
+from feedback_plugin.data_processing.etl import update_server_months
 from feedback_plugin.models import Server, Upload
 
 class ComputeServerCount(TestCase):
@@ -32,6 +33,7 @@ class ComputeServerCount(TestCase):
                 upload_time=times[i] + timedelta(days=random.randint(1, 5)),
                 server=server)
           u.save()
+    update_server_months()
 
     # Test with a time interval over the random value introduced above.
     self.assertEqual(compute_server_count_by_month(times[-1],
@@ -72,6 +74,7 @@ class ComputeServerCount(TestCase):
                                  minute=10, tzinfo=timezone.utc)
     Upload(upload_time=first_upload_time, server=s_edge).save()
     Upload(upload_time=second_upload_time, server=s_edge).save()
+    update_server_months()
 
 
     self.assertEqual(compute_server_count_by_month(first_upload_time,
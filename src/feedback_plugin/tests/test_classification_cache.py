@@ -0,0 +1,50 @@
+from django.test import SimpleTestCase
+
+from feedback_plugin.data_processing.extractors import (
+    ArchitectureExtractor, ServerFeatureExtractor, ServerVersionExtractor,
+    clear_classification_caches, get_classification_cache_info)
+
+
+class TestClassificationCache(SimpleTestCase):
+    def setUp(self):
+        clear_classification_caches()
+
+    def test_repeated_inputs_are_cached(self):
+        upload = {
+            'uname_machine': ['x86_64'],
+            'uname_sysname': ['Linux'],
+            'version': ['10.6.4-MariaDB'],
+            'feature_json': ['1'],
+            'feature_subquery': ['0'],
+        }
+        uploads = {1: {u_id: upload for u_id in range(10)}}
+
+        facts = ServerVersionExtractor().extract_facts(uploads)
+        self.assertEqual(facts[1][9], {'server_version_major': '10',
+                                       'server_version_minor': '6',
+                                       'server_version_point': '4'})
+        facts = ServerFeatureExtractor().extract_facts(uploads)
+        self.assertEqual(facts[1][9], {'features': '{"json": true}'})
+        for _ in range(10):
+            facts = ArchitectureExtractor().extract_facts(uploads)
+        self.assertEqual(facts[1], {'operating_system': 'Linux',
+                                    'hardware_architecture': 'x86_64'})
+
+        info = get_classification_cache_info()
+        for name in ['ArchitectureExtractor.classify',
+                     'ServerVersionExtractor.parse_version',
+                     'ServerFeatureExtractor.classify_features']:
+            self.assertEqual(info[name].misses, 1)
+            self.assertEqual(info[name].hits, 9)
+            self.assertEqual(info[name].currsize, 1)
+
+    def test_cached_results_are_not_shared(self):
+        upload = {'version': ['10.6.4-MariaDB']}
+
+        version = ServerVersionExtractor.extract_server_version(upload)
+        version['server_version_major'] = '11'
+        self.assertEqual(
+            ServerVersionExtractor.extract_server_version(upload),
+            {'server_version_major': '10',
+             'server_version_minor': '6',
+             'server_version_point': '4'})
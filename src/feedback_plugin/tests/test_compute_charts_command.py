@@ -1,14 +1,26 @@
 import copy
-from datetime import timedelta
+import gzip
+import json
+import tempfile
+from datetime import date, timedelta
 from io import StringIO
+from pathlib import Path
 
 from django.core.management import call_command
 from django.core.management.base import CommandError
 
-from django.test import TestCase
+from django.test import (TestCase, TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
 
+from feedback_plugin.data_processing import charts
+from feedback_plugin.management.commands.compute_charts import format_month
 from feedback_plugin.tests.utils import create_test_database
-from feedback_plugin.models import Upload, Chart, ChartMetadata
+from feedback_plugin.models import (Chart, ChartMetadata, ChartPayload,
+                                    ChartPoint, Data, Server, Upload)
+
+
+def get_chart_values(chart_objects):
+    return {chart.id: chart.values for chart in chart_objects}
 
 
 class ComputeChartsCommand(TestCase):
@@ -175,3 +187,181 @@ class ComputeChartsCommand(TestCase):
                                 'y': [2, 2, 1],
                             },
                          })
+
+    def test_servers_are_counted_once_per_month(self):
+        create_test_database()
+        ComputeChartsCommand.call('--recreate', '--chart=server-count')
+
+        # A server that was already counted uploads again in the same month.
+        last_upload = Upload.objects.all().order_by('-upload_time')[:1][0]
+        new_upload = copy.deepcopy(last_upload)
+        new_upload.upload_time = last_upload.upload_time + timedelta(hours=1)
+        new_upload.id = None
+        new_upload.save()
+
+        ComputeChartsCommand.call('--chart=server-count')
+
+        chart = Chart.objects.get(id='server-count')
+        self.assertEqual(chart.values,
+                         {
+                             'count': {
+                                 'x': ['2022-01', '2022-02', '2022-03'],
+                                 'y': [3, 4, 1],
+                             }
+                         })
+
+    def test_hyperloglog_counters(self):
+        create_test_database()
+        ComputeChartsCommand.call('--recreate', '--chart=version-breakdown')
+        exact_values = Chart.objects.get(id='version-breakdown').values
+
+        ComputeChartsCommand.call('--recreate', '--chart=version-breakdown',
+                                  '--distinct-counter=hll',
+                                  '--hll-error=0.05')
+        self.assertEqual(Chart.objects.get(id='version-breakdown').values,
+                         exact_values)
+
+        # States of different kinds can not be merged.
+        ComputeChartsCommand.call('--recreate', '--chart=server-count',
+                                  '--distinct-counter=hll')
+        last_upload = Upload.objects.all().order_by('-upload_time')[:1][0]
+        new_upload = copy.deepcopy(last_upload)
+        new_upload.upload_time = last_upload.upload_time + timedelta(hours=1)
+        new_upload.id = None
+        new_upload.save()
+        self.assertRaisesMessage(CommandError, 'use --recreate',
+                                 ComputeChartsCommand.call,
+                                 '--chart=server-count')
+
+    def test_tail_months(self):
+        create_test_database()
+        ComputeChartsCommand.call('--recreate')
+        chart = Chart.objects.get(id='server-count')
+        ChartPoint.objects.filter(chart=chart, x='2022-01').update(y=1000)
+
+        # A new server uploads data of February late, after the charts were
+        # computed.
+        upload = Upload.objects.filter(
+            upload_time__month=2).order_by('upload_time')[:1][0]
+        data = list(Data.objects.filter(upload=upload))
+        upload.id = None
+        upload.server = Server.objects.create()
+        upload.save()
+        for entry in data:
+            Data(upload=upload, key=entry.key, value=entry.value).save()
+
+        ComputeChartsCommand.call()
+        chart.refresh_from_db()
+        self.assertEqual(chart.values['count']['y'], [1000, 4, 1])
+
+        ComputeChartsCommand.call('--tail-months=2')
+        chart.refresh_from_db()
+        # The points of January are left as they are.
+        self.assertEqual(chart.values,
+                         {
+                             'count': {
+                                 'x': ['2022-01', '2022-02', '2022-03'],
+                                 'y': [1000, 5, 1],
+                             }
+                         })
+
+        tail_values = get_chart_values(Chart.objects.exclude(
+            id='server-count'))
+        ComputeChartsCommand.call('--recreate')
+        self.assertEqual(get_chart_values(Chart.objects.exclude(
+            id='server-count')), tail_values)
+
+        self.assertRaisesMessage(CommandError, 'can not be used with',
+                                 ComputeChartsCommand.call,
+                                 '--recreate', '--tail-months=2')
+
+    def test_only_changed_points_are_written(self):
+        create_test_database()
+        ComputeChartsCommand.call('--recreate', '--chart=server-count')
+        chart = Chart.objects.get(id='server-count')
+        march = date(2022, 3, 1)
+
+        self.assertEqual(charts.update_chart_points(
+            'server-count', {'count': {march: 1}}, format_month), 0)
+        self.assertEqual(charts.update_chart_points(
+            'server-count', {'count': {march: 2}}, format_month), 1)
+        self.assertEqual(chart.values['count']['y'], [3, 4, 2])
+
+        # Months from replace_from on without counts lose their points.
+        charts.update_chart_points('server-count', {}, format_month, march)
+        self.assertEqual(chart.values,
+                         {
+                             'count': {
+                                 'x': ['2022-01', '2022-02'],
+                                 'y': [3, 4],
+                             }
+                         })
+
+    def test_export(self):
+        create_test_database()
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        root = Path(export_dir.name)
+
+        # Charts are only exported when asked to.
+        with override_settings(CHART_EXPORT_ROOT=None):
+            with self.assertRaises(CommandError):
+                ComputeChartsCommand.call('--export')
+        with override_settings(CHART_EXPORT_ROOT=str(root)):
+            ComputeChartsCommand.call('--recreate')
+            self.assertEqual(list(root.iterdir()), [])
+            ComputeChartsCommand.call('--recreate', '--export')
+
+        manifest = json.loads((root / 'manifest.json').read_bytes())
+        self.assertEqual(set(manifest), set(Chart.objects.values_list(
+            'id', flat=True)))
+        for (chart_id, url) in manifest.items():
+            payload = bytes(ChartPayload.objects.get(
+                chart_id=chart_id, encoding='identity').content)
+            path = root / url.removeprefix('/charts/')
+            self.assertEqual(path.parent, root / chart_id)
+            self.assertEqual(path.read_bytes(), payload)
+            self.assertEqual(gzip.decompress(
+                path.with_suffix('.json.gz').read_bytes()), payload)
+        first_url = manifest['server-count']
+
+        # The previous version of a chart is kept, older ones are deleted.
+        def export_server_count(january: int) -> str:
+            ChartPoint.objects.filter(chart_id='server-count',
+                                      x='2022-01').update(y=january)
+            ComputeChartsCommand.call('--chart=server-count',
+                                      f'--export-dir={root}')
+            manifest = json.loads((root / 'manifest.json').read_bytes())
+            latest = root / manifest['server-count'].removeprefix('/charts/')
+            self.assertEqual(json.loads(latest.read_bytes())
+                             ['values']['count']['y'], [january, 4, 1])
+            return latest.name
+
+        first = first_url.rpartition('/')[2]
+        second = export_server_count(1000)
+        third = export_server_count(2000)
+        self.assertEqual(
+            sorted(path.name for path in (root / 'server-count').iterdir()),
+            sorted(f'{name}{suffix}' for name in (second, third)
+                   for suffix in ('', '.gz')))
+        self.assertNotIn(first, (second, third))
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ComputeChartsInParallel(TransactionTestCase):
+    def test_all_charts(self):
+        create_test_database()
+
+        (_, out, _) = ComputeChartsCommand.call('--recreate', workers=1)
+        expected = get_chart_values(Chart.objects.all())
+        for chart_id in expected:
+            self.assertIn(f'Chart {chart_id} computed in', out.getvalue())
+
+        (_, out, _) = ComputeChartsCommand.call('--recreate', workers=4)
+        self.assertEqual(get_chart_values(Chart.objects.all()),
+                         expected)
+        self.assertEqual(out.getvalue().count('computed in'), len(expected))
+
+        ComputeChartsCommand.call('--recreate', workers=4, shard_months=1)
+        self.assertEqual(get_chart_values(Chart.objects.all()),
+                         expected)
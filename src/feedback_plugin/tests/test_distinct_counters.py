@@ -0,0 +1,63 @@
+import math
+
+from django.test import SimpleTestCase
+
+from feedback_plugin.data_processing.distinct import (
+    ExactCounter, HyperLogLog, IncompatibleCounters, create_counter,
+    load_counter)
+
+
+class TestExactCounter(SimpleTestCase):
+    def test_merge(self):
+        counter = ExactCounter([1, 5, 9])
+        counter.merge(ExactCounter([5, 9, 1000000]))
+        self.assertEqual(counter.count(), 4)
+
+        loaded = load_counter(counter.to_bytes())
+        self.assertEqual(loaded.server_ids, {1, 5, 9, 1000000})
+
+
+class TestHyperLogLog(SimpleTestCase):
+    def assert_error(self, sketch: HyperLogLog, count: int):
+        # Estimates are within 4 standard errors of the real count.
+        error = abs(sketch.count() - count) / count
+        self.assertLess(error, 4 * sketch.standard_error())
+
+    def test_error(self):
+        for error in (0.05, 0.01):
+            sketch = create_counter('hll', error)
+            self.assertLessEqual(sketch.standard_error(), error)
+
+            sketch.add(range(100000))
+            self.assert_error(sketch, 100000)
+            # Adding the same ids again changes nothing.
+            registers = bytes(sketch.registers)
+            sketch.add(range(0, 100000, 7))
+            self.assertEqual(bytes(sketch.registers), registers)
+
+        sketch = HyperLogLog.with_error(0.01)
+        sketch.add(range(50))
+        self.assertEqual(sketch.count(), 50)
+
+    def test_merge(self):
+        first = HyperLogLog.with_error(0.02)
+        first.add(range(0, 60000))
+        second = HyperLogLog.with_error(0.02)
+        second.add(range(40000, 100000))
+        union = HyperLogLog.with_error(0.02)
+        union.add(range(100000))
+
+        first.merge(load_counter(second.to_bytes()))
+        self.assertEqual(first.registers, union.registers)
+        self.assert_error(first, 100000)
+
+        with self.assertRaises(IncompatibleCounters):
+            first.merge(HyperLogLog.with_error(0.05))
+        with self.assertRaises(IncompatibleCounters):
+            first.merge(ExactCounter())
+
+    def test_precision(self):
+        self.assertEqual(HyperLogLog.with_error(0.01).precision,
+                         math.ceil(math.log2(1.04 ** 2 * 10000)))
+        with self.assertRaises(ValueError):
+            HyperLogLog(30)
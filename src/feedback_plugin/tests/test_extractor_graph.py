@@ -0,0 +1,189 @@
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase, TestCase
+
+from feedback_plugin.data_processing import etl
+from feedback_plugin.data_processing.extractors import (
+    ArchitectureExtractor, CyclicExtractorDependency, DataColumns,
+    DistributionFamilyExtractor, ExtractorGraph, FactColumns,
+    ServerFeatureExtractor, ServerVersionExtractor,
+    ServerVersionSeriesExtractor, UploadFactExtractor,
+    add_upload_fact_columns)
+from feedback_plugin.models import (ComputedServerFact, ComputedUploadFact,
+                                    Data, FactExtractorState, Server, Upload)
+
+
+class FactExtractor(UploadFactExtractor):
+    def __init__(self, required, provided):
+        self.required = set(required)
+        self.provided = set(provided)
+
+    def get_required_keys(self):
+        return set()
+
+    def get_required_facts(self):
+        return self.required
+
+    def get_provided_facts(self):
+        return self.provided
+
+    def extract_facts(self, data_dict):
+        return {}
+
+
+class TestExtractorGraph(SimpleTestCase):
+    def test_levels(self):
+        version = ServerVersionExtractor()
+        series = ServerVersionSeriesExtractor()
+        features = ServerFeatureExtractor()
+        graph = ExtractorGraph([series, features, version])
+
+        self.assertEqual(graph.levels, [[features, version], [series]])
+        self.assertEqual(graph.dependencies[series], [version, version])
+        self.assertEqual(graph.get_external_facts(), set())
+        self.assertEqual(ExtractorGraph([series]).get_external_facts(),
+                         {'server_version_major', 'server_version_minor'})
+
+    def test_cycle(self):
+        with self.assertRaises(CyclicExtractorDependency):
+            ExtractorGraph([FactExtractor(['a'], ['b']),
+                            FactExtractor(['b'], ['a'])])
+
+    def test_derived_facts(self):
+        data = {
+            1: {
+                1: {'version': ['10.6.1-MariaDB']},
+                2: {'version': ['bogus']},
+            },
+            2: {
+                3: {'version': ['11.0.2-MariaDB']},
+            },
+        }
+        facts = ExtractorGraph(
+            [ServerVersionSeriesExtractor(), ServerVersionExtractor()]
+        ).extract_upload_facts(data)
+
+        self.assertEqual(facts[1][1]['server_version'], '10.6')
+        self.assertNotIn(2, facts[1])
+        self.assertEqual(facts[2][3]['server_version'], '11.0')
+        self.assertEqual(facts[2][3]['server_version_point'], '2')
+
+
+class TestDependentExtraction(TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.server.save()
+        self.upload = Upload(
+            upload_time=datetime(2023, 1, 1, tzinfo=timezone.utc),
+            server=self.server)
+        self.upload.save()
+        Data(key='VERSION', value='10.11.2-MariaDB', upload=self.upload).save()
+        Data(key='Uname_sysname', value='Linux', upload=self.upload).save()
+        Data(key='Uname_distribution', value='Ubuntu 22.04',
+             upload=self.upload).save()
+
+    def test_stored_facts(self):
+        # Derived facts are computed from the stored facts of the extractors
+        # they depend on when those do not run.
+        etl.extract_upload_facts_by_upload_id(0, self.upload.id,
+                                              [ServerVersionExtractor()])
+        etl.extract_upload_facts_by_upload_id(
+            0, self.upload.id, [ServerVersionSeriesExtractor()])
+        self.assertEqual(ComputedUploadFact.objects.get(
+                            key='server_version').value, '10.11')
+
+        etl.extract_server_facts_by_upload_id(0, self.upload.id,
+                                              [ArchitectureExtractor()])
+        etl.extract_server_facts_by_upload_id(
+            0, self.upload.id, [DistributionFamilyExtractor()])
+        self.assertEqual(ComputedServerFact.objects.get(
+                            key='distribution_family').value, 'Debian')
+
+    def test_pending_dependents(self):
+        version = ServerVersionExtractor()
+        series = ServerVersionSeriesExtractor()
+        FactExtractorState(extractor='ServerVersionExtractor',
+                           version=version.version,
+                           last_upload_id=self.upload.id).save()
+        FactExtractorState(extractor='ServerVersionSeriesExtractor',
+                           version=series.version,
+                           last_upload_id=self.upload.id).save()
+        self.assertEqual(etl.get_pending_fact_extractions([version, series]),
+                         [])
+
+        # Recomputing the facts of an extractor recomputes the facts derived
+        # from them as well.
+        FactExtractorState.objects.filter(
+            extractor='ServerVersionExtractor').update(version=0)
+        self.assertEqual(etl.get_pending_fact_extractions([version, series]),
+                         [(0, self.upload.id, [version, series])])
+
+    def test_new_dependent(self):
+        # A new extractor computes its facts from the stored facts of the
+        # extractors it depends on, which are not computed again.
+        version = ServerVersionExtractor()
+        series = ServerVersionSeriesExtractor()
+        etl.extract_upload_facts_by_upload_id(0, self.upload.id, [version])
+        etl.finish_fact_extraction([version], 0, self.upload.id,
+                                   datetime.now(timezone.utc))
+        self.assertEqual(etl.get_pending_fact_extractions([version, series]),
+                         [(0, self.upload.id, [series])])
+
+        # New uploads are processed by both extractors together.
+        upload = Upload(upload_time=datetime(2023, 1, 2, tzinfo=timezone.utc),
+                        server=self.server)
+        upload.save()
+        self.assertEqual(etl.get_pending_fact_extractions([version, series]),
+                         [(0, self.upload.id, [series]),
+                          (self.upload.id, upload.id, [version, series])])
+
+
+class TestFactColumns(SimpleTestCase):
+    def test_same_facts_as_dict(self):
+        columns = DataColumns.empty()
+        rows = [
+            (1, 1, 'version', '10.6.1-MariaDB'),
+            (1, 1, 'feature_json', '0'),
+            (1, 1, 'feature_json', '3'),
+            (1, 1, 'feature_subquery', '1'),
+            (1, 2, 'version', 'bogus'),
+            (1, 2, 'version', '10.5.2-MariaDB'),
+            (1, 2, 'feature_timezone', '0'),
+            (2, 3, 'version', '11.0.2-MariaDB'),
+            (2, 3, 'version', 'bogus'),
+            (2, 3, 'feature_check_constraint', '4'),
+        ]
+        for row in rows:
+            columns.extend(DataColumns(*([value] for value in row)))
+
+        extractors = [ServerVersionSeriesExtractor(), ServerVersionExtractor(),
+                      ServerFeatureExtractor()]
+        for extractor in extractors[1:]:
+            self.assertEqual(
+                set(zip(*extractor.extract_fact_columns(columns))),
+                set(zip(*FactColumns.from_facts(
+                    extractor.extract_facts(columns.to_data_dict())))))
+
+        # Extractors without column support go through extract_facts.
+        with_versions = add_upload_fact_columns(
+            columns, extractors[1].extract_fact_columns(columns))
+        self.assertEqual(
+            set(zip(*extractors[0].extract_fact_columns(with_versions))),
+            set(zip(*FactColumns.from_facts(extractors[0].extract_facts(
+                with_versions.to_data_dict())))))
+
+        # Dependent extractors without column support get the facts of the
+        # column extractors.
+        facts = set(zip(*ExtractorGraph(extractors).extract_upload_fact_columns(
+            columns)))
+        self.assertEqual(
+            facts,
+            set(zip(*FactColumns.from_facts(
+                ExtractorGraph(extractors).extract_upload_facts(
+                    columns.to_data_dict())))))
+        self.assertIn((1, 'server_version', '10.6'), facts)
+        self.assertIn((2, 'server_version', '10.5'), facts)
+        self.assertIn((1, 'features', '{"json": true, "subquery": true}'),
+                      facts)
+        self.assertNotIn(3, [upload_id for (upload_id, key, _) in facts
+                             if key.startswith('server_version')])
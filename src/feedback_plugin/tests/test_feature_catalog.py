@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+
+from django.test import TestCase
+
+from feedback_plugin.data_processing import etl
+from feedback_plugin.data_processing.extractors import ServerFeatureExtractor
+from feedback_plugin.models import (ComputedUploadFact, Data, Feature, Server,
+                                    ServerMonth, Upload, UploadFeatureMask)
+
+
+class TestFeatureCatalog(TestCase):
+    def setUp(self):
+        self.time = datetime(year=2022, month=3, day=1, tzinfo=timezone.utc)
+        self.server = Server()
+        self.server.save()
+
+    def add_upload(self, rows: list[tuple[str, str]]) -> Upload:
+        upload = Upload(upload_time=self.time, server=self.server)
+        upload.save()
+        for (key, value) in rows:
+            Data(key=key, value=value, upload=upload).save()
+        return upload
+
+    def get_features(self, upload: Upload) -> str:
+        return ComputedUploadFact.objects.get(upload=upload,
+                                              key='features').value
+
+    def test_stable_bits(self):
+        # Migrations catalog the features that had a bit before.
+        self.assertEqual(etl.get_feature_bits([]),
+                         {'check_constraint': 0, 'json': 1, 'subquery': 2,
+                          'timezone': 3})
+
+        bits = etl.get_feature_bits(['xml', 'gis', 'json'])
+        self.assertEqual(bits['gis'], 4)
+        self.assertEqual(bits['xml'], 5)
+        self.assertEqual(etl.get_feature_bits(['xml']), bits)
+
+        for i in range(etl.MAX_FEATURE_BITS):
+            etl.get_feature_bits([f'feature{i}'])
+        with self.assertLogs('etl', 'WARNING'):
+            self.assertIsNone(etl.get_feature_bits(['last'])['last'])
+        self.assertEqual(etl.get_feature_mask('{"last": true, "gis": true}',
+                                              etl.get_feature_bits([])),
+                         1 << 4)
+
+    def test_discovery_and_backfill(self):
+        old = self.add_upload([('FEATURE_JSON', '1'), ('FEATURE_XML', '2')])
+        unused = self.add_upload([('FEATURE_JSON', '1'), ('FEATURE_XML', '0')])
+
+        # Uploads processed before a feature is known miss it.
+        ComputedUploadFact(upload=old, key='features',
+                           value='{"json": true}').save()
+        etl.store_upload_feature_masks({old.id: '{"json": true}'})
+
+        new = self.add_upload([('FEATURE_XML', '1'), ('Feature_Gis', '1')])
+        etl.extract_upload_facts_by_upload_id(unused.id, new.id,
+                                              [ServerFeatureExtractor()])
+        self.assertEqual(self.get_features(new),
+                         '{"gis": true, "xml": true}')
+        self.assertEqual(Feature.objects.get(name='xml').backfill_upload_id,
+                         new.id - 1)
+
+        etl.backfill_features(batch_size=1)
+        self.assertFalse(Feature.objects.filter(
+            backfill_upload_id__gt=0).exists())
+        self.assertEqual(self.get_features(old),
+                         '{"json": true, "xml": true}')
+        bits = etl.get_feature_bits([])
+        self.assertEqual(UploadFeatureMask.objects.get(upload=old).mask,
+                         (1 << bits['json']) | (1 << bits['xml']))
+        self.assertEqual(self.get_features(unused), '{"json": true}')
+
+    def test_features_extracted_again(self):
+        upload = self.add_upload([('FEATURE_JSON', '1')])
+        other = self.add_upload([('FEATURE_XML', '1')])
+        etl.extract_upload_facts_by_upload_id(0, other.id,
+                                              [ServerFeatureExtractor()])
+        bits = etl.get_feature_bits([])
+        self.assertEqual(ServerMonth.objects.get().feature_mask,
+                         (1 << bits['json']) | (1 << bits['xml']))
+
+        # Uploads no longer using features lose their masks, the server-month
+        # keeps only the features its uploads still use.
+        Data.objects.filter(upload=upload).update(value='0')
+        etl.extract_upload_facts_by_upload_id(0, other.id,
+                                              [ServerFeatureExtractor()])
+        self.assertFalse(UploadFeatureMask.objects.filter(
+            upload=upload, mask__gt=0).exists())
+        self.assertEqual(ServerMonth.objects.get().feature_mask,
+                         1 << bits['xml'])
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.test import TestCase
+
+from feedback_plugin.data_processing import etl
+from feedback_plugin.data_processing.extractors import (ServerFeatureExtractor,
+                                                        ServerVersionExtractor)
+from feedback_plugin.models import (ComputedUploadFact, Data,
+                                    FactExtractionRun, FactExtractorState,
+                                    Server, Upload)
+
+
+class TestIncrementalExtraction(TestCase):
+    @staticmethod
+    def create_upload(server, time, version):
+        upload = Upload(upload_time=time, server=server)
+        upload.save()
+        Data(key='VERSION', value=version, upload=upload).save()
+        Data(key='FEATURE_JSON', value='1', upload=upload).save()
+        return upload
+
+    @staticmethod
+    def run_pending(data_extractors):
+        pending = etl.get_pending_fact_extractions(data_extractors)
+        for (first_upload_id, last_upload_id, extractors) in pending:
+            start_time = datetime.now(timezone.utc)
+            etl.extract_upload_facts_by_upload_id(first_upload_id,
+                                                  last_upload_id,
+                                                  extractors)
+            etl.finish_fact_extraction(extractors, first_upload_id,
+                                       last_upload_id, start_time)
+        return pending
+
+    def test_watermarks(self):
+        data_extractors = [ServerVersionExtractor(), ServerFeatureExtractor()]
+        self.assertEqual(etl.get_pending_fact_extractions(data_extractors), [])
+
+        time = datetime(year=2022, month=3, day=1, tzinfo=timezone.utc)
+        s1 = Server()
+        s1.save()
+        u1 = self.create_upload(s1, time, '10.6.1-MariaDB')
+        u2 = self.create_upload(s1, time + timedelta(days=1), '10.6.2-MariaDB')
+
+        pending = self.run_pending(data_extractors)
+        self.assertEqual(pending, [(0, u2.id, data_extractors)])
+        self.assertEqual(ComputedUploadFact.objects.count(), 8)
+        self.assertEqual(FactExtractorState.objects.get(
+                            extractor='ServerVersionExtractor').last_upload_id,
+                         u2.id)
+
+        # Nothing new to process.
+        self.assertEqual(etl.get_pending_fact_extractions(data_extractors), [])
+
+        # Only the new upload is processed.
+        u3 = self.create_upload(s1, time - timedelta(days=1), '10.5.9-MariaDB')
+        pending = self.run_pending(data_extractors)
+        self.assertEqual(pending, [(u2.id, u3.id, data_extractors)])
+        self.assertEqual(ComputedUploadFact.objects.count(), 12)
+        self.assertEqual(ComputedUploadFact.objects.get(
+                            upload=u3, key='server_version_minor').value,
+                         '5')
+
+        # A version bump recomputes only that extractor's facts, for all
+        # uploads.
+        with mock.patch.object(ServerVersionExtractor, 'version', 2):
+            pending = etl.get_pending_fact_extractions(data_extractors)
+            self.assertEqual(len(pending), 1)
+            self.assertEqual(pending[0][:2], (0, u3.id))
+            self.assertIsInstance(pending[0][2][0], ServerVersionExtractor)
+            self.assertEqual(len(pending[0][2]), 1)
+
+            self.run_pending(data_extractors)
+            self.assertEqual(etl.get_pending_fact_extractions(data_extractors),
+                             [])
+
+        state = FactExtractorState.objects.get(
+            extractor='ServerVersionExtractor')
+        self.assertEqual(state.version, 2)
+        self.assertEqual(state.last_upload_id, u3.id)
+        self.assertEqual(ComputedUploadFact.objects.count(), 12)
+        self.assertEqual(
+            FactExtractionRun.objects.filter(
+                extractor='ServerVersionExtractor').count(), 3)
+        self.assertEqual(
+            FactExtractionRun.objects.filter(
+                extractor='ServerFeatureExtractor').count(), 2)
+        self.assertEqual(u1.computeduploadfact_set.count(), 4)
+
+    def test_facts_replaced(self):
+        data_extractors = [ServerVersionExtractor()]
+        time = datetime(year=2022, month=3, day=1, tzinfo=timezone.utc)
+        s1 = Server()
+        s1.save()
+        u1 = self.create_upload(s1, time, '10.6.1-MariaDB')
+        u2 = self.create_upload(s1, time + timedelta(days=1), '10.6.2-MariaDB')
+        self.run_pending(data_extractors)
+        self.assertEqual(ComputedUploadFact.objects.count(), 6)
+
+        # Facts the new version of an extractor does not return are removed.
+        Data.objects.filter(upload=u2).update(value='unknown')
+        with mock.patch.object(ServerVersionExtractor, 'version', 2):
+            self.run_pending(data_extractors)
+        self.assertEqual(u1.computeduploadfact_set.count(), 3)
+        self.assertFalse(u2.computeduploadfact_set.exists())
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Max
+from django.test import TestCase
+
+from feedback_plugin.data_processing.etl import update_latest_server_uploads
+from feedback_plugin.models import LatestServerUpload, Server, Upload
+from feedback_plugin.tests.utils import create_test_database
+
+
+class TestLatestServerUpload(TestCase):
+    def test_process_raw_data(self):
+        create_test_database()
+
+        self.assertEqual(LatestServerUpload.objects.count(),
+                         Server.objects.count())
+
+        for server in Server.objects.annotate(last=Max('upload__upload_time')):
+            latest = LatestServerUpload.objects.get(server=server)
+            self.assertEqual(latest.upload_time, server.last)
+            self.assertEqual(latest.upload.upload_time, server.last)
+
+    def test_only_newer_uploads_replace_entry(self):
+        time = datetime(year=2022, month=3, day=1, tzinfo=timezone.utc)
+
+        s1 = Server()
+        s1.save()
+        u1 = Upload(upload_time=time, server=s1)
+        u2 = Upload(upload_time=time + timedelta(days=1), server=s1)
+        u3 = Upload(upload_time=time + timedelta(days=1), server=s1)
+        u1.save()
+        u2.save()
+        u3.save()
+
+        # Newest interval first, older intervals must not override it.
+        update_latest_server_uploads(time + timedelta(days=1),
+                                     time + timedelta(days=2))
+        update_latest_server_uploads(time, time + timedelta(days=1),
+                                     end_inclusive=False)
+
+        latest = LatestServerUpload.objects.get(server=s1)
+        # Ties on upload_time are broken by the upload id.
+        self.assertEqual(latest.upload_id, u3.id)
+        self.assertEqual(latest.upload_time, u3.upload_time)
+
+        u4 = Upload(upload_time=time + timedelta(days=3), server=s1)
+        u4.save()
+        update_latest_server_uploads(time, time + timedelta(days=3))
+
+        latest.refresh_from_db()
+        self.assertEqual(latest.upload_id, u4.id)
@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.db import connection
+from django.db.models.constants import OnConflict
+from django.db.models.query import QuerySet
+from django.test import TestCase
+
+from feedback_plugin.data_processing import charts, distinct, etl
+from feedback_plugin.models import Chart, ChartMetadata, Server, Upload
+
+
+class TestMySQLUpserts(TestCase):
+    '''
+        MySQL and MariaDB upsert on any unique key and refuse a conflict
+        target. The upserts are checked against these features of the
+        backend, without running them.
+    '''
+    def setUp(self):
+        self.server = Server()
+        self.server.save()
+        self.upload = Upload(
+            upload_time=datetime(2022, 3, 1, tzinfo=timezone.utc),
+            server=self.server)
+        self.upload.save()
+
+    def assert_upserts_on_mysql(self, call, *args):
+        batched_insert = QuerySet._batched_insert
+
+        # Other inserts run as they are.
+        def insert_unless_upsert(queryset, *args, **kwargs):
+            if kwargs['on_conflict'] == OnConflict.UPDATE:
+                return []
+            return batched_insert(queryset, *args, **kwargs)
+
+        with mock.patch.object(connection.features,
+                               'supports_update_conflicts_with_target',
+                               False), \
+             mock.patch.object(QuerySet, '_batched_insert', autospec=True,
+                               side_effect=insert_unless_upsert) as insert:
+            call(*args)
+        upserts = [kwargs for (_, kwargs) in insert.call_args_list
+                   if kwargs['on_conflict'] == OnConflict.UPDATE]
+        self.assertTrue(upserts)
+        for kwargs in upserts:
+            self.assertFalse(kwargs['unique_fields'])
+
+    def test_upload_feature_masks(self):
+        self.assert_upserts_on_mysql(
+            etl.store_upload_feature_masks,
+            {self.upload.id: '{"json": true}'})
+
+    def test_upload_summaries(self):
+        self.assert_upserts_on_mysql(
+            etl.refresh_upload_summaries,
+            Upload.objects.filter(id=self.upload.id))
+
+    def test_chart_states(self):
+        Chart(id='server-count').save()
+        self.assert_upserts_on_mysql(
+            charts.update_chart_states, 'server-count',
+            {'count': {self.upload.month: [self.server.id]}},
+            lambda: distinct.create_counter('exact', 0.01))
+
+    def test_chart_points(self):
+        Chart(id='server-count').save()
+        self.assert_upserts_on_mysql(
+            charts.update_chart_points, 'server-count',
+            {'count': {self.upload.month: 1}},
+            lambda month: f'{month:%Y-%m}')
+
+    def test_chart_payloads(self):
+        chart = Chart(id='server-count')
+        chart.save()
+        metadata = ChartMetadata(chart=chart)
+        metadata.save()
+        self.assert_upserts_on_mysql(charts.update_chart_payloads, metadata)
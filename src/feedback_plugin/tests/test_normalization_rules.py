@@ -0,0 +1,51 @@
+from django.test import SimpleTestCase
+
+from feedback_plugin.data_processing.extractors import ArchitectureExtractor
+from feedback_plugin.data_processing.rules import KeywordRuleTable, RuleTable
+
+
+class TestNormalizationRules(SimpleTestCase):
+    def test_rule_table(self):
+        table = RuleTable([('^(x(86_)?64)|(amd64)$', 'x86_64'),
+                           ('^[ix][3-6]*86$', 'x86')])
+
+        self.assertEqual(table.lookup('x86_64'), 'x86_64')
+        self.assertEqual(table.lookup('amd64'), 'x86_64')
+        self.assertEqual(table.lookup('x86'), 'x86')
+        self.assertEqual(table.lookup('i686'), 'x86')
+        # Patterns are only matched at the start of the string.
+        self.assertEqual(table.lookup('my_amd64'), None)
+        self.assertEqual(table.lookup('sparc', 'sparc'), 'sparc')
+
+    def test_keyword_rule_table(self):
+        table = KeywordRuleTable([(['centos', 'rhel'], 'CentOS'),
+                                  (['redhat', 'rhel'], 'Red Hat')])
+
+        self.assertEqual(table.lookup('redhat rhel 8'), 'CentOS')
+        self.assertEqual(table.lookup('os: redhat 7'), 'Red Hat')
+        self.assertEqual(table.lookup('multi\nline centos'), 'CentOS')
+        self.assertEqual(table.lookup('debian'), None)
+
+    def test_architecture_extractor(self):
+        upload = {
+            'uname_machine': ['AArch64'],
+            'uname_sysname': ['Linux'],
+            'uname_version': ['#1 SMP Mon Sep 14 14:37:00 UTC 2020'],
+            'uname_distribution': ['centos: CentOS Linux release 8.2.2004'],
+        }
+
+        self.assertEqual(
+            ArchitectureExtractor.extract_machine_architecture(upload),
+            'ARM 64Bit')
+        self.assertEqual(ArchitectureExtractor.extract_operating_system(upload),
+                         'Linux')
+        self.assertEqual(ArchitectureExtractor.extract_distribution(upload),
+                         'CentOS')
+        self.assertEqual(ArchitectureExtractor.extract_os_version(upload),
+                         '8.2.2004')
+
+        upload['uname_distribution'] = ['debian: Debian GNU/Linux 11']
+        self.assertEqual(ArchitectureExtractor.extract_os_version(upload),
+                         'unknown')
+        self.assertEqual(ArchitectureExtractor.extract_distribution(upload),
+                         'debian: debian gnu/linux 11')
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+from django.test import SimpleTestCase, TestCase
+
+from feedback_plugin.data_processing import etl
+from feedback_plugin.management.commands._parallel_fact_extractor import (
+    ProcessPoolFactExtractor)
+from feedback_plugin.data_processing.extractors import ArchitectureExtractor
+from feedback_plugin.models import (ComputedServerFact, Data,
+                                    LatestServerUpload, Server, Upload)
+
+
+def extract(name: str, slice_size: int | None = None):
+    if name == 'bad':
+        raise ValueError(name)
+
+
+class TestPartitionBoundaries(TestCase):
+    def test_balanced_by_upload_count(self):
+        time = datetime(year=2022, month=3, day=1, tzinfo=timezone.utc)
+        server = Server()
+        server.save()
+        # A heavy day followed by two light ones.
+        times = [time] * 5 + [time + timedelta(days=1),
+                              time + timedelta(days=2)]
+        uploads = []
+        for upload_time in times:
+            upload = Upload(upload_time=upload_time, server=server)
+            upload.save()
+            uploads.append(upload)
+
+        all_uploads = etl.upload_id_filter('id', 0, uploads[-1].id)
+        self.assertEqual(
+            etl.get_partition_boundaries(all_uploads, 'id', 3),
+            [uploads[3].id, uploads[6].id])
+        # Partitions are made smaller to have enough of them.
+        self.assertEqual(
+            len(etl.get_partition_boundaries(all_uploads, 'id', 10, 7)), 6)
+
+        # Uploads with the same time are never split.
+        self.assertEqual(
+            etl.get_partition_boundaries(all_uploads, 'upload_time', 2),
+            [time + timedelta(days=1)])
+        self.assertEqual(
+            etl.get_partition_boundaries(etl.upload_id_filter('id', 0, 0),
+                                         'id', 2),
+            [])
+
+
+class TestServerShards(TestCase):
+    def test_shards_are_disjoint(self):
+        time = datetime(year=2022, month=3, day=1, tzinfo=timezone.utc)
+        for i in range(7):
+            server = Server()
+            server.save()
+            for day, sysname in enumerate(['Windows', 'Linux']):
+                upload = Upload(upload_time=time + timedelta(days=day),
+                                server=server)
+                upload.save()
+                Data(key='Uname_sysname', value=sysname, upload=upload).save()
+
+        end = time + timedelta(days=2)
+        for shard_index in range(3):
+            etl.extract_server_facts(time, end, [ArchitectureExtractor()],
+                                     shard=(shard_index, 3))
+            server_ids = set(ComputedServerFact.objects.values_list(
+                'server_id', flat=True))
+            self.assertEqual(
+                server_ids,
+                {server.id for server in Server.objects.all()
+                 if server.id % 3 <= shard_index})
+            self.assertEqual(set(LatestServerUpload.objects.values_list(
+                                'server_id', flat=True)),
+                             server_ids)
+
+        self.assertEqual(
+            set(ComputedServerFact.objects.filter(
+                key='operating_system').values_list('value', flat=True)),
+            {'Linux'})
+
+
+class TestRunPartitions(SimpleTestCase):
+    def test_retries(self):
+        stdout = StringIO()
+        stderr = StringIO()
+        command = ProcessPoolFactExtractor(extract, extract, [],
+                                           stdout=stdout, stderr=stderr)
+        command._workers = 2
+        command._retries = 2
+        command._callback_kwargs = {}
+
+        failed = command.run_partitions(extract, [('first', ('good',)),
+                                                  ('second', ('bad',)),
+                                                  ('third', ('good',))])
+
+        self.assertEqual(failed, {1})
+        self.assertIn('Partition 1/3 first done', stdout.getvalue())
+        self.assertIn('Partition 3/3 third done', stdout.getvalue())
+        self.assertEqual(stderr.getvalue().count('Partition 2/3 second failed'),
+                         3)
+        self.assertIn('attempt 3/3', stderr.getvalue())
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from feedback_plugin.data_processing import etl
+from feedback_plugin.data_processing.extractors import (ArchitectureExtractor,
+                                                        ServerVersionExtractor)
+from feedback_plugin.data_processing.pipeline import run_pipeline
+from feedback_plugin.models import (ComputedServerFact, ComputedUploadFact,
+                                    Data, Server, Upload)
+
+
+class TestPipeline(SimpleTestCase):
+    def test_stages(self):
+        stored = []
+        in_flight = 0
+        max_in_flight = 0
+        lock = Lock()
+
+        def fetch(value):
+            nonlocal in_flight, max_in_flight
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            return value * 2
+
+        def store(value):
+            nonlocal in_flight
+            with lock:
+                in_flight -= 1
+            stored.append(value)
+
+        timings = run_pipeline(range(100), fetch, lambda value: value + 1,
+                               store, queue_size=2)
+
+        self.assertEqual(stored, [value * 2 + 1 for value in range(100)])
+        self.assertEqual(set(timings), {'fetch', 'extract', 'store'})
+        # At most queue_size slices wait in each queue, plus one slice in
+        # every stage.
+        self.assertLessEqual(max_in_flight, 7)
+
+    def test_errors(self):
+        def fail(value):
+            if value == 5:
+                raise ValueError(value)
+            return value
+
+        for stage in range(3):
+            stages = [lambda value: value, lambda value: value,
+                      lambda value: None]
+            stages[stage] = fail
+            with self.assertRaises(ValueError):
+                run_pipeline(range(100), *stages)
+
+
+class TestSlicedExtraction(TransactionTestCase):
+    def test_same_facts(self):
+        time = datetime(year=2022, month=3, day=1, tzinfo=timezone.utc)
+        for i in range(10):
+            server = Server()
+            server.save()
+            for day in range(3):
+                upload = Upload(upload_time=time + timedelta(days=day),
+                                server=server)
+                upload.save()
+                Data(key='VERSION', value=f'10.{day}.{i}-MariaDB',
+                     upload=upload).save()
+                Data(key='Uname_sysname', value='Linux', upload=upload).save()
+
+        end = time + timedelta(days=3)
+        etl.extract_upload_facts(time, end, [ServerVersionExtractor()])
+        etl.extract_server_facts(time, end, [ArchitectureExtractor()])
+        upload_facts = set(ComputedUploadFact.objects.values_list(
+            'upload_id', 'key', 'value'))
+        server_facts = set(ComputedServerFact.objects.values_list(
+            'server_id', 'key', 'value'))
+
+        ComputedUploadFact.objects.all().delete()
+        ComputedServerFact.objects.all().delete()
+        timings = etl.extract_upload_facts(time, end,
+                                           [ServerVersionExtractor()],
+                                           slice_size=4)
+        self.assertEqual(set(timings),
+                         {'fetch', 'extract', 'store', 'summaries'})
+        etl.extract_server_facts(time, end, [ArchitectureExtractor()],
+                                 slice_size=3)
+
+        self.assertEqual(len(upload_facts), 30 * 3)
+        self.assertEqual(set(ComputedUploadFact.objects.values_list(
+                            'upload_id', 'key', 'value')),
+                         upload_facts)
+        self.assertEqual(set(ComputedServerFact.objects.values_list(
+                            'server_id', 'key', 'value')),
+                         server_facts)
@@ -4,9 +4,12 @@ from zoneinfo import ZoneInfo
 
 from django.test import TransactionTestCase
 
-from feedback_plugin.data_processing.etl import process_raw_data
+from feedback_plugin.data_processing.etl import (get_feature_bits,
+                                                 get_feature_mask,
+                                                 process_raw_data)
 from feedback_plugin.models import (RawData, Server, Upload, Data,
-                                    ComputedServerFact, ComputedUploadFact)
+                                    ComputedServerFact, ComputedUploadFact,
+                                    UploadFeatureMask)
 from feedback_plugin.tests.utils import load_test_data, create_test_database
 
 class ProcessRawData(TransactionTestCase):
@@ -77,5 +80,13 @@ class TestLoadFixtures(TransactionTestCase):
 
     self.assertEqual(Upload.objects.all().count(), 8)
     self.assertEqual(Server.objects.all().count(), 5)
-    self.assertEqual(ComputedServerFact.objects.all().count(), 36)
-    self.assertEqual(ComputedUploadFact.objects.all().count(), 31)
+    self.assertEqual(ComputedServerFact.objects.all().count(), 37)
+    self.assertEqual(ComputedUploadFact.objects.all().count(), 39)
+
+    # Feature masks hold the same features as the "features" facts.
+    features = ComputedUploadFact.objects.filter(key='features')
+    self.assertEqual(UploadFeatureMask.objects.count(), features.count())
+    feature_bits = get_feature_bits([])
+    for fact in features:
+      self.assertEqual(UploadFeatureMask.objects.get(upload=fact.upload).mask,
+                       get_feature_mask(fact.value, feature_bits))
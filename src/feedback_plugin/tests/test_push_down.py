@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+import unittest
+
+from django.db import connection
+from django.test import TestCase
+
+from feedback_plugin.data_processing import etl
+from feedback_plugin.data_processing.extractors import (
+    ServerFeatureExtractor, ServerVersionExtractor,
+    ServerVersionSeriesExtractor)
+from feedback_plugin.models import ComputedUploadFact, Data, Server, Upload
+from feedback_plugin.tests.utils import create_test_database
+
+
+@unittest.skipUnless(connection.vendor == 'mysql',
+                     'Push-down queries use MariaDB functions')
+class TestPushDown(TestCase):
+    def get_facts(self):
+        return set(ComputedUploadFact.objects.values_list('upload_id', 'key',
+                                                          'value'))
+
+    def assert_same_facts(self, data_extractors):
+        start = datetime(year=2000, month=1, day=1, tzinfo=timezone.utc)
+        end = datetime(year=2100, month=1, day=1, tzinfo=timezone.utc)
+
+        ComputedUploadFact.objects.all().delete()
+        etl.extract_upload_facts(start, end, data_extractors)
+        python_facts = self.get_facts()
+
+        ComputedUploadFact.objects.all().delete()
+        timings = etl.extract_upload_facts(start, end, data_extractors,
+                                           push_down=True)
+        self.assertIn('push down', timings)
+        self.assertEqual(self.get_facts(), python_facts)
+        return python_facts
+
+    def test_with_dataset(self):
+        create_test_database()
+        facts = self.assert_same_facts([ServerVersionExtractor(),
+                                        ServerFeatureExtractor()])
+        self.assertEqual(len(facts), 31)
+
+    def test_edge_cases(self):
+        time = datetime(year=2022, month=3, day=1, tzinfo=timezone.utc)
+        server = Server()
+        server.save()
+        uploads = [
+            [('VERSION', '10.6.1-MariaDB'), ('VERSION', '10.11.2-MariaDB')],
+            [('VERSION', '10.6.1-MariaDB'), ('VERSION', 'bogus')],
+            [('VERSION', '10\n6\n1-MariaDB')],
+            [('version', '11.0.0\n-MariaDB'), ('FEATURE_JSON', '0'),
+             ('FEATURE_TIMEZONE', '0')],
+            [('FEATURE_SUBQUERY', '3'), ('FEATURE_JSON', '0'),
+             ('FEATURE_CHECK_CONSTRAINT', '1'), ('feature_json', '2'),
+             ('FEATURE_UNKNOWN', '1')],
+            [('FEATURE_JSON', '0 ')],
+        ]
+        for i, rows in enumerate(uploads):
+            upload = Upload(upload_time=time + timedelta(hours=i),
+                            server=server)
+            upload.save()
+            for (key, value) in rows:
+                Data(key=key, value=value, upload=upload).save()
+
+        self.assert_same_facts([ServerVersionExtractor(),
+                                ServerFeatureExtractor()])
+
+    def test_dependent_extractors(self):
+        create_test_database()
+        ComputedUploadFact.objects.all().delete()
+        # Extractors that depend on other facts run in Python, after the
+        # facts they depend on were computed inside the database.
+        remaining = etl.push_down_upload_facts(
+            'SELECT id FROM feedback_plugin_upload', {},
+            [ServerVersionSeriesExtractor(), ServerVersionExtractor()])
+        self.assertEqual([type(extractor) for extractor in remaining],
+                         [ServerVersionSeriesExtractor])
+
+        self.assert_same_facts([ServerVersionSeriesExtractor(),
+                                ServerVersionExtractor()])
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from .utils import create_test_database
+
+
+class ServerCubeViewTest(TestCase):
+    def get_rows(self, **params):
+        response = Client().get(reverse('server_cube'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['rows']
+
+    def test_group_by(self):
+        # Without dimensions, the servers of each month are counted.
+        self.assertEqual(self.get_rows(), [
+            {'month': '2022-01', 'count': 3},
+            {'month': '2022-02', 'count': 4},
+            {'month': '2022-03', 'count': 1},
+        ])
+        self.assertEqual(self.get_rows(start='2022-02', end='2022-02'),
+                         [{'month': '2022-02', 'count': 4}])
+
+        # The counts by version match the version breakdown chart.
+        self.assertEqual(self.get_rows(group_by='server_version'), [
+            {'month': '2022-01', 'server_version': '10.3', 'count': 1},
+            {'month': '2022-01', 'server_version': '10.4', 'count': 2},
+            {'month': '2022-02', 'server_version': '10.1', 'count': 1},
+            {'month': '2022-02', 'server_version': '10.3', 'count': 1},
+            {'month': '2022-02', 'server_version': '10.4', 'count': 2},
+            {'month': '2022-03', 'server_version': '10.3', 'count': 1},
+        ])
+
+    def test_filters(self):
+        self.assertEqual(
+            self.get_rows(group_by=['hardware_architecture'],
+                          server_version=['10.1', '10.3'], start='2022-02'), [
+                {'month': '2022-02', 'hardware_architecture': 'x86_64',
+                 'count': 2},
+                {'month': '2022-03', 'hardware_architecture': 'x86_64',
+                 'count': 1},
+            ])
+        self.assertEqual(self.get_rows(server_version='0.0'), [])
+
+    def test_bad_requests(self):
+        c = Client()
+        for params in ({'group_by': 'uid'}, {'uptime': '1'},
+                       {'start': '2022'},
+                       {'group_by': ['server_version', 'server_version']}):
+            response = c.get(reverse('server_cube'), params)
+            self.assertEqual(response.status_code, 400)
+
+    def setUp(self):
+        create_test_database()
+        call_command('compute_charts')
@@ -0,0 +1,81 @@
+from datetime import date, datetime, timedelta, timezone
+
+from django.test import TestCase
+
+from feedback_plugin.data_processing import etl
+from feedback_plugin.data_processing.extractors import (
+    ServerFeatureExtractor, ServerVersionExtractor,
+    ServerVersionSeriesExtractor)
+from feedback_plugin.models import (Data, Server, ServerMonth, ServerMonthFact,
+                                    Upload)
+
+
+class TestServerMonths(TestCase):
+    def add_upload(self, server: Server, time: datetime,
+                   rows: list[tuple[str, str]]) -> Upload:
+        upload = Upload(upload_time=time, server=server)
+        upload.save()
+        for (key, value) in rows:
+            Data(key=key, value=value, upload=upload).save()
+        return upload
+
+    def test_rollup(self):
+        server = Server()
+        server.save()
+        january = datetime(2022, 1, 31, 23, tzinfo=timezone.utc)
+        february = datetime(2022, 2, 1, 1, tzinfo=timezone.utc)
+        self.add_upload(server, january, [('VERSION', '10.6.1-MariaDB'),
+                                          ('FEATURE_JSON', '1')])
+        self.add_upload(server, january, [('VERSION', '10.11.2-MariaDB'),
+                                          ('FEATURE_XML', '1')])
+        last = self.add_upload(server, february,
+                               [('VERSION', '10.11.2-MariaDB')])
+
+        etl.update_server_months(batch_size=2)
+        etl.update_server_months()
+        self.assertEqual(
+            list(ServerMonth.objects.order_by('month').values_list(
+                'month', 'feature_mask')),
+            [(date(2022, 1, 1), 0), (date(2022, 2, 1), 0)])
+
+        extractors = [ServerVersionExtractor(), ServerVersionSeriesExtractor(),
+                      ServerFeatureExtractor()]
+        for _ in range(2):
+            etl.extract_upload_facts_by_upload_id(0, last.id, extractors)
+
+        bits = etl.get_feature_bits([])
+        self.assertEqual(ServerMonth.objects.get(month=date(2022, 1, 1))
+                         .feature_mask,
+                         (1 << bits['json']) | (1 << bits['xml']))
+        self.assertEqual(
+            sorted(ServerMonthFact.objects.values_list('month', 'key',
+                                                       'value')),
+            [(date(2022, 1, 1), 'server_version', '10.11'),
+             (date(2022, 1, 1), 'server_version', '10.6'),
+             (date(2022, 2, 1), 'server_version', '10.11')])
+
+        # Facts extracted again replace the values of their server-months.
+        Data.objects.filter(upload=last, key='VERSION').update(
+            value='11.0.2-MariaDB')
+        etl.extract_upload_facts_by_upload_id(last.id - 1, last.id,
+                                              extractors)
+        self.assertEqual(
+            sorted(ServerMonthFact.objects.values_list('month', 'key',
+                                                       'value')),
+            [(date(2022, 1, 1), 'server_version', '10.11'),
+             (date(2022, 1, 1), 'server_version', '10.6'),
+             (date(2022, 2, 1), 'server_version', '11.0')])
+
+    def test_upload_month(self):
+        server = Server()
+        server.save()
+        # Months are UTC months.
+        upload = self.add_upload(
+            server,
+            datetime(2022, 2, 1, 1, tzinfo=timezone(timedelta(hours=2))), [])
+        self.assertEqual(upload.month, date(2022, 1, 1))
+
+        upload.upload_time = datetime(2022, 3, 5, tzinfo=timezone.utc)
+        upload.save(update_fields=['upload_time'])
+        upload.refresh_from_db()
+        self.assertEqual(upload.month, date(2022, 3, 1))
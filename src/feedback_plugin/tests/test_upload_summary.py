@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+from django.test import TestCase
+
+from feedback_plugin.data_processing import etl
+from feedback_plugin.data_processing.extractors import (
+    AllServerFactExtractor, ArchitectureExtractor)
+from feedback_plugin.models import (ComputedServerFact, ComputedUploadFact,
+                                    Upload, UploadFeatureMask, UploadSummary)
+from feedback_plugin.tests.utils import create_test_database
+
+
+class TestUploadSummary(TestCase):
+    def get_expected_summaries(self):
+        expected = {}
+        for upload in Upload.objects.all():
+            server_facts = dict(ComputedServerFact.objects.filter(
+                server_id=upload.server_id).values_list('key', 'value'))
+            upload_facts = dict(ComputedUploadFact.objects.filter(
+                upload=upload).values_list('key', 'value'))
+            mask = UploadFeatureMask.objects.filter(upload=upload).first()
+
+            def to_int(value):
+                return None if value is None else int(value)
+
+            expected[upload.id] = (
+                upload.server_id, upload.month,
+                server_facts.get('country_code', ''),
+                to_int(upload_facts.get('server_version_major')),
+                to_int(upload_facts.get('server_version_minor')),
+                to_int(upload_facts.get('server_version_point')),
+                server_facts.get('hardware_architecture', ''),
+                server_facts.get('operating_system', ''),
+                server_facts.get('distribution', ''),
+                server_facts.get('distribution_family', ''),
+                mask.mask if mask else 0)
+        return expected
+
+    def get_summaries(self):
+        return {row[0]: row[1:] for row in UploadSummary.objects.values_list(
+            'upload_id', 'server_id', 'month', 'country_code',
+            'version_major', 'version_minor', 'version_point',
+            'hardware_architecture', 'operating_system', 'distribution',
+            'distribution_family', 'feature_mask')}
+
+    def test_summaries_follow_facts(self):
+        create_test_database()
+        summaries = self.get_summaries()
+        self.assertEqual(len(summaries), Upload.objects.count())
+        self.assertEqual(summaries, self.get_expected_summaries())
+        self.assertTrue(any(row[3] is not None for row in summaries.values()))
+
+        # Extracting the facts of a server again refreshes the summaries of
+        # all of its uploads.
+        ComputedServerFact.objects.filter(
+            key='hardware_architecture').update(value='changed')
+        start = datetime(year=2021, month=1, day=1, tzinfo=timezone.utc)
+        end = datetime(year=2023, month=1, day=1, tzinfo=timezone.utc)
+        etl.refresh_upload_summaries(Upload.objects.all())
+        self.assertEqual(
+            set(UploadSummary.objects.exclude(hardware_architecture='')
+                .values_list('hardware_architecture', flat=True)),
+            {'changed'})
+
+        etl.extract_server_facts(start, end, [ArchitectureExtractor()])
+        self.assertEqual(self.get_summaries(), self.get_expected_summaries())
+        self.assertNotIn('changed', set(UploadSummary.objects.values_list(
+            'hardware_architecture', flat=True)))
+
+        UploadSummary.objects.all().delete()
+        etl.extract_server_facts(start, end, [AllServerFactExtractor()])
+        self.assertEqual(self.get_summaries(), self.get_expected_summaries())
@@ -31,6 +31,8 @@ urlpatterns = [
      path('rest/v1/charts/feature-count/',
           views.ChartView.as_view(chart_id='feature-count')),
      path('rest/v1/charts/os/', views.ChartView.as_view(chart_id='os')),
+     path('rest/v1/servers/', views.ServerCubeView.as_view(),
+          name='server_cube'),
      path('rest/v1/post', views.file_post, name='post'),
      path('rest/v1/file-post/', views.file_post, name='file_post'),
      path('rest/v1/file-post-protected/',
@@ -24,12 +24,16 @@ from django.http.response import (HttpResponse, HttpResponseNotAllowed,
                                   HttpResponseForbidden)
 from django.contrib.gis.geoip2 import GeoIP2, GeoIP2Exception
 from django.utils import timezone
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 
 from geoip2.errors import GeoIP2Error
 
-from .models import Chart, Config, RawData
+from .data_processing import charts
+from .models import ChartMetadata, ChartPayload, Config, RawData
 from .forms import UploadFileForm
 
 
@@ -37,27 +41,136 @@ logger = logging.getLogger('views')
 
 
 # Class based view to return chart data as a JSON response, based on chart ID.
+#
+# Responses carry an ETag and a Last-Modified date derived from when the chart
+# was last computed, requests with a matching If-None-Match or
+# If-Modified-Since get a 304 response. The response bodies are rendered and
+# compressed by compute_charts, see ChartPayload, the view picks the one
+# matching the Accept-Encoding of the request. Each worker process keeps the
+# payloads of the charts it served in _chart_payloads, along with their ETag,
+# and loads them again only once the chart was computed again. Serving a chart
+# then costs a single lookup of its metadata.
 class ChartView(View):
     chart_id = None
 
     def get(self, request, *args, **kwargs):
         try:
-            chart = Chart.objects.select_related(
-                'metadata'
+            metadata = ChartMetadata.objects.select_related(
+                'chart'
             ).get(
-                id=self.chart_id
+                chart_id=self.chart_id
             )
-        except Chart.DoesNotExist:
+        except ChartMetadata.DoesNotExist:
             return JsonResponse({})  # No data
 
-        metadata = chart.metadata
+        computed_at = metadata.computed_at.timestamp()
+        # All encodings of a chart share a weak ETag.
+        etag = f'W/"{self.chart_id}-{computed_at:.6f}"'
+
+        response = HttpResponse(content_type='application/json')
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(computed_at)
+        # Clients revalidate the chart on each use, which is cheap.
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept-Encoding'])
+
+        conditional_response = get_conditional_response(
+            request, etag=etag, last_modified=int(computed_at),
+            response=response)
+        if conditional_response is not response:
+            return conditional_response
+
+        cached = _chart_payloads.get(self.chart_id)
+        if cached is None or cached[0] != etag:
+            cached = (etag, self.load_payloads(metadata))
+            _chart_payloads[self.chart_id] = cached
+        payloads = cached[1]
+
+        accepted = get_accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding = next((encoding for encoding in ('br', 'gzip')
+                         if encoding in accepted and encoding in payloads),
+                        'identity')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.content = payloads[encoding]
+        return response
+
+    @staticmethod
+    def load_payloads(metadata: ChartMetadata) -> dict[str, bytes]:
+        payloads = {encoding: bytes(content)
+                    for (encoding, content) in ChartPayload.objects.filter(
+                        chart_id=metadata.chart_id
+                    ).values_list('encoding', 'content')}
+        if 'identity' not in payloads:
+            # Charts computed before payloads were stored.
+            payloads = charts.compress_payloads(charts.render_chart(metadata))
+        return payloads
+
+
+# The payloads of each chart served by this process, by chart id, as
+# (ETag, payloads by encoding) tuples.
+_chart_payloads: dict[str, tuple[str, dict[str, bytes]]] = {}
+
+
+def get_accepted_encodings(accept_encoding: str) -> set[str]:
+    # Content codings of an Accept-Encoding header, without those refused
+    # with q=0. A wildcard accepts all of them.
+    accepted = set()
+    for coding in accept_encoding.split(','):
+        (coding, *params) = [part.strip() for part in coding.split(';')]
+        refused = False
+        for param in params:
+            (name, _, value) = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    refused = float(value) == 0
+                except ValueError:
+                    refused = True
+        if coding and not refused:
+            accepted.add(coding.lower())
+    if '*' in accepted:
+        accepted |= {'br', 'gzip'}
+    return accepted
+
+
+# Counts the servers of each month grouped by and filtered on their facts,
+# from the pre-aggregated server bitmaps. For example
+# ?group_by=server_version&hardware_architecture=x86_64&start=2022-01 counts the
+# x86_64 servers of each version for each month since January 2022. Filters
+# given more than once accept any of their values.
+class ServerCubeView(View):
+    def get(self, request, *args, **kwargs):
+        months = {}
+        for param in ('start', 'end'):
+            if param not in request.GET:
+                months[param] = None
+                continue
+            try:
+                months[param] = datetime.datetime.strptime(
+                    request.GET[param], '%Y-%m').date()
+            except ValueError:
+                return HttpResponseBadRequest(f'{param} must be YYYY-MM')
+
+        group_by = request.GET.getlist('group_by')
+        filters = {key: request.GET.getlist(key) for key in request.GET
+                   if key not in ('start', 'end', 'group_by')}
+        unknown = (set(group_by) | set(filters)) - charts.CUBE_DIMENSIONS
+        if unknown:
+            return HttpResponseBadRequest(
+                f'Unknown dimensions: {", ".join(sorted(unknown))}')
+        if len(set(group_by)) != len(group_by):
+            return HttpResponseBadRequest('Dimensions can be grouped by once')
+
+        rows = charts.query_server_cube(months['start'], months['end'],
+                                        group_by, filters)
         return JsonResponse({
-            'title': chart.title,
-            'values': chart.values,
-            'metadata': {
-                'computed_start_date': metadata.computed_start_date,
-                'computed_end_date': metadata.computed_end_date,
-            }
+            'group_by': group_by,
+            'filters': filters,
+            'rows': [{'month': f'{month:%Y-%m}',
+                      **dict(zip(group_by, values)),
+                      'count': count}
+                     for (month, values, count) in rows],
         })
 
 